@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class _Column:
+    """
+    A growable, typed NumPy array with amortised O(1) appends.
+    """
+
+    def __init__(self, dtype, fill, capacity=16):
+        self._data = np.full(capacity, fill, dtype=dtype)
+        self._fill = fill
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value):
+        if self._size == len(self._data):
+            self._grow(self._size + 1)
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        end = self._size + len(values)
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._size:end] = values
+        self._size = end
+
+    def view(self):
+        return self._data[:self._size]
+
+    def _grow(self, minimum):
+        capacity = max(minimum, 2 * len(self._data))
+        data = np.full(capacity, self._fill, dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+
+class _Interned:
+    """
+    A table mapping a small set of distinct values (node types, relations) to integer codes.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        # Keyed on the type too, as members of str enums compare equal across enums
+        key = (type(value), value)
+        code = self._codes.get(key)
+        if code is None:
+            code = len(self.values)
+            self._codes[key] = code
+            self.values.append(value)
+        return code
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import tempfile
+import weakref
+
+import appdirs
+import numpy as np
+
+
+# Default size bound of a DiskCache, in bytes
+DEFAULT_CACHE_SIZE = 512 * 2**20
+
+# Fingerprints of the models seen so far, dropped with their models
+_fingerprints = weakref.WeakKeyDictionary()
+
+
+def default_cache_dir(name):
+    """
+    Get the directory of a named cache under the user's argflow cache directory.
+
+    name            - name of the cache, e.g. 'actmax'.
+    """
+    return os.path.join(appdirs.user_cache_dir('argflow', 'argflow'), name)
+
+
+def model_fingerprint(model):
+    """
+    Get a hash identifying a Keras model by its architecture (including layer names) and
+    weights, stable across processes. Hashing the weights of a large model takes a while,
+    so the fingerprint is computed once per model. Models trained or given new weights in
+    place keep their fingerprint until invalidate_fingerprint is called.
+
+    model           - a Keras model.
+    """
+    try:
+        return _fingerprints[model]
+    except KeyError:
+        pass
+    # The model's own name is left out, as Keras numbers unnamed models per process
+    config = dict(model.get_config(), name=None)
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8'))
+    for weights in model.get_weights():
+        weights = np.ascontiguousarray(weights)
+        digest.update(f'{weights.dtype.str}{weights.shape}'.encode('utf-8'))
+        digest.update(weights.tobytes())
+    _fingerprints[model] = digest.hexdigest()
+    return _fingerprints[model]
+
+
+def invalidate_fingerprint(model):
+    """
+    Forget the fingerprint of a model, e.g. after training it, so cached results of its
+    old weights aren't reused.
+
+    model           - a Keras model.
+    """
+    _fingerprints.pop(model, None)
+
+
+class DiskCache:
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        """
+        A size-bounded cache of byte strings on disk, shared between processes.
+        Entries are files named after a hash of their key. Reads refresh an entry's
+        modification time, and the least recently used entries are evicted once the
+        cache outgrows max_size.
+
+        directory       - the directory holding the cache. Created if needed.
+        max_size        - the size bound of the cache, in bytes.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        # Size of the cache as last scanned, plus what this process added since
+        self._size = None
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def get(self, key, default=None):
+        """
+        Get the bytes stored under a key, or default if there are none.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return default
+        return data
+
+    def put(self, key, data):
+        """
+        Store bytes under a key, evicting least recently used entries if needed.
+        """
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write under a temporary name first so readers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_size:
+            self._evict()
+
+    def size(self):
+        """
+        Get the total size of the cached entries, in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _entries(self):
+        """
+        Generate (modification time, size, path) for every entry.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for group in os.scandir(self.directory):
+            if not group.is_dir():
+                continue
+            for entry in os.scandir(group.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            self._remove(path)
+            size -= entry_size
+        self._size = size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -17,3 +17,29 @@ class Chi(ABC):
         model       - the model in question.
         """
         pass
+
+    def generate_many(self, x, nodes, model):
+        """
+        Generate payloads for many nodes of the same input at once.
+        Returns a list of Payloads, in the order of nodes.
+
+        Override this when the payloads of several nodes are cheaper to produce together.
+
+        x           - the input in question.
+        nodes       - a sequence of nodes.
+        model       - the model in question.
+        """
+        return [self.generate(x, node, model) for node in nodes]
+
+    def generate_batch(self, xs, nodes, model):
+        """
+        Generate payloads for the nodes of many inputs at once.
+        Returns a list with a list of Payloads per input, in the order of xs and nodes.
+
+        Override this when work can be shared between inputs.
+
+        xs          - a sequence of inputs.
+        nodes       - a sequence with a sequence of nodes per input.
+        model       - the model in question.
+        """
+        return [self.generate_many(x, x_nodes, model) for x, x_nodes in zip(xs, nodes)]
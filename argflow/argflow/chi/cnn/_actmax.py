@@ -1,13 +1,21 @@
 from ..chi import Chi
+from ...cache import DiskCache, default_cache_dir, model_fingerprint
 from ...gaf import Payload, PayloadType
 
+import io
 import keras
+from collections import defaultdict
 import numpy as np
 import tensorflow as tf
 from matplotlib import pyplot as plt
 from tf_keras_vis.activation_maximization import ActivationMaximization
 from tf_keras_vis.utils.callbacks import Print
 from tf_keras_vis.utils import find_layer
+from PIL import Image
+
+
+# Bump when the optimisation changes, so stale cached visualisations are not reused
+_CACHE_VERSION = 1
 
 
 def generate_model_modifier(layer_name):
@@ -27,32 +35,118 @@ def generate_loss(filter_idx):
     return real_loss
 
 
+def generate_batch_loss(filter_indices):
+    def real_loss(model_output):
+        # Sample i of the batch maximises filter filter_indices[i]
+        mask = tf.one_hot(filter_indices, model_output.shape[-1], dtype=model_output.dtype)
+        mask = tf.reshape(mask, [len(filter_indices)] + [1] * (len(model_output.shape) - 2) + [-1])
+        return tf.reduce_sum(model_output * mask, axis=-1)
+
+    return real_loss
+
+
 class ActMax(Chi):
 
-    def __init__(self):
+    def __init__(self, cache=False, batch_size=32):
+        """
+        Visualises the filters of convolutional layers by activation maximisation.
+
+        The visualisation of a filter only depends on the model, the layer and the filter,
+        not on the input being explained, so results can be kept in a disk cache shared by
+        every process (e.g. portal explanation generator runs).
+
+        cache           - True for the default cache (in the user's cache directory),
+                          a DiskCache to use instead, or False not to cache.
+        batch_size      - the largest number of filters of a layer optimised together.
+        """
         super().__init__()
+        if cache is True:
+            cache = DiskCache(default_cache_dir('actmax'))
+        self.cache = cache or None
+        self.batch_size = batch_size
 
     def generate(self, x, node, model):
-        img_dims = (x.shape[2], x.shape[1])
-        if 'layer' in node and 'filter_idx' in node:
-            print(node['layer'], node['filter_idx'])
-            actmax = self._make_actmax(
+        return self.generate_many(x, [node], model)[0]
+
+    def generate_many(self, x, nodes, model):
+        """
+        Generate payloads for many nodes at once. The filters of each layer are visualised
+        together, in batches of batch_size, by a single activation maximisation.
+        """
+        payloads = [None] * len(nodes)
+        by_layer = defaultdict(list)
+        for i, node in enumerate(nodes):
+            if 'layer' in node and 'filter_idx' in node:
+                by_layer[node['layer']].append(i)
+            else:
+                payloads[i] = Payload(None, None)
+        for layer_name, indices in by_layer.items():
+            images = self._cached_actmaxes(
                 x,
                 model,
-                node['layer'],
-                node['filter_idx']
+                layer_name,
+                [nodes[i]['filter_idx'] for i in indices]
             )
-            return Payload(actmax, PayloadType.IMAGE)
-        return Payload(None, None)
+            for i, image in zip(indices, images):
+                payloads[i] = Payload(image, PayloadType.IMAGE)
+        return payloads
+
+    def precompute(self, model, layer_name, filter_indices=None):
+        """
+        Fill the cache with the visualisations of filters of a layer ahead of time.
+        Returns the number of visualisations computed (cached filters are skipped).
+
+        model           - the model in question.
+        layer_name      - the name of the layer.
+        filter_indices  - the filters to visualise. Defaults to every filter of the layer.
+        """
+        if self.cache is None:
+            raise ValueError('precompute needs ActMax to have a cache')
+        if filter_indices is None:
+            filter_indices = range(model.get_layer(name=layer_name).output.shape[-1])
+        fingerprint = model_fingerprint(model)
+        missing = [filter_idx for filter_idx in filter_indices
+                   if self._cache_key(fingerprint, layer_name, filter_idx) not in self.cache]
+        self._cached_actmaxes(None, model, layer_name, missing)
+        return len(missing)
+
+    def _cache_key(self, fingerprint, layer_name, filter_idx):
+        return f'actmax/v{_CACHE_VERSION}/{fingerprint}/{layer_name}/{int(filter_idx)}'
+
+    def _cached_actmaxes(self, img_array, model, layer_name, filter_indices):
+        images = {}
+        if self.cache is not None:
+            fingerprint = model_fingerprint(model)
+            for filter_idx in set(filter_indices):
+                data = self.cache.get(self._cache_key(fingerprint, layer_name, filter_idx))
+                if data is not None:
+                    images[filter_idx] = Image.open(io.BytesIO(data))
+                    images[filter_idx].load()
+        missing = [filter_idx for filter_idx in dict.fromkeys(filter_indices)
+                   if filter_idx not in images]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for filter_idx, image in zip(batch, self._make_actmaxes(img_array, model, layer_name, batch)):
+                images[filter_idx] = image
+                if self.cache is not None:
+                    # PNG keeps cached visualisations lossless
+                    buffer = io.BytesIO()
+                    image.save(buffer, format='PNG')
+                    self.cache.put(self._cache_key(fingerprint, layer_name, filter_idx),
+                                   buffer.getvalue())
+        return [images[filter_idx] for filter_idx in filter_indices]
 
-    def _make_actmax(self, img_array, model, layer_name, filter_idx, add_text=False):
-        layer_idx = model.get_layer(name=layer_name)
+    def _make_actmaxes(self, img_array, model, layer_name, filter_indices):
         model_modifier = generate_model_modifier(layer_name)
-        loss = generate_loss(filter_idx)
+        loss = generate_batch_loss(filter_indices)
         activation_maximization = ActivationMaximization(model, model_modifier, clone=True)
+        # One seed per filter, drawn like tf-keras-vis does for a single one
+        seed_input = tf.random.uniform(
+            (len(filter_indices),) + tuple(model.input_shape[1:]), 0, 255)
 
-        # Generate max activation
-        activation = activation_maximization(loss, callbacks=[Print(interval=50)])
-        image = activation[0].astype(np.uint8)
-        image = keras.preprocessing.image.array_to_img(image)
-        return image
+        # Generate max activations
+        activations = activation_maximization(loss, seed_input=seed_input,
+                                              callbacks=[Print(interval=50)])
+        # Newer tf-keras-vis versions return tensors
+        activations = np.asarray(activations).astype(np.uint8)
+        return [keras.preprocessing.image.array_to_img(activation) for activation in activations]
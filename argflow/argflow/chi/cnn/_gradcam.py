@@ -1,66 +1,172 @@
 from ..chi import Chi
 from ...gaf import Payload, PayloadType
+from ...submodels import truncated_model
 
-import keras
+import hashlib
+import matplotlib
 import numpy as np
+from collections import defaultdict
+from functools import lru_cache
 import tensorflow as tf
 
 from matplotlib import cm
+from PIL import Image
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(name):
+    """
+    Get a matplotlib colormap as a read-only (256, 3) uint8 table of RGB colours.
+    """
+    if hasattr(matplotlib, 'colormaps'):
+        colormap = matplotlib.colormaps[name]
+    else:
+        # matplotlib < 3.5
+        colormap = cm.get_cmap(name)
+    lut = np.round(colormap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def _resize_bilinear(stack, height, width):
+    """
+    Resize a (n, h, w) stack of float32 maps to (n, height, width) with bilinear
+    interpolation, sampling at pixel centres like PIL.
+    """
+    def axis_weights(size_in, size_out):
+        src = (np.arange(size_out, dtype=np.float32) + 0.5) * (size_in / size_out) - 0.5
+        src = np.clip(src, 0, size_in - 1)
+        lower = np.floor(src).astype(np.intp)
+        upper = np.minimum(lower + 1, size_in - 1)
+        return lower, upper, (src - lower).astype(np.float32)
+
+    top, bottom, dy = axis_weights(stack.shape[1], height)
+    left, right, dx = axis_weights(stack.shape[2], width)
+    rows = stack[:, top] * (1 - dy)[:, None] + stack[:, bottom] * dy[:, None]
+    return rows[:, :, left] * (1 - dx) + rows[:, :, right] * dx
 
 
 class GradCAM(Chi):
 
-    def __init__(self):
+    def __init__(self, colormap='jet', alpha=0.6):
+        """
+        Visualises filters as their activation heatmap superimposed on the input.
+
+        colormap        - name of the matplotlib colormap used to colorize heatmaps.
+        alpha           - weight of the colorized heatmap when added to the input.
+        """
         super().__init__()
+        self.colormap = colormap
+        self.alpha = alpha
+        # Activations of the last input seen, per (model, layer)
+        self._input_digest = None
+        self._activations = {}
 
     def generate(self, x, node, model):
+        return self.generate_many(x, [node], model)[0]
+
+    def generate_many(self, x, nodes, model):
+        """
+        Generate payloads for many nodes at once. Each layer is evaluated once per input,
+        and the heatmaps of all requested filters of a layer are computed together.
+        """
         img_dims = (x.shape[2], x.shape[1])
-        if 'layer' in node and 'filter_idx' in node:
-            print(node['layer'], node['filter_idx'])
-            heatmap = self._make_gradcam_heatmap(
+        payloads = [None] * len(nodes)
+        by_layer = defaultdict(list)
+        for i, node in enumerate(nodes):
+            if 'layer' in node and 'filter_idx' in node:
+                by_layer[node['layer']].append(i)
+            else:
+                payloads[i] = Payload(None, None)
+        for layer_name, indices in by_layer.items():
+            heatmaps = self._make_gradcam_heatmaps(
                 x,
                 model,
-                node['layer'],
-                node['filter_idx']
+                layer_name,
+                [nodes[i]['filter_idx'] for i in indices]
             )
-            return Payload(self._render_heatmap(x, heatmap, img_dims), PayloadType.IMAGE)
-        return Payload(None, None)
+            for i, image in zip(indices, self._render_heatmaps(x, heatmaps, img_dims)):
+                payloads[i] = Payload(image, PayloadType.IMAGE)
+        return payloads
+
+    def generate_batch(self, xs, nodes, model):
+        """
+        Generate payloads for the nodes of many inputs. Each layer is evaluated once for
+        the whole batch, then the heatmaps of every input are rendered from its activations.
+        Each input holds one sample, e.g. of shape (1, height, width, channels).
+        """
+        layer_names = {node['layer'] for x_nodes in nodes for node in x_nodes
+                       if 'layer' in node and 'filter_idx' in node}
+        batch = np.concatenate([np.asarray(x) for x in xs])
+        activations = {layer_name: truncated_model(model, layer_name)(batch).numpy()
+                       for layer_name in layer_names}
+        payloads = []
+        for i, (x, x_nodes) in enumerate(zip(xs, nodes)):
+            self._input_digest = self._digest(x)
+            self._activations = {(id(model), layer_name): layer_activations[i]
+                                 for layer_name, layer_activations in activations.items()}
+            payloads.append(self.generate_many(x, x_nodes, model))
+        return payloads
+
+    def _render_heatmaps(self, img_array, heatmaps, size):
+        """
+        Colorize a (filters, height, width) stack of heatmaps, resize them to size and
+        superimpose them on the input, all in batched NumPy operations.
+        """
+        width, height = size
+        # Resize the heatmaps themselves, as it is cheaper than resizing colorized ones
+        heatmaps = np.nan_to_num(np.asarray(heatmaps, dtype=np.float32))
+        heatmaps = _resize_bilinear(np.clip(heatmaps, 0, 1), height, width)
+
+        # Colorize by looking every pixel up in the uint8 colormap table
+        colorized = colormap_lut(self.colormap)[np.uint8(255 * heatmaps)]
+
+        # Superimpose on the input and rescale each image to a range 0-255
+        img = np.asarray(img_array, dtype=np.float32).squeeze()
+        if img.ndim == 2:
+            img = img[..., None]
+        blended = img + colorized * np.float32(self.alpha)
+        low = blended.min(axis=(1, 2, 3), keepdims=True)
+        high = blended.max(axis=(1, 2, 3), keepdims=True)
+        blended -= low
+        blended *= 255 / np.maximum(high - low, np.finfo(np.float32).eps)
+        return [Image.fromarray(image) for image in blended.astype(np.uint8)]
 
     def _render_heatmap(self, img_array, heatmap, size):
-        # Rescale heatmap to a range 0-255
-        heatmap = np.uint8(255 * heatmap)
-
-        # Use jet colormap to colorize heatmap
-        jet = cm.get_cmap("jet")
-
-        # Use RGB values of the colormap
-        jet_colors = jet(np.arange(256))[:, :3]
-        jet_heatmap = jet_colors[heatmap]
-
-        # Create an image with RGB colorized heatmap
-        jet_heatmap = keras.preprocessing.image.array_to_img(jet_heatmap)
-        jet_heatmap = jet_heatmap.resize(size)
-
-        jet_heatmap = keras.preprocessing.image.img_to_array(jet_heatmap)
-        jet_heatmap = img_array.squeeze() + jet_heatmap * 0.6
-        jet_heatmap = keras.preprocessing.image.array_to_img(jet_heatmap)
-
-        return jet_heatmap
+        return self._render_heatmaps(img_array, heatmap[None], size)[0]
 
     def _make_gradcam_heatmap(self, img_array, model, layer_name, filter_idx):
-        # Based on https://github.com/keras-team/keras-io/blob/master/examples/vision/grad_cam.py
-
-        # Create a model that maps the input image to the activations
-        # of the conv layer of interest
-        intermediate_layer = model.get_layer(layer_name)
-        model_till_intermediate_layer = keras.Model(
-            model.inputs, intermediate_layer.output)
+        return self._make_gradcam_heatmaps(img_array, model, layer_name, [filter_idx])[0]
 
-        intermediate_layer_output = model_till_intermediate_layer(img_array)
-        intermediate_layer_output = intermediate_layer_output.numpy()[0]
-        intermediate_layer_output = intermediate_layer_output[:, :, filter_idx]
-
-        # Normalise between 0-1
-        heatmap = np.maximum(intermediate_layer_output, 0) / \
-            np.max(intermediate_layer_output)
-        return heatmap
+    def _make_gradcam_heatmaps(self, img_array, model, layer_name, filter_indices):
+        # Based on https://github.com/keras-team/keras-io/blob/master/examples/vision/grad_cam.py
+        intermediate_layer_output = self._layer_activations(img_array, model, layer_name)
+        # Stack the feature maps of the requested filters: (filters, height, width)
+        intermediate_layer_output = np.moveaxis(
+            intermediate_layer_output[:, :, list(filter_indices)], -1, 0)
+
+        # Normalise each feature map between 0-1
+        maxima = np.max(intermediate_layer_output, axis=(1, 2), keepdims=True)
+        heatmaps = np.maximum(intermediate_layer_output, 0) / maxima
+        return heatmaps
+
+    def _layer_activations(self, img_array, model, layer_name):
+        """
+        Get the activations of a layer for an input, running the model up to that layer
+        only once per input.
+        """
+        digest = self._digest(img_array)
+        if digest != self._input_digest:
+            self._input_digest = digest
+            self._activations = {}
+        key = (id(model), layer_name)
+        if key not in self._activations:
+            # A model that maps the input image to the activations of the conv layer
+            # of interest, built and traced once per model and layer
+            model_till_intermediate_layer = truncated_model(model, layer_name)
+            self._activations[key] = model_till_intermediate_layer(img_array).numpy()[0]
+        return self._activations[key]
+
+    def _digest(self, img_array):
+        digest = hashlib.sha1(np.ascontiguousarray(img_array).tobytes()).hexdigest()
+        return digest, np.shape(img_array), np.asarray(img_array).dtype.str
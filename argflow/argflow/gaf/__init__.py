@@ -1,5 +1,6 @@
 from .extractor import GAFExtractor
 from .framework import Framework
-from .gaf import GAF, NodeType
-from .payload import Payload, PayloadType
-from .mappers import CharacterisationMapper, InfluenceMapper, StrengthMapper
+from .gaf import GAF, GAFBackend, NodeType
+from .influence_cache import InfluenceCache
+from .payload import Payload, PayloadEncoder, PayloadType
+from .mappers import CharacterisationMapper, InfluenceMapper, NodeColumns, StrengthMapper
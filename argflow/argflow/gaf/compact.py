@@ -0,0 +1,263 @@
+import numpy as np
+
+from .._columns import _Column, _Interned
+
+
+def _as_float(value):
+    # Accepts Python numbers, NumPy scalars and single-element arrays
+    return np.asarray(value, dtype=np.float64).item()
+
+
+class CompactDiGraph:
+    """
+    An array-backed directed graph holding the nodes and relations of a GAF.
+
+    Node IDs are interned to integer slots. Node types, strengths and confidences live
+    in typed NumPy columns, and relations are kept in parallel source/destination/relation
+    arrays which are compiled into a CSR adjacency on demand. Implements the subset of the
+    networkx DiGraph interface used by GAF.
+    """
+
+    # Node attributes understood by the compact backend
+    ATTRIBUTES = ('type', 'strength', 'confidence', 'payload', 'predicted_class')
+
+    def __init__(self):
+        self._ids = {}      # node -> slot
+        self._nodes = []    # slot -> node
+        self._alive = _Column(np.bool_, False)
+        # Which attribute keys a node was given, so attribute dicts round-trip exactly
+        self._layouts = _Interned()
+        self._layout = _Column(np.int16, -1)
+        self._types = _Interned()
+        self._type = _Column(np.int8, -1)
+        self._strength = _Column(np.float64, np.nan)
+        self._has_strength = _Column(np.bool_, False)
+        self._confidence = _Column(np.float64, np.nan)
+        self._has_confidence = _Column(np.bool_, False)
+        self._payload = []
+        self._predicted_class = []
+        # Relations in insertion order. Overwritten and removed relations are
+        # resolved when the CSR adjacency is compiled.
+        self._relations = _Interned()
+        self._src = _Column(np.int64, -1)
+        self._dst = _Column(np.int64, -1)
+        self._rel = _Column(np.int32, -1)
+        self._edge_alive = _Column(np.bool_, False)
+        self._csr = None
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def has_node(self, node):
+        return node in self._ids
+
+    def slot(self, node):
+        return self._ids[node]
+
+    def slots(self, nodes):
+        return [self._ids[node] for node in nodes]
+
+    def add_node(self, node, **attributes):
+        """
+        Add a node, or overwrite the attributes of an existing one.
+
+        node            - a hashable node ID.
+        attributes      - any of type, strength, confidence, payload and predicted_class.
+        """
+        unknown = set(attributes).difference(self.ATTRIBUTES)
+        if unknown:
+            raise KeyError(f'Unsupported node attributes: {sorted(unknown)}')
+        slot = self._ids.get(node)
+        if slot is None:
+            slot = self._new_slot(node)
+        self._set_attributes(slot, attributes)
+
+    def add_nodes_from_arrays(self, nodes, **columns):
+        """
+        Add many new nodes sharing the same attribute keys at once.
+
+        nodes           - a sequence of node IDs, none of which may already be in the graph.
+        columns         - for each attribute (see add_node), a sequence of per-node values.
+                          Missing strengths and confidences may be given as None or NaN.
+        """
+        unknown = set(columns).difference(self.ATTRIBUTES)
+        if unknown:
+            raise KeyError(f'Unsupported node attributes: {sorted(unknown)}')
+        nodes = list(nodes)
+        n = len(nodes)
+        if any(len(values) != n for values in columns.values()):
+            raise ValueError('Every attribute column must have one value per node')
+        start = len(self._nodes)
+        ids = dict(zip(nodes, range(start, start + n)))
+        if len(ids) != n or not self._ids.keys().isdisjoint(ids):
+            raise ValueError('Node IDs must be unique and not already in the graph')
+        self._ids.update(ids)
+        self._nodes.extend(nodes)
+        self._alive.extend(np.ones(n, dtype=np.bool_))
+        self._layout.extend(np.full(n, self._layouts.code(tuple(sorted(columns)))))
+        if 'type' in columns:
+            self._type.extend(np.fromiter(
+                (self._types.code(t) for t in columns['type']), dtype=np.int8, count=n))
+        else:
+            self._type.extend(np.full(n, -1))
+        for name, values, present in (('strength', self._strength, self._has_strength),
+                                      ('confidence', self._confidence, self._has_confidence)):
+            column = np.asarray(columns[name], dtype=np.float64).reshape(n) \
+                if name in columns else np.full(n, np.nan)
+            values.extend(column)
+            present.extend(~np.isnan(column))
+        self._payload.extend(columns.get('payload', [None] * n))
+        self._predicted_class.extend(columns.get('predicted_class', [None] * n))
+        self._csr = None
+
+    def add_edges_from_arrays(self, src, dst, relations):
+        """
+        Add many relations at once. Both endpoints of every relation must be in the graph.
+
+        src             - a sequence of source node IDs.
+        dst             - a sequence of destination node IDs.
+        relations       - a sequence of per-edge relations.
+        """
+        ids = self._ids
+        n = len(src)
+        if len(dst) != n or len(relations) != n:
+            raise ValueError('src, dst and relations must have the same length')
+        self._src.extend(np.fromiter((ids[u] for u in src), dtype=np.int64, count=n))
+        self._dst.extend(np.fromiter((ids[v] for v in dst), dtype=np.int64, count=n))
+        self._rel.extend(np.fromiter(
+            (self._relations.code(r) for r in relations), dtype=np.int32, count=n))
+        self._edge_alive.extend(np.ones(n, dtype=np.bool_))
+        self._csr = None
+
+    def remove_node(self, node):
+        slot = self._ids.pop(node)
+        self._alive.view()[slot] = False
+        self._payload[slot] = None
+        self._predicted_class[slot] = None
+        src, dst = self._src.view(), self._dst.view()
+        self._edge_alive.view()[(src == slot) | (dst == slot)] = False
+        self._csr = None
+
+    def add_edge(self, u, v, relation=None):
+        u_slot, v_slot = self._slot_or_new(u), self._slot_or_new(v)
+        self._src.append(u_slot)
+        self._dst.append(v_slot)
+        self._rel.append(self._relations.code(relation))
+        self._edge_alive.append(True)
+        self._csr = None
+
+    def remove_edge(self, u, v):
+        matches = (self._src.view() == self._ids[u]) & \
+            (self._dst.view() == self._ids[v]) & self._edge_alive.view()
+        if not matches.any():
+            raise KeyError(f'The relation {u}-{v} is not in the graph')
+        self._edge_alive.view()[matches] = False
+        self._csr = None
+
+    def number_of_edges(self):
+        return len(self._compile()[1])
+
+    def nodes(self, data=False):
+        """
+        Get all nodes in insertion order, optionally paired with their attribute dicts.
+        """
+        slots = np.flatnonzero(self._alive.view())
+        if not data:
+            return [self._nodes[slot] for slot in slots]
+        return [(self._nodes[slot], self.node_attributes(slot)) for slot in slots]
+
+    def node_attributes(self, slot):
+        """
+        Materialise the attribute dict of the node in a given slot.
+        """
+        # Columns are read through their backing arrays to skip building views per call
+        attributes = {}
+        for key in self._layouts.values[self._layout._data[slot]]:
+            if key == 'type':
+                attributes[key] = self._types.values[self._type._data[slot]]
+            elif key == 'strength':
+                attributes[key] = self._strength._data[slot].item() \
+                    if self._has_strength._data[slot] else None
+            elif key == 'confidence':
+                attributes[key] = self._confidence._data[slot].item() \
+                    if self._has_confidence._data[slot] else None
+            elif key == 'payload':
+                attributes[key] = self._payload[slot]
+            else:
+                attributes[key] = self._predicted_class[slot]
+        return attributes
+
+    def edges(self, node, data=False):
+        """
+        Get all edges leaving a node, in insertion order.
+        """
+        indptr, targets, relations = self._compile()
+        slot = self._ids[node]
+        start, end = indptr[slot], indptr[slot + 1]
+        if not data:
+            return [(node, self._nodes[v]) for v in targets[start:end]]
+        table = self._relations.values
+        return [(node, self._nodes[v], {'relation': table[r]})
+                for v, r in zip(targets[start:end], relations[start:end])]
+
+    def _compile(self):
+        """
+        Build (and cache) the CSR adjacency as (indptr, target slots, relation codes).
+        A relation added twice keeps the position of the first and the value of the last.
+        """
+        if self._csr is not None:
+            return self._csr
+        n = len(self._nodes)
+        alive = np.flatnonzero(self._edge_alive.view())
+        src, dst = self._src.view()[alive], self._dst.view()[alive]
+        rel = self._rel.view()[alive]
+        keys = src * max(n, 1) + dst
+        # Both calls enumerate the same sorted unique keys, so first and last line up
+        _, first = np.unique(keys, return_index=True)
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        # Order edges by source, then by the position of their first insertion
+        order = np.lexsort((first, src[first]))
+        first, last = first[order], last[order]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src[first], minlength=n), out=indptr[1:])
+        self._csr = (indptr, dst[first], rel[last])
+        return self._csr
+
+    def _new_slot(self, node):
+        slot = len(self._nodes)
+        self._ids[node] = slot
+        self._nodes.append(node)
+        self._alive.append(True)
+        self._layout.append(self._layouts.code(()))
+        self._type.append(-1)
+        self._strength.append(np.nan)
+        self._has_strength.append(False)
+        self._confidence.append(np.nan)
+        self._has_confidence.append(False)
+        self._payload.append(None)
+        self._predicted_class.append(None)
+        # Slots are never reused, but the CSR index must grow with them
+        self._csr = None
+        return slot
+
+    def _slot_or_new(self, node):
+        slot = self._ids.get(node)
+        return self._new_slot(node) if slot is None else slot
+
+    def _set_attributes(self, slot, attributes):
+        layout = tuple(sorted(attributes))
+        self._layout.view()[slot] = self._layouts.code(layout)
+        node_type = attributes.get('type')
+        self._type.view()[slot] = -1 if node_type is None else self._types.code(node_type)
+        strength = attributes.get('strength')
+        self._has_strength.view()[slot] = strength is not None
+        self._strength.view()[slot] = np.nan if strength is None else _as_float(strength)
+        confidence = attributes.get('confidence')
+        self._has_confidence.view()[slot] = confidence is not None
+        self._confidence.view()[slot] = np.nan if confidence is None else _as_float(confidence)
+        self._payload[slot] = attributes.get('payload')
+        self._predicted_class[slot] = attributes.get('predicted_class')
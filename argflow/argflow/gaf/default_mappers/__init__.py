@@ -1 +1 @@
-from .defaultmappers import DefaultConvolutionalCharacterisationMapper, DefaultConvolutionalInfluenceMapper, DefaultConvolutionalStrengthMapper
\ No newline at end of file
+from .defaultmappers import DefaultConvolutionalCharacterisationMapper, DefaultConvolutionalInfluenceMapper, DefaultConvolutionalStrengthMapper, DefaultDenseInfluenceMapper, HierarchicalConvolutionalInfluenceMapper, IntegratedGradientsInfluenceMapper, NeuronInfluenceMapper
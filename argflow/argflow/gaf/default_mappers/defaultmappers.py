@@ -1,4 +1,3 @@
-import copy
 import keras
 import numpy as np
 import tensorflow as tf
@@ -7,19 +6,44 @@ from keras.applications.vgg16 import VGG16
 from keras.preprocessing import image
 from keras.applications.vgg16 import preprocess_input, decode_predictions
 
-from argflow.influence import InfluenceGraph
+from argflow.influence import InfluenceBackend, InfluenceGraph
 from argflow.gaf import GAFExtractor, CharacterisationMapper, StrengthMapper, InfluenceMapper
 from argflow.gaf.frameworks import BipolarFramework
 from argflow.chi.cnn import GradCAM, ActMax
 from argflow.portal import Writer
+from argflow.submodels import (class_gradients, head_model, input_jacobian, integrated_gradients,
+                               layer_gradients, truncated_model)
 
 
 def default_decoder_function(preds, model, input):
-    class_pred = model.predict_classes(input)
-    certainty = model.predict_proba(input)
+    # Decoded from the predictions the mapper already computed, rather than running
+    # the model again
+    preds = np.asarray(preds)
+    class_pred = preds.argmax(axis=-1)
+    certainty = preds.max(axis=-1)
     return class_pred, certainty
 
 
+def _top_indices(magnitudes, k):
+    """
+    Get the indices of the k largest magnitudes (all of them if k is None), in ascending
+    order of magnitude.
+    """
+    k = len(magnitudes) if k is None else min(k, len(magnitudes))
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    # Partition out the top k first, so only those need sorting
+    top = np.argpartition(magnitudes, -k)[-k:]
+    return top[magnitudes[top].argsort()]
+
+
+def _values(column):
+    """
+    Get the values of a column of scalars as Python scalars, as apply would give them.
+    """
+    return column.tolist() if column.ndim == 1 else list(column)
+
+
 def default_strength_function(node):
     return np.abs(node['grad']) if 'grad' in node else None
 
@@ -29,68 +53,84 @@ def default_characterisation_function(node):
 
 
 class DefaultConvolutionalInfluenceMapper(InfluenceMapper):
-    def __init__(self, no_filters=10, decoder_function=None):
+    def __init__(self, no_filters=10, decoder_function=None, backend=InfluenceBackend.NETWORKX):
         super().__init__()
         self.no_filters = no_filters
+        self.backend = backend
         if decoder_function is None:
             self.decoder_function = None
         else:
             self.decoder_function = decoder_function
 
     def apply(self, model, x):
-        influences = InfluenceGraph()
-
-        layers = copy.copy(model.layers)
-        layers.reverse()
-
-        classifier_layers = []
-        last_conv_layer = None
+        return self.apply_batch(model, [x])[0]
+
+    def apply_batch(self, model, xs):
+        """
+        Generate the influence graphs of many inputs with a single forward and backward
+        pass over all of them. Each input holds one sample, e.g. of shape (1, height, width, channels).
+        """
+        last_conv_layer = self._last_conv_layer(model)
+        x = np.concatenate([np.asarray(x) for x in xs])
+        # The predictions come from the same pass as the gradients, so the model only
+        # runs once per batch
+        preds, pooled_grads = self._forward_backward(model, x, last_conv_layer)
+        return [
+            self._influence_graph(model, x, last_conv_layer, preds[i:i + 1], pooled_grads[i])
+            for i, x in enumerate(xs)
+        ]
 
-        for layer in layers:
-            if not (isinstance(layer, keras.layers.Conv2D)):
-                classifier_layers.append(layer)
-            else:
-                last_conv_layer = layer
-                break
-        classifier_layers.reverse()
+    def get_relevant(self, model, x, last_conv_layer, classifier_layers):
+        _, pooled_grads = self._forward_backward(model, x, last_conv_layer)
+        return self._top_filters(last_conv_layer, pooled_grads.mean(axis=0))
 
-        if last_conv_layer is None:
-            raise Exception('Could not detect any convolutional layers')
+    def _last_conv_layer(self, model):
+        for layer in reversed(model.layers):
+            if isinstance(layer, keras.layers.Conv2D):
+                return layer
+        raise Exception('Could not detect any convolutional layers')
 
-        relevant_features = self.get_relevant(
-            model, x, last_conv_layer, classifier_layers
-        )
+    def _influence_graph(self, model, x, last_conv_layer, preds, pooled_grads):
+        influences = InfluenceGraph(backend=self.backend)
+        top = self._top_filter_indices(pooled_grads)
 
-        preds = model.predict(x)
         influences.add_node('Prediction')
-        if self.decoder_function is not None:
-            _, predicted_class, confidence = decode_predictions(preds, top=1)[0][0]
-        else:
-            predicted_class, confidence = default_decoder_function(preds, model, x)
+        predicted_class, confidence = self._decode(model, x, preds)
 
         influences.add_node('Input', grad=0)
 
-        for layer, idx, grad in relevant_features:
-            influences.add_node(
-                f'Filter {idx}', layer=layer, filter_idx=idx, grad=grad)
-            influences.add_influence(f'Filter {idx}', 'Prediction')
-            influences.add_influence('Input', f'Filter {idx}')
+        # Add the top filters with their gradients in one go
+        filters = [f'Filter {idx}' for idx in top]
+        influences.add_nodes_from_arrays(
+            filters, layer=[last_conv_layer.name] * len(top), filter_idx=top,
+            grad=pooled_grads[top])
+        influences.add_influences_from_arrays(['Input'] * len(top), filters)
+        influences.add_influences_from_arrays(filters, ['Prediction'] * len(top))
 
         return influences, predicted_class, confidence
 
-    def get_relevant(self, model, x, last_conv_layer, classifier_layers):
-        last_conv_layer_model = keras.Model(
-            model.inputs, last_conv_layer.output)
-
-        # Create a model that maps the activations of the last conv
-        # layer to the final class predictions
-        classifier_input = keras.Input(shape=last_conv_layer.output.shape[1:])
-        y = classifier_input
-        for layer in classifier_layers:
-            y = layer(y)
-        classifier_model = keras.Model(classifier_input, y)
-
-        # Compute the gradient of the top predicted class for our input image
+    def _decode(self, model, x, preds):
+        """
+        Get the predicted class and confidence of an input from its predictions.
+        """
+        if self.decoder_function is not None:
+            _, predicted_class, confidence = self.decoder_function(preds, top=1)[0][0]
+            return predicted_class, confidence
+        return default_decoder_function(preds, model, x)
+
+    def _forward_backward(self, model, x, last_conv_layer):
+        """
+        Run the model once on a batch, returning its predictions along with the gradient
+        of each sample's top predicted class with respect to each filter of the last conv
+        layer, averaged over the filter's feature map: a (samples, filters) array.
+        """
+        # Models from the input to the activations of the last conv layer, and from those
+        # activations to the final class predictions (i.e. through the classifier layers).
+        # Both are built and traced once per model.
+        last_conv_layer_model = truncated_model(model, last_conv_layer.name)
+        classifier_model = head_model(model, last_conv_layer.name)
+
+        # Compute the gradient of the top predicted class for our input images
         # with respect to the activations of the last conv layer
         with tf.GradientTape() as tape:
             # Compute activations of the last conv layer and make the tape watch it
@@ -98,24 +138,337 @@ class DefaultConvolutionalInfluenceMapper(InfluenceMapper):
             tape.watch(last_conv_layer_output)
             # Compute class predictions
             preds = classifier_model(last_conv_layer_output)
-            top_pred_index = tf.argmax(preds[0])
-            top_class_channel = preds[:, top_pred_index]
+            top_pred_index = tf.argmax(preds, axis=-1)
+            top_class_channel = tf.gather(preds, top_pred_index, batch_dims=1)
 
         # This is the gradient of the top predicted class with regard to
-        # the output feature map of the last conv layer
+        # the output feature map of the last conv layer. Samples don't interact,
+        # so each sample only gets the gradient of its own top class.
         grads = tape.gradient(top_class_channel, last_conv_layer_output)
 
-        # This is a vector where each entry is the mean intensity of the gradient
+        # Each row is a vector where each entry is the mean intensity of the gradient
         # over a specific feature map channel
-        pooled_grads = tf.reduce_mean(grads, axis=(0, 1, 2))
+        pooled_grads = tf.reduce_mean(grads, axis=(1, 2))
+
+        return preds.numpy(), pooled_grads.numpy()
+
+    def _top_filters(self, last_conv_layer, pooled_grads):
+        """
+        Get (layer, filter index, gradient) tuples for the no_filters filters with the
+        largest gradient magnitudes, in ascending order of magnitude.
+        """
+        return [(last_conv_layer.name, i, pooled_grads[i])
+                for i in self._top_filter_indices(pooled_grads)]
+
+    def _top_filter_indices(self, pooled_grads):
+        """
+        Get the indices of the no_filters filters with the largest gradient magnitudes,
+        in ascending order of magnitude.
+        """
+        return _top_indices(np.abs(pooled_grads), self.no_filters)
+
+
+class HierarchicalConvolutionalInfluenceMapper(DefaultConvolutionalInfluenceMapper):
+    def __init__(self, no_filters=10, layers=None, no_blocks=3, decoder_function=None,
+                 backend=InfluenceBackend.NETWORKX):
+        """
+        Builds layered influence graphs across several convolutional blocks: the input
+        influences the top filters of the first block, the top filters of each block
+        influence those of the next, and those of the last block influence the prediction.
+
+        The gradients of every layer come from a single forward and backward pass over the
+        model, so a graph costs about as much as one of DefaultConvolutionalInfluenceMapper.
+
+        no_filters      - the number of filters (with the largest gradient magnitudes) kept
+                          per layer, so each graph has at most no_filters per layer.
+        layers          - names of the conv layers to use, in order. Defaults to the last
+                          conv layer of each of the last no_blocks blocks, where blocks are
+                          separated by pooling layers.
+        no_blocks       - the number of blocks used when layers isn't given.
+        """
+        super().__init__(no_filters=no_filters, decoder_function=decoder_function,
+                         backend=backend)
+        self.layers = None if layers is None else list(layers)
+        self.no_blocks = no_blocks
+
+    def apply_batch(self, model, xs):
+        """
+        Generate the influence graphs of many inputs with a single forward and backward
+        pass over all of them. Each input holds one sample, e.g. of shape (1, height, width, channels).
+        """
+        layer_names = self._layer_names(model)
+        x = np.concatenate([np.asarray(x) for x in xs])
+        preds, pooled_grads = class_gradients(model, layer_names)(x)
+        preds = preds.numpy()
+        pooled_grads = [grads.numpy() for grads in pooled_grads]
+        return [
+            self._layered_influence_graph(model, x, layer_names, preds[i:i + 1],
+                                          [grads[i] for grads in pooled_grads])
+            for i, x in enumerate(xs)
+        ]
+
+    def _layer_names(self, model):
+        if self.layers is not None:
+            return self.layers
+        blocks = [[]]
+        for layer in model.layers:
+            if isinstance(layer, keras.layers.Conv2D):
+                blocks[-1].append(layer.name)
+            elif 'Pooling' in type(layer).__name__ and blocks[-1]:
+                blocks.append([])
+        layer_names = [block[-1] for block in blocks if block][-self.no_blocks:]
+        if not layer_names:
+            raise Exception('Could not detect any convolutional layers')
+        return layer_names
+
+    def _layered_influence_graph(self, model, x, layer_names, preds, pooled_grads):
+        influences = InfluenceGraph(backend=self.backend)
+        influences.add_node('Prediction')
+        predicted_class, confidence = self._decode(model, x, preds)
+        influences.add_node('Input', grad=0)
+
+        previous = ['Input']
+        for layer_name, grads in zip(layer_names, pooled_grads):
+            top = self._top_filter_indices(grads)
+            filters = [f'{layer_name} Filter {idx}' for idx in top]
+            influences.add_nodes_from_arrays(
+                filters, layer=[layer_name] * len(top), filter_idx=top, grad=grads[top])
+            # Every top filter of a layer influences every top filter of the next
+            influences.add_influences_from_arrays(
+                [node for node in previous for _ in filters], filters * len(previous))
+            previous = filters
+        influences.add_influences_from_arrays(previous, ['Prediction'] * len(previous))
+
+        return influences, predicted_class, confidence
+
+
+class DefaultDenseInfluenceMapper(InfluenceMapper):
+    def __init__(self, feature_names=None, layer_name=None, target='top',
+                 backend=InfluenceBackend.NETWORKX):
+        """
+        Generates a 3-layer influence graph for dense networks over flat (e.g. tabular)
+        inputs: the input influences each feature, which influences the prediction. Each
+        feature node has the gradient of the explained output with respect to the feature.
+
+        The gradients of a batch come from the Jacobian of the explained layer, computed by
+        a function traced once per model with a fixed input signature.
+
+        feature_names   - optional sequence, or dict from feature index to name, of feature
+                          names, stored as the fname attribute. Defaults to 'Feature i'.
+        layer_name      - the layer whose outputs are explained. Defaults to the output
+                          layer. Layers applying a softmax (a Softmax layer, or a Dense
+                          layer with a softmax activation) are explained by their logits,
+                          whose softmax gives the confidence.
+        target          - 'top' to explain the top predicted output of each input, or 'sum'
+                          to explain the sum of all outputs.
+        backend         - the InfluenceBackend of the generated graphs.
+        """
+        super().__init__()
+        if target not in ('top', 'sum'):
+            raise ValueError("target must be 'top' or 'sum'")
+        self.feature_names = feature_names
+        self.layer_name = layer_name
+        self.target = target
+        self.backend = backend
+
+    def apply(self, model, x):
+        return self.apply_batch(model, [x])[0]
+
+    def apply_batch(self, model, xs):
+        """
+        Generate the influence graphs of many inputs with a single traced call. Each input
+        holds one sample, e.g. of shape (1, features) or (features,).
+        """
+        layer_name = self.layer_name if self.layer_name is not None else model.layers[-1].name
+        x = np.concatenate([np.reshape(x, (1, -1)) for x in xs])
+        logits, gradients = self._gradients(model, layer_name, x)
+        top = logits.argmax(axis=-1)
+        # Softmax of the logits, shifted for numerical stability. For a softmax output
+        # layer, this is the model's own top probability
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        confidences = (exp / exp.sum(axis=-1, keepdims=True)).max(axis=-1)
+        return [self._influence_graph(x[i], gradients[i], int(top[i]), float(confidences[i]))
+                for i in range(len(x))]
+
+    def _gradients(self, model, layer_name, x):
+        """
+        Get the outputs of the explained layer for a batch and the gradient of each
+        sample's target with respect to its features: a (samples, features) array.
+        """
+        outputs, jacobians = input_jacobian(model, layer_name, logits=True)(x)
+        outputs, jacobians = outputs.numpy(), jacobians.numpy()
+        if self.target == 'top':
+            return outputs, jacobians[np.arange(len(x)), outputs.argmax(axis=-1)]
+        return outputs, jacobians.sum(axis=1)
+
+    def _influence_graph(self, x, gradients, predicted_class, confidence):
+        influences = InfluenceGraph(backend=self.backend)
+        influences.add_node('Prediction')
+        influences.add_node('Input', grad=0)
+
+        indices = np.arange(len(x))
+        features = [f'Feature {i}' for i in indices]
+        influences.add_nodes_from_arrays(
+            features, grad=gradients, value=x, fname=self._feature_names(len(x)), idx=indices)
+        influences.add_influences_from_arrays(['Input'] * len(x), features)
+        influences.add_influences_from_arrays(features, ['Prediction'] * len(x))
+
+        return influences, predicted_class, confidence
+
+    def _feature_names(self, n):
+        if self.feature_names is None:
+            return [f'Feature {i}' for i in range(n)]
+        return [self.feature_names[i] for i in range(n)]
+
+
+class IntegratedGradientsInfluenceMapper(DefaultDenseInfluenceMapper):
+    def __init__(self, steps=50, baseline=None, feature_names=None, layer_name=None,
+                 target='top', backend=InfluenceBackend.NETWORKX):
+        """
+        Generates the same graphs as DefaultDenseInfluenceMapper, with the integrated
+        gradients of each feature as its grad attribute: the difference between the input
+        and a baseline, times the average gradient along the straight path between them
+        (by the trapezoidal rule).
+
+        Every step of every input of a batch is evaluated as one batched tensor, in a
+        single forward and backward pass traced once per model.
+
+        steps           - the number of intervals the path is split into.
+        baseline        - the baseline input: a scalar or an array with one value per
+                          feature. Defaults to zeros.
+        """
+        super().__init__(feature_names=feature_names, layer_name=layer_name, target=target,
+                         backend=backend)
+        if steps < 1:
+            raise ValueError('steps must be positive')
+        self.steps = steps
+        self.baseline = baseline
+
+    def _gradients(self, model, layer_name, x):
+        baseline = np.broadcast_to(0 if self.baseline is None else self.baseline, x.shape[1:])
+        alphas = np.linspace(0, 1, self.steps + 1)
+        outputs, attributions = integrated_gradients(model, layer_name, self.target,
+                                                     logits=True)(x, baseline, alphas)
+        return outputs.numpy(), attributions.numpy()
+
+
+class NeuronInfluenceMapper(InfluenceMapper):
+    def __init__(self, max_neurons=10, max_edges=3, feature_names=None,
+                 backend=InfluenceBackend.NETWORKX):
+        """
+        Generates a layered influence graph of the neurons of a dense network (an MLP): the
+        input influences the input features, the neurons of each Dense layer influence
+        those of the next, and the neurons of the last hidden layer influence the
+        prediction. Each influence has the contribution of its source to its destination,
+        the source's activation times the weight between them. Each neuron's grad attribute
+        is its activation times the gradient of the top predicted class with respect to it.
+
+        The graph is pruned before it is built: only the max_neurons neurons of each layer
+        with the largest grad magnitudes are kept, and each kept neuron keeps the max_edges
+        influences to the next layer with the largest contribution magnitudes (plus, for
+        each neuron of the next layer, its largest incoming one, so it stays connected).
+        Contributions are computed for whole layers at once, by broadcasting the
+        activations of the batch against the weights.
+
+        max_neurons     - the number of neurons kept per layer, or None to keep them all.
+        max_edges       - the number of influences kept per neuron, or None to keep them all.
+        feature_names   - optional sequence, or dict from feature index to name, of input
+                          feature names, stored as the fname attribute.
+        backend         - the InfluenceBackend of the generated graphs.
+        """
+        super().__init__()
+        if (max_neurons is not None and max_neurons < 1) or (max_edges is not None and max_edges < 1):
+            raise ValueError('max_neurons and max_edges must be positive')
+        self.max_neurons = max_neurons
+        self.max_edges = max_edges
+        self.feature_names = feature_names
+        self.backend = backend
+
+    def apply(self, model, x):
+        return self.apply_batch(model, [x])[0]
+
+    def apply_batch(self, model, xs):
+        """
+        Generate the influence graphs of many inputs with a single forward and backward
+        pass over all of them. Each input holds one sample, e.g. of shape (1, features).
+        """
+        dense_layers = [layer for layer in model.layers if isinstance(layer, keras.layers.Dense)]
+        if not dense_layers:
+            raise Exception('Could not detect any dense layers')
+        # The neurons of the last Dense layer are the outputs, so aren't nodes
+        hidden = dense_layers[:-1]
+        x = np.concatenate([np.reshape(x, (1, -1)) for x in xs])
+        preds, activations, gradients = layer_gradients(model, [layer.name for layer in hidden])(x)
+        preds = preds.numpy()
+        activations = [a.numpy() for a in activations]
+        relevances = [a * g.numpy() for a, g in zip(activations, gradients)]
+        kernels = [layer.get_weights()[0] for layer in dense_layers]
+        top = preds.argmax(axis=-1)
+
+        # The contributions of the neurons of each layer to those of the next, for the
+        # whole batch: (samples, neurons, next neurons), the last layer's to the top class
+        contributions = [a[:, :, None] * kernel[None] for a, kernel in zip(activations, kernels[:-1])]
+        contributions.append((activations[-1] * kernels[-1].T[top])[:, :, None])
+
+        layer_names = ['input'] + [layer.name for layer in hidden]
+        return [
+            self._influence_graph(layer_names, [a[i] for a in activations],
+                                  [r[i] for r in relevances], [c[i] for c in contributions],
+                                  int(top[i]), preds[i, top[i]])
+            for i in range(len(x))
+        ]
+
+    def _influence_graph(self, layer_names, activations, relevances, contributions,
+                         predicted_class, confidence):
+        influences = InfluenceGraph(backend=self.backend)
+        influences.add_node('Prediction')
+        influences.add_node('Input', grad=0)
 
-        last_conv_layer_output = last_conv_layer_output.numpy()[0]
-        pooled_grads = pooled_grads.numpy()
-        # Sort filters by contribution and return list of (layer, filter index, gradient) tuples
-        top_pooled_grads = [(last_conv_layer.name, i, pooled_grads[i])
-                            for i in (np.abs(pooled_grads)).argsort()[-self.no_filters:]]
+        previous = previous_kept = None
+        for depth, (layer_name, a, relevance) in enumerate(zip(layer_names, activations, relevances)):
+            kept = np.sort(_top_indices(np.abs(relevance), self.max_neurons))
+            nodes = [self._node_name(depth, layer_name, j) for j in kept]
+            influences.add_nodes_from_arrays(
+                nodes, layer=[layer_name] * len(kept), neuron=kept, value=a[kept],
+                grad=relevance[kept], fname=[self._fname(depth, layer_name, j) for j in kept])
+            if previous is None:
+                influences.add_influences_from_arrays(['Input'] * len(nodes), nodes)
+            else:
+                src, dst = self._sparsify(contributions[depth - 1][np.ix_(previous_kept, kept)])
+                influences.add_influences_from_arrays(
+                    [previous[i] for i in src], [nodes[j] for j in dst],
+                    contribution=contributions[depth - 1][previous_kept[src], kept[dst]])
+            previous, previous_kept = nodes, kept
+        influences.add_influences_from_arrays(
+            previous, ['Prediction'] * len(previous),
+            contribution=contributions[-1][previous_kept, 0])
 
-        return top_pooled_grads
+        return influences, predicted_class, confidence
+
+    def _sparsify(self, contributions):
+        """
+        Get the (source, destination) positions of the influences kept between two layers,
+        given the matrix of contributions between their kept neurons.
+        """
+        magnitudes = np.abs(contributions)
+        keep = np.zeros(magnitudes.shape, dtype=bool)
+        if self.max_edges is None or self.max_edges >= magnitudes.shape[1]:
+            keep[:] = True
+        else:
+            # The max_edges largest outgoing influences of each source
+            top = np.argpartition(magnitudes, -self.max_edges, axis=1)[:, -self.max_edges:]
+            np.put_along_axis(keep, top, True, axis=1)
+            # And the largest incoming influence of each destination
+            keep[magnitudes.argmax(axis=0), np.arange(magnitudes.shape[1])] = True
+        return np.nonzero(keep)
+
+    def _node_name(self, depth, layer_name, j):
+        return f'Feature {j}' if depth == 0 else f'{layer_name} Neuron {j}'
+
+    def _fname(self, depth, layer_name, j):
+        if depth == 0 and self.feature_names is not None:
+            return self.feature_names[j]
+        return self._node_name(depth, layer_name, j)
 
 
 class DefaultConvolutionalStrengthMapper(StrengthMapper):
@@ -129,6 +482,11 @@ class DefaultConvolutionalStrengthMapper(StrengthMapper):
     def apply(self, node):
         return self.strength_function(node)
 
+    def apply_many(self, nodes):
+        if self.strength_function is default_strength_function and 'grad' in nodes:
+            return _values(np.abs(nodes['grad']))
+        return super().apply_many(nodes)
+
 
 class DefaultConvolutionalCharacterisationMapper(CharacterisationMapper):
     def __init__(self, characterisation_function=None):
@@ -140,3 +498,11 @@ class DefaultConvolutionalCharacterisationMapper(CharacterisationMapper):
 
     def apply(self, node):
         return self.characterisation_function(node)
+
+    def apply_many(self, nodes):
+        if self.characterisation_function is default_characterisation_function \
+                and 'grad' in nodes:
+            relations = np.array([BipolarFramework.SUPPORT, BipolarFramework.ATTACK],
+                                 dtype=object)
+            return _values(relations[(nodes['grad'] < 0).astype(np.intp)])
+        return super().apply_many(nodes)
@@ -1,16 +1,24 @@
-from .gaf import GAF, Payload, PayloadType
+import itertools
+
+import numpy as np
+
+from .gaf import GAF, GAFBackend, Payload, PayloadType
 from .mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper
 from ..chi import Chi
 from ..influence import InfluenceGraph
 
 
 class GAFExtractor:
-    def __init__(self, influence_mapper, strength_mapper, characterisation_mapper, chi):
+    def __init__(self, influence_mapper, strength_mapper, characterisation_mapper, chi,
+                 backend=GAFBackend.NETWORKX, influence_cache=None):
         """
         influence_mapper        - a function that generates the relevant influence graph from a model given an input.
         strength_mapper         - a function that provides a strength given the source and destination of an edge.
         characterisation_mapper - a function that provides the relevant characterisation for an argument.
         chi                     - a Chi instance that generates visualisations for an argument.
+        backend                 - the GAFBackend used to store extracted GAFs.
+        influence_cache         - optional InfluenceCache, so the influence graphs of inputs
+                                  explained before are reused rather than recomputed.
         """
         super().__init__()
         assert isinstance(influence_mapper, InfluenceMapper)
@@ -21,39 +29,110 @@ class GAFExtractor:
         self.strength_mapper = strength_mapper
         self.characterisation_mapper = characterisation_mapper
         self.chi = chi
+        self.backend = backend
+        self.influence_cache = influence_cache
 
-    def extract(self, model, x):
+    def extract(self, model, x, progress=None):
         """
         Extract a GAF from a model.
 
         model           - a Model.
         x               - some input to the model.
+        progress        - optional function called with the name of each stage as it
+                          starts: 'influence_mapping', 'chi_generation', then
+                          'gaf_construction'.
         """
-        influences, predicted_class, confidence = self.influence_mapper.apply(
-            model, x
-        )   # Assume outputs an InfluenceGraph
-        gaf = GAF()
+        if progress is not None:
+            progress('influence_mapping')
+        if self.influence_cache is None:
+            influences, predicted_class, confidence = self.influence_mapper.apply(
+                model, x
+            )   # Assume outputs an InfluenceGraph
+        else:
+            influences, predicted_class, confidence = self.influence_cache.apply(
+                self.influence_mapper, model, x)
+        nodes = influences.nodes()
         starting, intermediate, terminal = influences.get_typed_nodes()
-        # Generate GAF
-        for node, data in influences.nodes().items():
-            if node in starting:
-                payload = Payload('Input', PayloadType.STRING)
-                gaf.add_input(node,
-                              payload=payload
-                              )
-            if node in intermediate:
-                payload = self.chi.generate(x, data, model)
-                gaf.add_argument(node,
-                                 strength=self.strength_mapper.apply(data),
-                                 payload=payload
-                                 )
-            if node in terminal:
-                gaf.add_conclusion(node,
-                                   predicted_class=predicted_class,
-                                   confidence=confidence
-                                   )
-            for _, v, _ in influences.influences_from(node):
-                gaf.add_relation(
-                    node, v, self.characterisation_mapper.apply(data)
-                )
-        return gaf
+        # The chi gets every intermediate node at once, so it can batch its work
+        intermediate = list(intermediate)
+        if progress is not None:
+            progress('chi_generation')
+        payloads = self.chi.generate_many(x, [nodes[node] for node in intermediate], model)
+        if progress is not None:
+            progress('gaf_construction')
+        return self._build_gaf(influences, predicted_class, confidence, nodes,
+                               (starting, intermediate, terminal), payloads)
+
+    def extract_batch(self, model, xs, batch_size=32):
+        """
+        Extract the GAFs of many inputs, yielding them in the order of xs.
+        Inputs are processed batch_size at a time: the influence mapper and the chi get
+        a whole batch at once (through apply_batch and generate_batch), so model passes
+        can run on the batch. Only one batch is held in memory at a time.
+
+        model           - a Model.
+        xs              - an iterable of inputs to the model, each as accepted by extract.
+        batch_size      - the number of inputs processed together.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        xs = iter(xs)
+        while True:
+            batch = list(itertools.islice(xs, batch_size))
+            if not batch:
+                return
+            if self.influence_cache is None:
+                results = self.influence_mapper.apply_batch(model, batch)
+            else:
+                results = self.influence_cache.apply_batch(self.influence_mapper, model, batch)
+            batch_nodes = []
+            batch_typed_nodes = []
+            for influences, _, _ in results:
+                starting, intermediate, terminal = influences.get_typed_nodes()
+                batch_nodes.append(influences.nodes())
+                batch_typed_nodes.append((starting, list(intermediate), terminal))
+            batch_payloads = self.chi.generate_batch(
+                batch,
+                [[nodes[node] for node in intermediate]
+                 for nodes, (_, intermediate, _) in zip(batch_nodes, batch_typed_nodes)],
+                model
+            )
+            for (influences, predicted_class, confidence), nodes, typed_nodes, payloads \
+                    in zip(results, batch_nodes, batch_typed_nodes, batch_payloads):
+                yield self._build_gaf(influences, predicted_class, confidence, nodes,
+                                      typed_nodes, payloads)
+
+    def _build_gaf(self, influences, predicted_class, confidence, nodes, typed_nodes,
+                   intermediate_payloads):
+        """
+        Build the GAF of an influence graph, given the payloads of its intermediate nodes.
+        """
+        starting, intermediate, terminal = typed_nodes
+        payloads = {node: Payload('Input', PayloadType.STRING) for node in starting}
+        payloads.update(zip(intermediate, intermediate_payloads))
+        # The mappers get every node at once, by column, so they can vectorise their work
+        strengths = dict(zip(intermediate, self.strength_mapper.apply_many(
+            influences.node_columns(intermediate))))
+        # Every influence leaving a node shares that node's characterisation, and only
+        # terminal nodes have no influences leaving them
+        sources = [node for node in nodes if node not in terminal]
+        relations = dict(zip(sources, self.characterisation_mapper.apply_many(
+            influences.node_columns(sources))))
+        return GAF.from_influence_graph(influences,
+                                        strengths=strengths,
+                                        relations=relations,
+                                        payloads=payloads,
+                                        confidence=_scalar(confidence),
+                                        predicted_class=_scalar(predicted_class),
+                                        backend=self.backend
+                                        )
+
+
+def _scalar(value):
+    """
+    Convert the single-sample arrays mappers may return (e.g. predictions decoded from a
+    batch of one) to Python scalars, so GAFs store and serialise plain values.
+    """
+    if isinstance(value, (np.ndarray, np.generic)) and np.size(value) == 1:
+        return np.asarray(value).item()
+    return value
@@ -1,11 +1,31 @@
-import os
 import json
-import time
 import networkx as nx
 
+from collections import deque
+from collections.abc import Mapping
 from enum import Enum
+from types import MappingProxyType
+from .compact import CompactDiGraph
 from .framework import Framework
-from .payload import Payload, PayloadType
+from .payload import Payload, PayloadType, _PayloadSaver
+
+try:
+    # Optional, faster JSON encoder used for compact serialisation
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj, compact):
+    """
+    Encode an object as JSON. The pretty layout (indented, sorted keys) is the historical
+    graph.json format; the compact one uses orjson when it is installed.
+    """
+    if not compact:
+        return json.dumps(obj, indent=4, sort_keys=True)
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'))
 
 
 class NodeType(Enum):
@@ -15,73 +35,277 @@ class NodeType(Enum):
     CONCLUSION = 2
 
 
+class GAFBackend(str, Enum):
+
+    NETWORKX = 'networkx'
+    COMPACT = 'compact'
+
+
+class TypedNodes(Mapping):
+    """
+    A read-only, live view of the nodes of one type in a compact GAF, mapping
+    each node to its (lazily materialised) attributes.
+    """
+
+    def __init__(self, index, attributes):
+        self._index = index
+        self._attributes = attributes
+
+    def __getitem__(self, node):
+        return self._attributes(self._index[node])
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, node):
+        return node in self._index
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())})'
+
+
 class GAF:
 
-    def __init__(self, confidence=0, predicted_class=None):
-        self._G = nx.DiGraph()
+    def __init__(self, confidence=0, predicted_class=None, backend=GAFBackend.NETWORKX):
+        """
+        confidence      - confidence of the prediction.
+        predicted_class - class predicted by the model.
+        backend         - storage backend, either GAFBackend.NETWORKX (a networkx DiGraph)
+                          or GAFBackend.COMPACT (NumPy arrays, for large GAFs).
+        """
+        self._backend = GAFBackend(backend)
+        if self._backend == GAFBackend.COMPACT:
+            self._G = CompactDiGraph()
+        else:
+            self._G = nx.DiGraph()
         self._framework = None
+        # Per-type indexes mapping each node to its attributes (the networkx attribute
+        # dict, or the compact backend's slot), kept up to date by add_* and remove_node
+        self._index = {node_type: {} for node_type in NodeType}
+        if self._backend == GAFBackend.COMPACT:
+            self._views = {node_type: TypedNodes(index, self._G.node_attributes)
+                           for node_type, index in self._index.items()}
+        else:
+            self._views = {node_type: MappingProxyType(index)
+                           for node_type, index in self._index.items()}
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def to_backend(self, backend):
+        """
+        Get a copy of this GAF stored in another backend.
+
+        backend         - a GAFBackend.
+        """
+        gaf = GAF(backend=backend)
+        for node, data in self._G.nodes(data=True):
+            gaf._G.add_node(node, **data)
+            if 'type' in data:
+                gaf._index_nodes(data['type'], [node])
+        for node in self._G.nodes():
+            for u, v, data in self._G.edges(node, data=True):
+                gaf._G.add_edge(u, v, **data)
+        gaf._framework = self._framework
+        return gaf
+
+    @classmethod
+    def from_arrays(cls, node_ids, types, strengths=None, edge_src=(), edge_dst=(),
+                    relations=(), payloads=None, confidence=0, predicted_class=None,
+                    backend=GAFBackend.NETWORKX):
+        """
+        Build a GAF from whole columns of nodes and relations at once. Payload and
+        relation types are validated once for the batch rather than once per element.
+
+        node_ids        - a sequence of unique node IDs.
+        types           - a sequence of NodeTypes, one per node.
+        strengths       - a sequence of strengths, one per node (only used for arguments).
+        edge_src        - a sequence of relation source nodes.
+        edge_dst        - a sequence of relation destination nodes.
+        relations       - a sequence of relations, one per edge, or a single relation used
+                          for every edge. All must belong to the same framework.
+        payloads        - a sequence of Payloads (or None), one per node.
+        confidence      - confidence of the prediction, given to every conclusion.
+        predicted_class - class predicted by the model, given to every conclusion.
+        backend         - a GAFBackend.
+        """
+        node_ids, types = list(node_ids), [NodeType(t) for t in types]
+        edge_src, edge_dst = list(edge_src), list(edge_dst)
+        n = len(node_ids)
+        if strengths is None:
+            strengths = [None] * n
+        if payloads is None:
+            payloads = [None] * n
+        if isinstance(relations, Framework):
+            relations = [relations] * len(edge_src)
+        else:
+            relations = list(relations)
+        if not len(types) == len(strengths) == len(payloads) == n:
+            raise ValueError('types, strengths and payloads must have one entry per node')
+        if len(set(node_ids)) != n:
+            raise ValueError('Node IDs must be unique')
+        if not len(edge_dst) == len(relations) == len(edge_src):
+            raise ValueError('edge_src, edge_dst and relations must have the same length')
+        gaf = cls(backend=backend)
+        gaf._check_payloads(payloads)
+        # Members of str enums compare equal across frameworks, so dedupe on type too
+        gaf._check_relations(relation for _, relation in {(type(r), r) for r in relations})
+        if not set(edge_src).union(edge_dst).issubset(node_ids):
+            raise ValueError('Every relation must connect nodes of the GAF')
+        for node_type in NodeType:
+            idx = [i for i, t in enumerate(types) if t == node_type]
+            columns = {'payload': [payloads[i] for i in idx]}
+            if node_type == NodeType.ARGUMENT:
+                columns['strength'] = [strengths[i] for i in idx]
+            elif node_type == NodeType.CONCLUSION:
+                columns['confidence'] = [confidence] * len(idx)
+                columns['predicted_class'] = [predicted_class] * len(idx)
+            columns['type'] = [node_type] * len(idx)
+            nodes = [node_ids[i] for i in idx]
+            gaf._add_nodes_from_columns(nodes, columns)
+            gaf._index_nodes(node_type, nodes)
+        if gaf._backend == GAFBackend.COMPACT:
+            gaf._G.add_edges_from_arrays(edge_src, edge_dst, relations)
+        else:
+            gaf._G.add_edges_from(
+                (u, v, {'relation': relation})
+                for u, v, relation in zip(edge_src, edge_dst, relations))
+        return gaf
+
+    @classmethod
+    def from_influence_graph(cls, influences, strengths=None, relations=None, payloads=None,
+                             confidence=0, predicted_class=None, backend=GAFBackend.NETWORKX):
+        """
+        Build a GAF from an InfluenceGraph in one batch. Starting nodes become inputs,
+        intermediate nodes become arguments and terminal nodes become conclusions.
+
+        influences      - an InfluenceGraph.
+        strengths       - a dict mapping arguments to their strengths.
+        relations       - a dict mapping nodes to the relation given to every influence
+                          leaving them.
+        payloads        - a dict mapping nodes to their Payloads.
+        confidence      - confidence of the prediction.
+        predicted_class - class predicted by the model.
+        backend         - a GAFBackend.
+        """
+        strengths = {} if strengths is None else strengths
+        relations = {} if relations is None else relations
+        payloads = {} if payloads is None else payloads
+        starting, intermediate, terminal = influences.get_typed_nodes()
+        node_types = dict.fromkeys(starting, NodeType.INPUT)
+        node_types.update(dict.fromkeys(intermediate, NodeType.ARGUMENT))
+        node_types.update(dict.fromkeys(terminal, NodeType.CONCLUSION))
+        node_ids = list(influences.nodes())
+        edges = [(u, v) for u, v, _ in influences.influences()]
+        for u, _ in edges:
+            if u not in relations:
+                raise ValueError(f'No relation was given for the influences leaving {u!r}')
+        return cls.from_arrays(
+            node_ids,
+            [node_types[node] for node in node_ids],
+            strengths=[strengths.get(node) for node in node_ids],
+            edge_src=[u for u, _ in edges],
+            edge_dst=[v for _, v in edges],
+            relations=[relations.get(u) for u, _ in edges],
+            payloads=[payloads.get(node) for node in node_ids],
+            confidence=confidence,
+            predicted_class=predicted_class,
+            backend=backend
+        )
 
     def add_argument(self, node, strength=None, payload=None):
-        if not payload is None:
-            if not isinstance(payload, Payload):
-                raise TypeError('payload must be of type Payload')
+        self._check_payloads((payload,))
         self._G.add_node(node, strength=strength,
                          payload=payload, type=NodeType.ARGUMENT)
+        self._index_nodes(NodeType.ARGUMENT, [node])
 
     def add_input(self, node, payload=None):
-        if not payload is None:
-            if not isinstance(payload, Payload):
-                raise TypeError('payload must be of type Payload')
+        self._check_payloads((payload,))
         self._G.add_node(node, payload=payload, type=NodeType.INPUT)
+        self._index_nodes(NodeType.INPUT, [node])
 
     def add_conclusion(self, node, confidence, predicted_class, payload=None):
-        if not payload is None:
-            if not isinstance(payload, Payload):
-                raise TypeError('payload must be of type Payload')
+        self._check_payloads((payload,))
         self._G.add_node(node, payload=payload, confidence=confidence,
                          predicted_class=predicted_class, type=NodeType.CONCLUSION)
+        self._index_nodes(NodeType.CONCLUSION, [node])
 
     def remove_node(self, node):
         self._G.remove_node(node)
+        for index in self._index.values():
+            index.pop(node, None)
 
     def add_relation(self, u, v, relation):
-        if self._framework is None:
-            # Check if the relation provided is valid
-            if isinstance(relation, Framework):
-                self._framework = type(relation)
-            else:
-                raise TypeError(
-                    'Relation type must be part of an argumentation framework.')
-        else:
-            # Check if the relation provided is consistent with the existing GAF
-            if not isinstance(relation, self._framework):
-                raise TypeError(
-                    'Relation type must be consistent for a given GAF')
+        self._check_relations((relation,))
         self._G.add_edge(u, v, relation=relation)
 
     def remove_relation(self, u, v):
         self._G.remove_edge(u, v)
         # If the graph is now empty, remove all constraints on relation types
-        if not self._framework is None and len(self._G.edges) == 0:
+        if not self._framework is None and self._G.number_of_edges() == 0:
             self._framework = None
 
+    def _index_nodes(self, node_type, nodes):
+        if self._backend == GAFBackend.COMPACT:
+            keys = self._G.slots(nodes)
+        else:
+            keys = [self._G.nodes[node] for node in nodes]
+        for other_type, index in self._index.items():
+            # A node re-added with another type moves between indexes
+            if other_type != node_type and index:
+                for node in nodes:
+                    index.pop(node, None)
+        self._index[node_type].update(zip(nodes, keys))
+
+    def _add_nodes_from_columns(self, nodes, columns):
+        if self._backend == GAFBackend.COMPACT:
+            self._G.add_nodes_from_arrays(nodes, **columns)
+        else:
+            self._G.add_nodes_from(
+                (node, {key: values[i] for key, values in columns.items()})
+                for i, node in enumerate(nodes))
+
+    def _check_payloads(self, payloads):
+        for payload_type in set(map(type, payloads)):
+            if not (payload_type is type(None) or issubclass(payload_type, Payload)):
+                raise TypeError('payload must be of type Payload')
+
+    def _check_relations(self, relations):
+        for relation in relations:
+            if self._framework is None:
+                # Check if the relation provided is valid
+                if isinstance(relation, Framework):
+                    self._framework = type(relation)
+                else:
+                    raise TypeError(
+                        'Relation type must be part of an argumentation framework.')
+            else:
+                # Check if the relation provided is consistent with the existing GAF
+                if not isinstance(relation, self._framework):
+                    raise TypeError(
+                        'Relation type must be consistent for a given GAF')
+
     def arguments(self):
         """
-        Get all arguments in the GAF.
+        Get all arguments in the GAF, as a read-only mapping from node to attributes.
         """
-        return dict(filter(lambda x: x[1]['type'] == NodeType.ARGUMENT, self._G.nodes(data=True)))
+        return self._views[NodeType.ARGUMENT]
 
     def inputs(self):
         """
-        Get all inputs in the GAF.
+        Get all inputs in the GAF, as a read-only mapping from node to attributes.
         """
-        return dict(filter(lambda x: x[1]['type'] == NodeType.INPUT, self._G.nodes(data=True)))
+        return self._views[NodeType.INPUT]
 
     def conclusions(self):
         """
-        Get all conclusions in the GAF.
+        Get all conclusions in the GAF, as a read-only mapping from node to attributes.
         """
-        return dict(filter(lambda x: x[1]['type'] == NodeType.CONCLUSION, self._G.nodes(data=True)))
+        return self._views[NodeType.CONCLUSION]
 
     def relations_from(self, node):
         """
@@ -91,7 +315,8 @@ class GAF:
         """
         return list(self._G.edges(node, data=True))
 
-    def serialise(self, name='GAF', root_dir='', payloads_dir=''):
+    def serialise(self, name='GAF', root_dir='', payloads_dir='', compact=False, on_node=None,
+                  workers=None, encoder=None, store=None):
         """
         Serialise a GAF.
 
@@ -99,59 +324,134 @@ class GAF:
         root_dir        - path to the directory where all visualisations are saved. 
                           Don't forget to point the portal to this directory too!
         payloads_dir    - path to save the payloads relative to the root.
+        compact         - if True, skip indentation and key sorting, and use orjson
+                          when it is installed.
+        on_node         - optional callable, called with every (node, node object) pair
+                          as it is serialised.
+        workers         - number of threads encoding image payloads (0 to encode them
+                          in the calling thread). Defaults to DEFAULT_ENCODING_WORKERS.
+        encoder         - PayloadEncoder with the format and settings for image payloads.
+        store           - optional content-addressed store (e.g. argflow.portal.PayloadStore)
+                          to save payloads to instead of payloads_dir.
+        """
+        g = self._create_graph_obj(name)
+        g['nodes'] = {}
+        for node, node_obj in self.serialise_nodes(root_dir, payloads_dir, workers, encoder,
+                                                   store):
+            if on_node is not None:
+                on_node(node, node_obj)
+            g['nodes'][node] = node_obj
+        return _dumps(g, compact)
+
+    def serialise_to(self, f, name='GAF', root_dir='', payloads_dir='', compact=False,
+                     on_node=None, workers=None, encoder=None, store=None):
+        """
+        Serialise a GAF straight into a file, one node at a time, without building
+        the whole document in memory. The output is never indented.
+
+        f               - a file object opened for writing text.
+        name            - name of the GAF.
+        root_dir        - path to the directory where all visualisations are saved.
+        payloads_dir    - path to save the payloads relative to the root.
+        compact         - if True, skip key sorting and use orjson when it is installed.
+        on_node         - optional callable, called with every (node, node object) pair
+                          as it is serialised.
+        workers         - number of threads encoding image payloads (see serialise).
+        encoder         - PayloadEncoder with the format and settings for image payloads.
+        store           - optional content-addressed store to save payloads to.
         """
-        input_nodes, intermediate_nodes, conclusion_nodes = self.inputs(
-        ), self.arguments(), self.conclusions()
-        G_nodes = dict(self._G.nodes(data=True))
+        encode = (lambda obj: _dumps(obj, True)) if compact \
+            else (lambda obj: json.dumps(obj, sort_keys=True))
+        header = _dumps(self._create_graph_obj(name), True)
+        # Reopen the header object to append the nodes
+        f.write(header[:-1] + ',"nodes":{')
+        separator = ''
+        for node, node_obj in self.serialise_nodes(root_dir, payloads_dir, workers, encoder,
+                                                   store):
+            if on_node is not None:
+                on_node(node, node_obj)
+            f.write(f'{separator}{_dumps(str(node), True)}:{encode(node_obj)}')
+            separator = ','
+        f.write('}}')
+
+    def _create_graph_obj(self, name):
         g = {}
         g['name'] = name
-        g['input'] = [str(node) for node in input_nodes]
-        g['conclusion'] = [str(node) for node in conclusion_nodes]
-        nodes = {}
-        for node in input_nodes:
+        g['input'] = [str(node) for node in self.inputs()]
+        g['conclusion'] = [str(node) for node in self.conclusions()]
+        return g
+
+    def serialise_nodes(self, root_dir='', payloads_dir='', workers=None, encoder=None,
+                        store=None):
+        """
+        Generate (node, serialisable node object) pairs for every node of the GAF,
+        saving image payloads along the way. Payloads are all written by the time the
+        generator is exhausted.
+
+        root_dir        - path to the directory where all visualisations are saved.
+        payloads_dir    - path to save the payloads relative to the root. Payloads are
+                          named after the order they are saved in.
+        workers         - number of threads encoding image payloads (see serialise).
+        encoder         - PayloadEncoder with the format and settings for image payloads.
+        store           - optional content-addressed store (e.g. argflow.portal.PayloadStore)
+                          to save payloads to instead of payloads_dir.
+        """
+        with _PayloadSaver(root_dir, payloads_dir, encoder, workers, store) as saver:
+            # Nodes wait in a window until their payloads are resolved, keeping their order
+            window = deque()
+            for node, node_obj in self._create_node_objs(saver):
+                window.append((node, node_obj))
+                if len(window) > saver.window:
+                    yield self._resolve_node_obj(*window.popleft(), saver)
+            while window:
+                yield self._resolve_node_obj(*window.popleft(), saver)
+
+    def _resolve_node_obj(self, node, node_obj, saver):
+        if 'payload' in node_obj:
+            node_obj['payload'] = saver.resolve(node_obj['payload'])
+        return node, node_obj
+
+    def _create_node_objs(self, saver):
+        for node, data in self.inputs().items():
             children = {
-                v: self._create_child_obj('neutral') for _, v, data in self.relations_from(node)
+                v: self._create_child_obj('neutral') for _, v, _ in self.relations_from(node)
             }
-            nodes[node] = self._create_node_obj(
+            yield node, self._create_node_obj(
                 'input',
-                G_nodes[node]['payload'],
+                data['payload'],
                 children,
-                root_dir,
-                payloads_dir
+                saver
             )
-        for node in intermediate_nodes:
+        for node, data in self.arguments().items():
             children = {
-                v: self._create_child_obj(data['relation']) for _, v, data in self.relations_from(node)
+                v: self._create_child_obj(relation['relation']) for _, v, relation in self.relations_from(node)
             }
-            nodes[node] = self._create_node_obj(
+            yield node, self._create_node_obj(
                 'regular',
-                G_nodes[node]['payload'],
+                data['payload'],
                 children,
-                root_dir,
-                payloads_dir,
-                strength=G_nodes[node]['strength']
+                saver,
+                strength=data['strength']
             )
-        for node in conclusion_nodes:
-            nodes[node] = self._create_node_obj(
+        for node, data in self.conclusions().items():
+            node_obj = self._create_node_obj(
                 'conclusion',
-                Payload(str(G_nodes[node]['predicted_class']),
+                Payload(str(data['predicted_class']),
                         PayloadType.STRING),
                 {},
-                root_dir,
-                payloads_dir
+                saver
             )
-            nodes[node]['certainty'] = float(G_nodes[node]['confidence'] * 100)
-        g['nodes'] = nodes
-        return json.dumps(g, indent=4, sort_keys=True)
+            node_obj['certainty'] = float(data['confidence'] * 100)
+            yield node, node_obj
 
-    def _create_node_obj(self, node_type, payload, children, root_dir, payloads_dir, strength=None):
+    def _create_node_obj(self, node_type, payload, children, saver, strength=None):
         node = {}
         if not strength is None:
             node['strength'] = float(strength)
         node['node_type'] = node_type
         if not payload is None:
             payload_obj = self._create_payload(
-                payload, root_dir, payloads_dir)
+                payload, saver.root_dir, saver.payloads_dir, saver)
             node['content_type'] = payload.content_type
             node['payload'] = payload_obj
         node['children'] = children
@@ -162,33 +462,25 @@ class GAF:
         child['contribution_type'] = contribution_type
         return child
 
-    def _create_payload(self, payload, root_dir, payloads_dir):
+    def _create_payload(self, payload, root_dir, payloads_dir, saver=None):
         # Check if valid payload
         if not isinstance(payload, Payload):
             raise TypeError(f'Invalid or empty payload type: {type(payload)}')
+        if saver is None:
+            saver = _PayloadSaver(root_dir, payloads_dir, workers=0)
         # Generate payload object (for JSON serialisation) accordingly
         if payload.content_type == PayloadType.STRING:
             return payload.content
         elif payload.content_type == PayloadType.IMAGE:
-            filename = f'{time.time()}.jpg'
-            save_path = os.path.join(root_dir, payloads_dir, filename)
-            payload.content.save(save_path)
-            return os.path.join(payloads_dir, filename)
+            return saver.save(payload.content, saver.next_name())
         elif payload.content_type == PayloadType.IMAGE_PAIR:
             fst, snd = payload.content
-            # Save first image
-            filename_fst = f'{time.time()}_fst.jpg'
-            save_path_fst = os.path.join(root_dir, payloads_dir, filename_fst)
-            fst.save(save_path_fst)
-            # Save second image
-            filename_snd = f'{time.time()}_snd.jpg'
-            save_path_snd = os.path.join(root_dir, payloads_dir, filename_snd)
-            snd.save(save_path_snd)
+            name = saver.next_name()
             return {
                 'filter': {
-                    'payload': os.path.join(payloads_dir, filename_fst)
+                    'payload': saver.save(fst, f'{name}_fst')
                 },
                 'feature': {
-                    'payload': os.path.join(payloads_dir, filename_snd)
+                    'payload': saver.save(snd, f'{name}_snd')
                 }
             }
@@ -0,0 +1,170 @@
+import hashlib
+import pickle
+import types
+from collections import OrderedDict
+from enum import Enum
+
+import numpy as np
+
+from ..cache import DiskCache, default_cache_dir, model_fingerprint
+
+
+# Bump when the pickled form of influence graphs changes, so stale entries are not reused
+_CACHE_VERSION = 1
+
+
+class InfluenceCache:
+
+    def __init__(self, max_entries=128, disk_cache=False):
+        """
+        A cache of the results of InfluenceMapper.apply: the influence graph, predicted
+        class and confidence of an input. Given to a GAFExtractor, it lets explanations of
+        an input already seen (e.g. with another chi) skip all gradient work.
+
+        Results are keyed by a fingerprint of the model's architecture and weights, a hash
+        of the influence mapper's settings and a hash of the input. The most recently used
+        results are kept in memory, and optionally on disk, shared between processes.
+        Cached influence graphs are shared by every explanation of the input, so they must
+        not be changed.
+
+        max_entries     - the number of results kept in memory (0 to only use the disk).
+        disk_cache      - True for the default disk cache (in the user's cache directory),
+                          a DiskCache to use instead, or False to only cache in memory.
+        """
+        if max_entries < 0:
+            raise ValueError('max_entries must not be negative')
+        if disk_cache is True:
+            disk_cache = DiskCache(default_cache_dir('influences'))
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache or None
+        self._entries = OrderedDict()
+
+    def __getstate__(self):
+        # Results in memory aren't sent along when an extractor is pickled, e.g. to
+        # pipeline workers; the disk cache is shared anyway
+        state = dict(self.__dict__)
+        state['_entries'] = OrderedDict()
+        return state
+
+    def __len__(self):
+        return len(self._entries)
+
+    def apply(self, influence_mapper, model, x):
+        """
+        Get the result of influence_mapper.apply(model, x), computing it if not cached.
+        """
+        return self.apply_batch(influence_mapper, model, [x])[0]
+
+    def apply_batch(self, influence_mapper, model, xs):
+        """
+        Get the results of influence_mapper.apply_batch(model, xs), in the order of xs.
+        Only the inputs that aren't cached are passed to the mapper, in one batch.
+        """
+        # The model and mapper are hashed once for the whole batch
+        prefix = self._key_prefix(influence_mapper, model)
+        keys = [prefix + _input_digest(x) for x in xs]
+        results = [self.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = influence_mapper.apply_batch(model, [xs[i] for i in missing])
+            for i, result in zip(missing, computed):
+                results[i] = tuple(result)
+                self.put(keys[i], results[i])
+        return results
+
+    def key(self, influence_mapper, model, x):
+        """
+        Get the key of the result of an influence mapper for a model and an input.
+        """
+        return self._key_prefix(influence_mapper, model) + _input_digest(x)
+
+    def _key_prefix(self, influence_mapper, model):
+        return (f'influences/v{_CACHE_VERSION}/{model_fingerprint(model)}/'
+                f'{_mapper_digest(influence_mapper)}/')
+
+    def get(self, key):
+        """
+        Get the (influences, predicted_class, confidence) stored under a key, or None.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.disk_cache is None:
+            return None
+        data = self.disk_cache.get(key)
+        if data is None:
+            return None
+        result = pickle.loads(data)
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        """
+        Store an (influences, predicted_class, confidence) under a key.
+        """
+        self._remember(key, result)
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        """
+        Forget every result, in memory and on disk.
+        """
+        self._entries.clear()
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+
+    def _remember(self, key, result):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _mapper_digest(influence_mapper):
+    # Mappers are hashed by their type and settings (e.g. the number of filters), in a
+    # canonical form, as pickles of sets and dicts can differ between processes. Mappers
+    # defining __getstate__ are hashed by that state, so they can leave out what isn't a
+    # setting
+    getstate = getattr(influence_mapper, '__getstate__', None)
+    state = getstate() if getstate is not None else vars(influence_mapper)
+    data = _canonical((type(influence_mapper), state or {}))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+def _canonical(value):
+    """
+    Get a string describing a value, the same in every process.
+    """
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, Enum):
+        return f'{_canonical(type(value))}.{value.name}'
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType)):
+        return f'{value.__module__}.{value.__qualname__}'
+    if isinstance(value, np.ndarray):
+        return f'array({_input_digest(value)})'
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}({", ".join(map(_canonical, value))})'
+    if isinstance(value, (set, frozenset)):
+        return f'{type(value).__name__}({", ".join(sorted(map(_canonical, value)))})'
+    if isinstance(value, dict):
+        items = sorted(f'{_canonical(k)}: {_canonical(v)}' for k, v in value.items())
+        return f'{{{", ".join(items)}}}'
+    if hasattr(value, '__dict__'):
+        return f'{_canonical(type(value))}({_canonical(vars(value))})'
+    return repr(value)
+
+
+def _input_digest(x):
+    x = np.asarray(x)
+    if x.dtype.hasobject:
+        # The bytes of object arrays are pointers, so hash the objects themselves
+        data = pickle.dumps(x.tolist(), protocol=4)
+    else:
+        data = np.ascontiguousarray(x).tobytes()
+    digest = hashlib.sha256(data)
+    digest.update(f'{x.dtype.str}{x.shape}'.encode('utf-8'))
+    return digest.hexdigest()
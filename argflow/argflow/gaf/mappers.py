@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from ..influence import NodeColumns
+
 
 class ExtractorMapper(ABC):
 
@@ -20,6 +22,19 @@ class InfluenceMapper(ExtractorMapper):
     def apply(self, model, x):
         pass
 
+    def apply_batch(self, model, xs):
+        """
+        Generate the influence graphs of many inputs at once.
+        Returns a list of (influences, predicted_class, confidence) tuples, in the order of xs.
+
+        Override this when the model can process the inputs together, e.g. in one
+        forward and backward pass.
+
+        model           - the model in question.
+        xs              - a sequence of inputs, each as accepted by apply.
+        """
+        return [self.apply(model, x) for x in xs]
+
 
 class CharacterisationMapper(ExtractorMapper):
 
@@ -30,6 +45,18 @@ class CharacterisationMapper(ExtractorMapper):
     def apply(self, node):
         pass
 
+    def apply_many(self, nodes):
+        """
+        Get the characterisations of many nodes at once.
+        Returns a sequence (e.g. an array) with one value per node, in order.
+
+        Override this when the characterisations can be computed on whole columns, e.g. with
+        NumPy operations on the gradients of every node.
+
+        nodes           - a NodeColumns of the nodes.
+        """
+        return [self.apply(node) for node in nodes.rows]
+
 
 class StrengthMapper(ExtractorMapper):
 
@@ -39,3 +66,15 @@ class StrengthMapper(ExtractorMapper):
     @abstractmethod
     def apply(self, node):
         pass
+
+    def apply_many(self, nodes):
+        """
+        Get the strengths of many nodes at once.
+        Returns a sequence (e.g. an array) with one value per node, in order.
+
+        Override this when the strengths can be computed on whole columns, e.g. with
+        NumPy operations on the gradients of every node.
+
+        nodes           - a NodeColumns of the nodes.
+        """
+        return [self.apply(node) for node in nodes.rows]
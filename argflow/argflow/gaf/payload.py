@@ -1,7 +1,16 @@
+import io
+import os
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
 from PIL import Image
 
 
+# Default number of threads encoding image payloads during serialisation
+DEFAULT_ENCODING_WORKERS = min(8, os.cpu_count() or 1)
+
+
 class PayloadType(str, Enum):
     STRING = 'string'
     IMAGE = 'image'
@@ -27,3 +36,111 @@ class Payload:
         if isinstance(other, Payload):
             return self.content == other.content and self.content_type == other.content_type
         return False
+
+
+class PayloadEncoder:
+
+    def __init__(self, format='JPEG', extension='jpg', **options):
+        """
+        Settings used to save image payloads when a GAF is serialised.
+
+        format          - the PIL image format to encode with.
+        extension       - the file extension of saved payloads.
+        options         - extra keyword arguments for PIL.Image.save, e.g. quality=90.
+        """
+        self.format = format
+        self.extension = extension
+        self.options = options
+
+    def save(self, image, path):
+        image.save(path, format=self.format, **self.options)
+
+    def encode(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.format, **self.options)
+        return buffer.getvalue()
+
+
+class _PayloadSaver:
+    """
+    Saves the image payloads of one serialisation on a bounded thread pool. PIL releases
+    the GIL while encoding, so images are encoded concurrently while the caller carries
+    on building node objects.
+
+    Without a store, file names only depend on the order payloads are saved in. With a
+    content-addressed store (see argflow.portal.PayloadStore), the path of a payload is
+    only known once it is encoded, so save returns a Future that resolve swaps for the path.
+    """
+
+    def __init__(self, root_dir, payloads_dir, encoder=None, workers=None, store=None):
+        self.root_dir = root_dir
+        self.payloads_dir = payloads_dir
+        self.encoder = PayloadEncoder() if encoder is None else encoder
+        self.workers = DEFAULT_ENCODING_WORKERS if workers is None else workers
+        self.store = store
+        # How many serialised nodes may wait on their payloads before being handed out
+        self.window = 2 * max(self.workers, 1)
+        self._executor = None
+        self._pending = deque()
+        self._count = 0
+
+    def __enter__(self):
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='payload-encoder')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            while self._pending:
+                future = self._pending.popleft()
+                if exc_type is None:
+                    future.result()
+                else:
+                    future.cancel()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    def next_name(self):
+        """
+        Get a file name (without extension) for the next payload.
+        """
+        self._count += 1
+        return str(self._count - 1)
+
+    def save(self, image, name):
+        """
+        Queue an image to be saved. Returns its path relative to the root directory, or a
+        Future of it when saving to a store.
+        """
+        if self.store is None:
+            filename = f'{name}.{self.encoder.extension}'
+            task = (self.encoder.save, image,
+                    os.path.join(self.root_dir, self.payloads_dir, filename))
+            path = os.path.join(self.payloads_dir, filename)
+        else:
+            task = (self._put, image)
+            path = None
+        if self._executor is None:
+            result = task[0](*task[1:])
+            return result if path is None else path
+        # Bound the number of queued images, surfacing encoding errors early
+        if len(self._pending) >= 2 * self.workers:
+            self._pending.popleft().result()
+        future = self._executor.submit(*task)
+        self._pending.append(future)
+        return future if path is None else path
+
+    def resolve(self, payload_obj):
+        """
+        Replace the Futures in a serialised payload with the paths they resolve to.
+        """
+        if isinstance(payload_obj, Future):
+            return payload_obj.result()
+        if isinstance(payload_obj, dict):
+            return {key: self.resolve(value) for key, value in payload_obj.items()}
+        return payload_obj
+
+    def _put(self, image):
+        return self.store.put(self.encoder.encode(image), self.encoder.extension)
@@ -1 +1 @@
-from .graph import InfluenceGraph
\ No newline at end of file
+from .graph import InfluenceBackend, InfluenceGraph, NodeColumns
@@ -0,0 +1,506 @@
+import numpy as np
+
+from collections.abc import Mapping, Sequence, Set
+
+from .._columns import _Column
+
+
+# Edge keys pack the slots of both endpoints into one integer
+_KEY_SHIFT = 32
+
+
+def _numeric(values):
+    """
+    Get values as a NumPy array if they are numbers (or booleans), else None.
+    """
+    values = np.asarray(values)
+    return values if values.dtype.kind in 'biuf' else None
+
+
+# Python types of the kinds of numbers a column can mix, by code
+_KINDS = (bool, int, float)
+_KIND_CODES = {'b': 0, 'i': 1, 'u': 1, 'f': 2}
+
+
+class _Attributes:
+    """
+    Named attribute columns over a growing number of rows (nodes or edges). Numeric
+    attributes live in typed NumPy columns and any other values in Python lists. Every
+    attribute also records which rows have it.
+
+    A column mixing kinds of numbers (e.g. an integer gradient among floats) is widened,
+    and records the kind of each row, so values read back with the type they were given.
+    """
+
+    def __init__(self):
+        self._size = 0
+        self._values = {}   # name -> _Column, or list for non-numeric attributes
+        self._present = {}  # name -> _Column of booleans
+        self._kinds = {}    # name -> _Column of codes into _KINDS, for mixed columns
+
+    def extend(self, n, columns):
+        """
+        Add n rows, given a sequence of n values for each of their attributes.
+        """
+        for name, values in columns.items():
+            if len(values) != n:
+                raise ValueError('Every attribute column must have one value per row')
+            array = _numeric(values)
+            if array is not None and array.ndim == 1:
+                stored = self._prepare(name, array.dtype)
+                if isinstance(stored, _Column):
+                    stored.extend(array)
+                    if name in self._kinds:
+                        self._kinds[name].extend(
+                            np.full(n, _KIND_CODES[array.dtype.kind], dtype=np.int8))
+                else:
+                    stored.extend(array.tolist())
+            else:
+                # Arrays of per-row arrays (e.g. gradient maps) keep their rows as arrays
+                if isinstance(values, np.ndarray):
+                    values = values.tolist() if values.ndim == 1 else list(values)
+                self._prepare(name, None).extend(values)
+            self._present[name].extend(np.ones(n, dtype=np.bool_))
+        for name in self._values:
+            if name not in columns:
+                self._pad(name, n)
+        self._size += n
+
+    def set(self, row, attributes):
+        """
+        Update some attributes of a row, keeping the others.
+        """
+        for name, value in attributes.items():
+            array = _numeric(value)
+            stored = self._prepare(name, array.dtype) \
+                if array is not None and array.ndim == 0 else self._prepare(name, None)
+            if isinstance(stored, _Column):
+                stored.view()[row] = array
+                if name in self._kinds:
+                    self._kinds[name].view()[row] = _KIND_CODES[array.dtype.kind]
+            else:
+                stored[row] = value
+            self._present[name].view()[row] = True
+
+    def clear(self, row):
+        """
+        Remove every attribute of a row.
+        """
+        for name, stored in self._values.items():
+            self._present[name].view()[row] = False
+            if not isinstance(stored, _Column):
+                stored[row] = None
+
+    def row(self, row):
+        """
+        Materialise the attribute dict of a row.
+        """
+        attributes = {}
+        for name, stored in self._values.items():
+            # Columns are read through their backing arrays to skip building views per call
+            if self._present[name]._data[row]:
+                if isinstance(stored, _Column):
+                    value = stored._data[row].item()
+                    kinds = self._kinds.get(name)
+                    attributes[name] = value if kinds is None \
+                        else _KINDS[kinds._data[row]](value)
+                else:
+                    attributes[name] = stored[row]
+        return attributes
+
+    def column(self, name, rows):
+        """
+        Get the values of an attribute for some rows, as an array, or None if any of
+        the rows doesn't have it.
+        """
+        if name not in self._values or not self._present[name].view()[rows].all():
+            return None
+        stored = self._values[name]
+        if isinstance(stored, _Column):
+            return stored.view()[rows]
+        return np.asarray([stored[row] for row in rows])
+
+    def names(self):
+        return list(self._values)
+
+    def _prepare(self, name, dtype):
+        """
+        Get the storage of an attribute, made able to hold values of dtype (or any
+        Python objects, if dtype is None). New attributes are absent from existing rows.
+        """
+        stored = self._values.get(name)
+        if stored is None:
+            self._values[name] = [] if dtype is None else _Column(dtype, 0)
+            self._present[name] = _Column(np.bool_, False)
+            self._pad(name, self._size)
+        elif isinstance(stored, _Column):
+            current = stored.view().dtype
+            if dtype is None:
+                # Non-numeric values turn a numeric attribute into a generic one
+                values = stored.view().tolist()
+                kinds = self._kinds.pop(name, None)
+                if kinds is not None:
+                    values = [_KINDS[kind](value)
+                              for kind, value in zip(kinds.view().tolist(), values)]
+                self._values[name] = values
+            else:
+                wider = np.result_type(current, dtype)
+                if name not in self._kinds and \
+                        _KIND_CODES[current.kind] != _KIND_CODES[np.dtype(dtype).kind]:
+                    # Mixing kinds, so remember the kind of the rows stored so far
+                    kinds = _Column(np.int8, 0, capacity=max(len(stored), 16))
+                    kinds.extend(np.full(len(stored), _KIND_CODES[current.kind],
+                                         dtype=np.int8))
+                    self._kinds[name] = kinds
+                if wider != current:
+                    column = _Column(wider, 0, capacity=max(len(stored), 16))
+                    column.extend(stored.view())
+                    self._values[name] = column
+        return self._values[name]
+
+    def _pad(self, name, n):
+        stored = self._values[name]
+        if isinstance(stored, _Column):
+            stored.extend(np.zeros(n, dtype=stored.view().dtype))
+            if name in self._kinds:
+                self._kinds[name].extend(np.zeros(n, dtype=np.int8))
+        else:
+            stored.extend([None] * n)
+        self._present[name].extend(np.zeros(n, dtype=np.bool_))
+
+
+class ColumnarDiGraph:
+    """
+    An array-backed directed graph holding the nodes and influences of an InfluenceGraph.
+
+    Node IDs are interned to integer slots. Numeric node attributes (gradients, indices)
+    live in typed NumPy columns indexed by slot, and other attributes (e.g. layer names)
+    in per-attribute lists. Influences are kept in parallel source/destination arrays
+    with their own attribute columns, and in- and out-degrees are counted per node.
+    Implements the subset of the networkx DiGraph interface used by InfluenceGraph.
+    """
+
+    def __init__(self):
+        self._ids = {}      # node -> slot
+        self._nodes = []    # slot -> node
+        self._alive = _Column(np.bool_, False)
+        self._node_attributes = _Attributes()
+        self._in_degree = _Column(np.int64, 0)
+        self._out_degree = _Column(np.int64, 0)
+        self._src = _Column(np.int64, -1)
+        self._dst = _Column(np.int64, -1)
+        self._edge_alive = _Column(np.bool_, False)
+        self._edge_attributes = _Attributes()
+        # Packed (source slot, destination slot) -> row of each live edge. Only built
+        # once single edges are looked up, as bulk additions are checked on the arrays.
+        self._edge_rows = None
+        self._csr = None
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def nodes(self):
+        """
+        A read-only mapping from each node to its (materialised) attribute dict.
+        """
+        return _NodeView(self)
+
+    def add_node(self, node, **attributes):
+        """
+        Add a node, or update the attributes of an existing one.
+        """
+        slot = self._ids.get(node)
+        if slot is None:
+            slot = self._new_slots([node])[0]
+        self._node_attributes.set(slot, attributes)
+
+    def add_nodes_from_arrays(self, nodes, **columns):
+        """
+        Add many new nodes at once.
+
+        nodes           - a sequence of node IDs, none of which may already be in the graph.
+        columns         - for each attribute, a sequence (e.g. an array) of per-node values.
+        """
+        nodes = list(nodes)
+        start = len(self._nodes)
+        ids = dict(zip(nodes, range(start, start + len(nodes))))
+        if len(ids) != len(nodes) or not self._ids.keys().isdisjoint(ids):
+            raise ValueError('Node IDs must be unique and not already in the graph')
+        self._node_attributes.extend(len(nodes), columns)
+        self._new_slots(nodes, attributes=False)
+
+    def remove_node(self, node):
+        slot = self._ids.pop(node)
+        self._alive.view()[slot] = False
+        self._node_attributes.clear(slot)
+        src, dst = self._src.view(), self._dst.view()
+        alive = self._edge_alive.view()
+        touching = np.flatnonzero(alive & ((src == slot) | (dst == slot)))
+        np.subtract.at(self._out_degree.view(), src[touching], 1)
+        np.subtract.at(self._in_degree.view(), dst[touching], 1)
+        alive[touching] = False
+        if self._edge_rows is not None:
+            for key in (src[touching] << _KEY_SHIFT | dst[touching]).tolist():
+                del self._edge_rows[key]
+        for row in touching:
+            self._edge_attributes.clear(row)
+        self._csr = None
+
+    def add_edge(self, u, v, **attributes):
+        """
+        Add an influence, or update the attributes of an existing one. Missing endpoints
+        are added as nodes without attributes.
+        """
+        u_slot, v_slot = self._slot_or_new(u), self._slot_or_new(v)
+        row = self._edge_index().get(u_slot << _KEY_SHIFT | v_slot)
+        if row is None:
+            self._append_edges(np.array([u_slot]), np.array([v_slot]), {})
+            row = len(self._src) - 1
+        self._edge_attributes.set(row, attributes)
+
+    def add_edges_from_arrays(self, src, dst, **columns):
+        """
+        Add many influences at once. Both endpoints of every influence must be in the graph.
+
+        src             - a sequence of source node IDs.
+        dst             - a sequence of destination node IDs.
+        columns         - for each attribute, a sequence of per-influence values.
+        """
+        ids = self._ids
+        n = len(src)
+        if len(dst) != n:
+            raise ValueError('src and dst must have the same length')
+        src_slots = np.fromiter((ids[u] for u in src), dtype=np.int64, count=n)
+        dst_slots = np.fromiter((ids[v] for v in dst), dtype=np.int64, count=n)
+        keys = src_slots << _KEY_SHIFT | dst_slots
+        if len(np.unique(keys)) != n or np.isin(keys, self._edge_keys()).any():
+            # Repeated influences update the existing ones, one at a time
+            for i, (u, v) in enumerate(zip(src, dst)):
+                self.add_edge(u, v, **{name: values[i] for name, values in columns.items()})
+            return
+        self._append_edges(src_slots, dst_slots, columns)
+
+    def remove_edge(self, u, v):
+        row = self._edge_index().pop(self._ids[u] << _KEY_SHIFT | self._ids[v], None)
+        if row is None:
+            raise KeyError(f'The influence {u}-{v} is not in the graph')
+        self._edge_alive.view()[row] = False
+        self._edge_attributes.clear(row)
+        self._out_degree.view()[self._ids[u]] -= 1
+        self._in_degree.view()[self._ids[v]] -= 1
+        self._csr = None
+
+    def in_degree(self, node):
+        return int(self._in_degree.view()[self._ids[node]])
+
+    def out_degree(self, node):
+        return int(self._out_degree.view()[self._ids[node]])
+
+    def edges(self, node=None, data=False):
+        """
+        Get a view of the influences leaving a node (or of all influences), grouped by
+        source node and in insertion order.
+        """
+        return _EdgeView(self, node, data)
+
+    def typed_nodes(self, has_in, has_out):
+        """
+        Get a live view of the nodes with (or without) influences entering and leaving them.
+        """
+        return _DegreeNodes(self, has_in, has_out)
+
+    def node_columns(self, nodes):
+        """
+        Get the slots of some nodes, and a dict mapping each attribute all of them have
+        to an array of its values.
+        """
+        slots = np.fromiter((self._ids[node] for node in nodes), dtype=np.int64)
+        columns = {}
+        for name in self._node_attributes.names():
+            column = self._node_attributes.column(name, slots)
+            if column is not None:
+                columns[name] = column
+        return slots, columns
+
+    def node_attributes(self, slot):
+        return self._node_attributes.row(slot)
+
+    def _new_slots(self, nodes, attributes=True):
+        start = len(self._nodes)
+        n = len(nodes)
+        self._ids.update(zip(nodes, range(start, start + n)))
+        self._nodes.extend(nodes)
+        self._alive.extend(np.ones(n, dtype=np.bool_))
+        self._in_degree.extend(np.zeros(n, dtype=np.int64))
+        self._out_degree.extend(np.zeros(n, dtype=np.int64))
+        if attributes:
+            self._node_attributes.extend(n, {})
+        # Slots are never reused, but the CSR index must grow with them
+        self._csr = None
+        return list(range(start, start + n))
+
+    def _slot_or_new(self, node):
+        slot = self._ids.get(node)
+        return self._new_slots([node])[0] if slot is None else slot
+
+    def _append_edges(self, src_slots, dst_slots, columns):
+        n = len(src_slots)
+        start = len(self._src)
+        self._src.extend(src_slots)
+        self._dst.extend(dst_slots)
+        self._edge_alive.extend(np.ones(n, dtype=np.bool_))
+        self._edge_attributes.extend(n, columns)
+        if self._edge_rows is not None:
+            self._edge_rows.update(zip((src_slots << _KEY_SHIFT | dst_slots).tolist(),
+                                       range(start, start + n)))
+        np.add.at(self._out_degree.view(), src_slots, 1)
+        np.add.at(self._in_degree.view(), dst_slots, 1)
+        self._csr = None
+
+    def _edge_keys(self):
+        """
+        Get the packed keys of the live edges.
+        """
+        alive = self._edge_alive.view()
+        return self._src.view()[alive] << _KEY_SHIFT | self._dst.view()[alive]
+
+    def _edge_index(self):
+        if self._edge_rows is None:
+            rows = np.flatnonzero(self._edge_alive.view())
+            self._edge_rows = dict(zip(self._edge_keys().tolist(), rows.tolist()))
+        return self._edge_rows
+
+    def _compile(self):
+        """
+        Build (and cache) the CSR adjacency as (indptr, edge rows ordered by source).
+        """
+        if self._csr is None:
+            rows = np.flatnonzero(self._edge_alive.view())
+            src = self._src.view()[rows]
+            rows = rows[np.argsort(src, kind='stable')]
+            indptr = np.zeros(len(self._nodes) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=len(self._nodes)), out=indptr[1:])
+            self._csr = (indptr, rows)
+        return self._csr
+
+
+class _NodeView(Mapping):
+    """
+    A read-only, live view of the nodes of a ColumnarDiGraph. Attribute dicts are built
+    on access, so changing them doesn't change the graph.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node):
+        return self._graph._node_attributes.row(self._graph._ids[node])
+
+    def __iter__(self):
+        graph = self._graph
+        return (graph._nodes[slot] for slot in np.flatnonzero(graph._alive.view()))
+
+    def __len__(self):
+        return len(self._graph._ids)
+
+    def __contains__(self, node):
+        return node in self._graph._ids
+
+
+class _NodeRows(Sequence):
+    """
+    The attribute dicts of some nodes of a ColumnarDiGraph, built on access.
+    """
+
+    def __init__(self, graph, slots):
+        self._graph = graph
+        self._slots = slots
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._graph._node_attributes.row(self._slots[i])
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class _EdgeView:
+    """
+    A live view of the influences of a ColumnarDiGraph, as (u, v) or (u, v, attributes).
+    """
+
+    def __init__(self, graph, node, data):
+        self._graph = graph
+        self._node = node
+        self._data = data
+
+    def _rows(self):
+        indptr, rows = self._graph._compile()
+        if self._node is None:
+            return rows
+        slot = self._graph._ids[self._node]
+        return rows[indptr[slot]:indptr[slot + 1]]
+
+    def __iter__(self):
+        graph = self._graph
+        nodes = graph._nodes
+        rows = self._rows()
+        src, dst = graph._src.view()[rows].tolist(), graph._dst.view()[rows].tolist()
+        for row, u, v in zip(rows.tolist(), src, dst):
+            if self._data:
+                yield nodes[u], nodes[v], graph._edge_attributes.row(row)
+            else:
+                yield nodes[u], nodes[v]
+
+    def __len__(self):
+        return len(self._rows())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self)})'
+
+
+class _DegreeNodes(Set):
+    """
+    A read-only, live view of the nodes of a ColumnarDiGraph selected by whether they
+    have influences entering and leaving them, read from the degree counters.
+    """
+
+    def __init__(self, graph, has_in, has_out):
+        """
+        has_in          - True, False, or None to ignore influences entering nodes.
+        has_out         - True, False, or None to ignore influences leaving nodes.
+        """
+        self._graph = graph
+        self._has_in = has_in
+        self._has_out = has_out
+
+    def _matches(self, in_degree, out_degree):
+        return (self._has_in is None or (in_degree > 0) == self._has_in) & \
+            (self._has_out is None or (out_degree > 0) == self._has_out)
+
+    def _mask(self):
+        graph = self._graph
+        return graph._alive.view() & self._matches(graph._in_degree.view(),
+                                                   graph._out_degree.view())
+
+    def __contains__(self, node):
+        slot = self._graph._ids.get(node)
+        if slot is None:
+            return False
+        return bool(self._matches(self._graph._in_degree.view()[slot],
+                                  self._graph._out_degree.view()[slot]))
+
+    def __iter__(self):
+        nodes = self._graph._nodes
+        return (nodes[slot] for slot in np.flatnonzero(self._mask()))
+
+    def __len__(self):
+        return int(np.count_nonzero(self._mask()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self)})'
@@ -1,60 +1,237 @@
 import networkx as nx
+import numpy as np
+
+from collections.abc import Mapping, Sequence
+from enum import Enum
+from types import MappingProxyType
+
+from .columnar import ColumnarDiGraph, _NodeRows
+
+
+class InfluenceBackend(str, Enum):
+
+    NETWORKX = 'networkx'
+    COLUMNAR = 'columnar'
+
+
+class NodeColumns(Mapping):
+
+    def __init__(self, nodes, columns=None):
+        """
+        The attributes of many nodes, by column: maps each attribute every node has to an
+        array with its value for every node, in order. Columns are built on first access,
+        unless given. The node dicts themselves are kept in rows.
+
+        nodes           - a sequence of node attribute dicts.
+        columns         - optional dict of the columns, if they are already at hand (e.g.
+                          in a columnar InfluenceGraph). nodes may then build its dicts
+                          on access.
+        """
+        self.rows = nodes if isinstance(nodes, Sequence) else list(nodes)
+        self._columns = {}
+        if columns is not None:
+            self._columns.update(columns)
+            self._keys = list(columns)
+        elif self.rows:
+            keys = set(self.rows[0])
+            for row in self.rows[1:]:
+                keys.intersection_update(row)
+            self._keys = [key for key in self.rows[0] if key in keys]
+        else:
+            self._keys = []
+
+    @property
+    def size(self):
+        """
+        The number of nodes.
+        """
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if key not in self._columns:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._columns[key] = np.asarray([row[key] for row in self.rows])
+        return self._columns[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
 
 
 class InfluenceGraph:
 
-    def __init__(self):
-        self._G = nx.DiGraph()
+    def __init__(self, backend=InfluenceBackend.NETWORKX):
+        """
+        backend         - storage backend, either InfluenceBackend.NETWORKX (a networkx
+                          DiGraph) or InfluenceBackend.COLUMNAR (NumPy attribute columns
+                          and edge arrays, for large graphs).
+        """
+        self._backend = InfluenceBackend(backend)
+        if self._backend == InfluenceBackend.COLUMNAR:
+            self._G = ColumnarDiGraph()
+        else:
+            self._G = nx.DiGraph()
+            # The starting, intermediate and terminal nodes, as insertion-ordered sets kept
+            # up to date as nodes and influences are added and removed
+            self._starting = {}
+            self._intermediate = {}
+            self._terminal = {}
+        self._typed = self._typed_views()
+
+    def __getstate__(self):
+        # Dict key views can't be pickled, and are rebuilt on unpickling
+        state = dict(self.__dict__)
+        del state['_typed']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._typed = self._typed_views()
+
+    @property
+    def backend(self):
+        return self._backend
 
     def add_node(self, node, **attributes):
+        new = node not in self._G
         self._G.add_node(node, **attributes)
+        if new:
+            self._retype(node)
+
+    def add_nodes_from_arrays(self, nodes, **attributes):
+        """
+        Add many new nodes at once.
+
+        nodes           - a sequence of node IDs, none of which may already be in the graph.
+        attributes      - for each attribute, a sequence of per-node values, e.g. a whole
+                          gradient vector.
+        """
+        nodes = list(nodes)
+        if self._backend == InfluenceBackend.COLUMNAR:
+            self._G.add_nodes_from_arrays(nodes, **attributes)
+            return
+        if len(set(nodes)) != len(nodes) or any(node in self._G for node in nodes):
+            raise ValueError('Node IDs must be unique and not already in the graph')
+        if any(len(values) != len(nodes) for values in attributes.values()):
+            raise ValueError('Every attribute must have one value per node')
+        self._G.add_nodes_from(
+            (node, {name: values[i] for name, values in attributes.items()})
+            for i, node in enumerate(nodes))
+        for node in nodes:
+            self._retype(node)
 
     def remove_node(self, node):
+        if self._backend == InfluenceBackend.COLUMNAR:
+            self._G.remove_node(node)
+            return
+        neighbours = set(self._G.predecessors(node)).union(self._G.successors(node))
         self._G.remove_node(node)
+        for partition in (self._starting, self._intermediate, self._terminal):
+            partition.pop(node, None)
+        neighbours.discard(node)
+        for neighbour in neighbours:
+            self._retype(neighbour)
 
     def add_influence(self, u, v, **attributes):
         self._G.add_edge(u, v, **attributes)
+        self._retype(u)
+        self._retype(v)
+
+    def add_influences_from_arrays(self, u, v, **attributes):
+        """
+        Add many influences at once. Both ends of every influence must be in the graph.
+
+        u               - a sequence of the nodes the influences leave.
+        v               - a sequence of the nodes the influences enter.
+        attributes      - for each attribute, a sequence of per-influence values.
+        """
+        u, v = list(u), list(v)
+        if len(u) != len(v) or any(len(values) != len(u) for values in attributes.values()):
+            raise ValueError('u, v and every attribute must have one entry per influence')
+        if not all(node in self._G for node in set(u).union(v)):
+            raise ValueError('Every influence must connect nodes of the graph')
+        if self._backend == InfluenceBackend.COLUMNAR:
+            self._G.add_edges_from_arrays(u, v, **attributes)
+            return
+        self._G.add_edges_from(
+            (u[i], v[i], {name: values[i] for name, values in attributes.items()})
+            for i in range(len(u)))
+        for node in set(u).union(v):
+            self._retype(node)
 
     def remove_influence(self, u, v):
         self._G.remove_edge(u, v)
+        self._retype(u)
+        self._retype(v)
 
     def nodes(self):
         """
-        Get all nodes in the graph.
+        Get all nodes in the graph, as a read-only, live mapping from node to attributes.
+        """
+        return MappingProxyType(self._G.nodes)
+
+    def node_columns(self, nodes):
+        """
+        Get the attributes of some nodes by column, as a NodeColumns.
+
+        nodes           - a sequence of nodes.
         """
-        return dict(self._G.nodes(data=True))
+        if self._backend == InfluenceBackend.COLUMNAR:
+            slots, columns = self._G.node_columns(nodes)
+            return NodeColumns(_NodeRows(self._G, slots), columns=columns)
+        return NodeColumns([self._G.nodes[node] for node in nodes])
 
     def influences(self):
         """
-        Get all influences (edges) in the graph.
+        Get all influences (edges) in the graph, as a live view of (u, v, attributes).
         """
-        return list(self._G.edges(data=True))
+        return self._G.edges(data=True)
 
     def influences_from(self, node):
         """
-        Get all influences (edges) leaving a node.
+        Get all influences (edges) leaving a node, as a live view of (u, v, attributes).
 
         node            - a node.
         """
-        return list(self._G.edges(node, data=True))
+        return self._G.edges(node, data=True)
 
     def get_typed_nodes(self):
         """
-        Infer node types (starting, intermediate, terminal) from
-        what's connected to what.
+        Get the node types (starting, intermediate, terminal) inferred from
+        what's connected to what, as three read-only, live views.
+        The types are maintained as the graph changes, so this takes constant time.
 
         Starting nodes have no edges going into them.
         Terminal nodes have no edges leaving them.
         Intermediate have nodes entering and leaving them.
         """
-        start_nodes = set(self._G.nodes())
-        non_start_nodes = set()
-        terminal_nodes = set(self._G.nodes())
-        for u, v in list(self._G.edges):
-            if v in start_nodes:
-                start_nodes.remove(v)
-                non_start_nodes.add(v)
-            if u in terminal_nodes:
-                terminal_nodes.remove(u)
-        non_start_nodes = non_start_nodes.difference(terminal_nodes)
-        return list(start_nodes), list(non_start_nodes), list(terminal_nodes)
+        return self._typed
+
+    def _typed_views(self):
+        if self._backend == InfluenceBackend.COLUMNAR:
+            # Node types are read from the degree counters of the columnar graph
+            return (self._G.typed_nodes(has_in=False, has_out=None),
+                    self._G.typed_nodes(has_in=True, has_out=True),
+                    self._G.typed_nodes(has_in=None, has_out=False))
+        return self._starting.keys(), self._intermediate.keys(), self._terminal.keys()
+
+    def _retype(self, node):
+        """
+        Update the type of a node after its edges changed.
+        """
+        if self._backend == InfluenceBackend.COLUMNAR:
+            # The columnar graph counts degrees itself
+            return
+        # Degrees are the sizes of networkx's adjacency dicts, so they are O(1) to read
+        has_in = bool(self._G.pred[node])
+        has_out = bool(self._G.succ[node])
+        for partition, member in ((self._starting, not has_in),
+                                  (self._intermediate, has_in and has_out),
+                                  (self._terminal, not has_out)):
+            if member:
+                partition.setdefault(node, None)
+            else:
+                partition.pop(node, None)
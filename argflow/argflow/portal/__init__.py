@@ -1,2 +1,4 @@
 from .writer import Writer
-from .generator import ExplanationGenerator
\ No newline at end of file
+from .generator import ExplanationGenerator
+from .payload_store import PayloadStore
+from .pipeline import ExplanationPipeline
@@ -1,4 +1,17 @@
+import os
+
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+# Default number of loaded models each process keeps
+DEFAULT_MODEL_CACHE_SIZE = 4
+
+_models = OrderedDict()
+_model_cache_size = DEFAULT_MODEL_CACHE_SIZE
+_progress_reporter = None
+_influence_cache = None
+_influence_disk_cache = False
 
 
 class ExplanationGenerator(ABC):
@@ -12,3 +25,97 @@ class ExplanationGenerator(ABC):
         chi_value: str,
     ):
         pass
+
+    def progress(self, stage):
+        """
+        Report that generation reached a stage, e.g. 'model_loading' or 'serialisation'.
+        The portal streams the stages of a job to the client that requested it, and may
+        cancel the job here by raising an exception. Does nothing outside the portal.
+
+        stage           - the name of the stage.
+        """
+        if _progress_reporter is not None:
+            _progress_reporter(stage)
+
+    def load_model(self, path):
+        """
+        Load a saved Keras model, reusing it if this process loaded it before and it hasn't
+        changed on disk since. The most recently used models of the process are kept, so
+        generators run by long-lived portal workers only load each model once.
+
+        path            - the path of the saved model, a file or a directory.
+        """
+        key = (os.path.abspath(path), _modification_time(path))
+        if key in _models:
+            _models.move_to_end(key)
+            return _models[key]
+        import keras
+        model = keras.models.load_model(path)
+        # Older versions of a model changed on disk won't be asked for again
+        for stale in [cached for cached in _models if cached[0] == key[0]]:
+            del _models[stale]
+        _models[key] = model
+        while len(_models) > _model_cache_size:
+            _models.popitem(last=False)
+        return model
+
+    def influence_cache(self):
+        """
+        Get the InfluenceCache of this process, shared by every generator it runs. Generators
+        passing it to their GAFExtractor reuse the influence graphs of inputs explained
+        before (e.g. with another chi) for as long as the process lives. Results are kept in
+        memory, and on disk only if set_influence_disk_cache enabled it.
+        """
+        global _influence_cache
+        if _influence_cache is None:
+            from ..gaf import InfluenceCache
+            _influence_cache = InfluenceCache(disk_cache=_influence_disk_cache)
+        return _influence_cache
+
+
+def set_influence_disk_cache(disk_cache):
+    """
+    Set whether ExplanationGenerator.influence_cache also keeps results on disk in this
+    process.
+
+    disk_cache      - True for the default disk cache (in the user's cache directory), a
+                      DiskCache to use instead, or False to only cache in memory.
+    """
+    global _influence_cache, _influence_disk_cache
+    _influence_disk_cache = disk_cache
+    _influence_cache = None
+
+
+def set_model_cache_size(size):
+    """
+    Set how many loaded models ExplanationGenerator.load_model keeps in this process.
+
+    size            - the number of models, 0 to load models on every call.
+    """
+    global _model_cache_size
+    if size < 0:
+        raise ValueError('size must not be negative')
+    _model_cache_size = size
+    while len(_models) > size:
+        _models.popitem(last=False)
+
+
+def set_progress_reporter(reporter):
+    """
+    Set the function ExplanationGenerator.progress calls with each stage in this process.
+
+    reporter        - a function taking the name of a stage, or None.
+    """
+    global _progress_reporter
+    _progress_reporter = reporter
+
+
+def _modification_time(path):
+    """
+    Get the latest modification time of a file, or of a directory and everything in it.
+    """
+    latest = os.stat(path).st_mtime_ns
+    for directory, _, files in os.walk(path):
+        for name in files:
+            latest = max(latest, os.stat(os.path.join(directory, name)).st_mtime_ns)
+    return latest
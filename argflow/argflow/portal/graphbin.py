@@ -0,0 +1,355 @@
+import json
+import mmap
+import struct
+
+import numpy as np
+
+from collections.abc import Mapping
+from enum import Enum
+
+
+GRAPH_BIN_MAGIC = b'AFGB'
+GRAPH_BIN_VERSION = 1
+
+# Magic, format version and header length
+_PREAMBLE = struct.Struct('<4sIQ')
+_ALIGNMENT = 8
+
+_PAYLOAD_NONE = 0
+_PAYLOAD_STRING = 1
+_PAYLOAD_PAIR = 2
+
+
+def _text(value):
+    # Enum members (payload and contribution types) are written as their values, like in JSON
+    return value.value if isinstance(value, Enum) else str(value)
+
+
+class _Table:
+    """
+    Interns strings to integer codes.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        value = _text(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class GraphBinBuilder:
+    """
+    Accumulates serialised GAF nodes into columns and writes them as a graph.bin file,
+    a columnar companion to graph.json that the portal can memory-map.
+
+    The file holds a preamble (magic, version, header length), a JSON header describing
+    the enum tables and sections, and 8-byte aligned sections: a string table, the node
+    columns, a CSR adjacency of children and the input/conclusion node lists.
+    """
+
+    def __init__(self, name, inputs, conclusions):
+        """
+        name            - name of the GAF.
+        inputs          - IDs of the input nodes.
+        conclusions     - IDs of the conclusion nodes.
+        """
+        self.name = name
+        self._inputs = [str(node) for node in inputs]
+        self._conclusions = [str(node) for node in conclusions]
+        self._strings = _Table()
+        self._node_types = _Table()
+        self._content_types = _Table()
+        self._contribution_types = _Table()
+        self._ids = []
+        self._columns = {name: [] for name in ('node_type', 'content_type', 'strength',
+                                               'certainty', 'payload_kind', 'payload',
+                                               'payload_feature', 'child_count')}
+        self._children = []
+        self._contributions = []
+
+    def add_node(self, node, node_obj):
+        """
+        Add a node in the form it takes in graph.json.
+
+        node            - the node ID.
+        node_obj        - the serialised node (see GAF.serialise_nodes).
+        """
+        columns = self._columns
+        self._ids.append(str(node))
+        columns['node_type'].append(self._node_types.code(node_obj['node_type']))
+        columns['strength'].append(node_obj.get('strength', np.nan))
+        columns['certainty'].append(node_obj.get('certainty', np.nan))
+        payload = node_obj.get('payload')
+        if 'content_type' in node_obj:
+            columns['content_type'].append(self._content_types.code(node_obj['content_type']))
+        else:
+            columns['content_type'].append(-1)
+        if payload is None:
+            kind, first, second = _PAYLOAD_NONE, -1, -1
+        elif isinstance(payload, dict):
+            kind = _PAYLOAD_PAIR
+            first = self._strings.code(payload['filter']['payload'])
+            second = self._strings.code(payload['feature']['payload'])
+        else:
+            kind, first, second = _PAYLOAD_STRING, self._strings.code(payload), -1
+        columns['payload_kind'].append(kind)
+        columns['payload'].append(first)
+        columns['payload_feature'].append(second)
+        children = node_obj['children']
+        columns['child_count'].append(len(children))
+        for child, contribution in children.items():
+            self._children.append(str(child))
+            self._contributions.append(
+                self._contribution_types.code(contribution['contribution_type']))
+
+    def write(self, path):
+        """
+        Write the graph.bin file.
+
+        path            - where to write the file.
+        """
+        index = {node: i for i, node in enumerate(self._ids)}
+        try:
+            children = np.fromiter((index[child] for child in self._children),
+                                   dtype='<u4', count=len(self._children))
+            inputs = np.array([index[node] for node in self._inputs], dtype='<u4')
+            conclusions = np.array([index[node] for node in self._conclusions], dtype='<u4')
+        except KeyError as e:
+            raise ValueError(f'Node {e} is referenced but was never added')
+        ids = np.array([self._strings.code(node) for node in self._ids], dtype='<i8')
+        encoded = [value.encode('utf-8') for value in self._strings.values]
+        string_offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+        np.cumsum([len(value) for value in encoded], out=string_offsets[1:])
+        child_indptr = np.zeros(len(self._ids) + 1, dtype='<u8')
+        np.cumsum(self._columns['child_count'], out=child_indptr[1:])
+        columns = self._columns
+        sections = {
+            'string_offsets': string_offsets,
+            'string_data': np.frombuffer(b''.join(encoded), dtype='u1'),
+            'node_id': ids,
+            'node_type': np.array(columns['node_type'], dtype='u1'),
+            'content_type': np.array(columns['content_type'], dtype='<i2'),
+            'strength': np.array(columns['strength'], dtype='<f8'),
+            'certainty': np.array(columns['certainty'], dtype='<f8'),
+            'payload_kind': np.array(columns['payload_kind'], dtype='u1'),
+            'payload': np.array(columns['payload'], dtype='<i8'),
+            'payload_feature': np.array(columns['payload_feature'], dtype='<i8'),
+            'child_indptr': child_indptr,
+            'child_index': children,
+            'child_contribution': np.array(self._contributions, dtype='u1'),
+            'input': inputs,
+            'conclusion': conclusions,
+        }
+        # Lay the sections out after the header, each aligned for memory mapping
+        layout, offset = {}, 0
+        for name, array in sections.items():
+            layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'count': len(array)}
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        header = json.dumps({
+            'name': self.name,
+            'node_types': self._node_types.values,
+            'content_types': self._content_types.values,
+            'contribution_types': self._contribution_types.values,
+            'sections': layout,
+        }).encode('utf-8')
+        header += b' ' * (-(_PREAMBLE.size + len(header)) % _ALIGNMENT)
+        with open(path, 'wb') as f:
+            f.write(_PREAMBLE.pack(GRAPH_BIN_MAGIC, GRAPH_BIN_VERSION, len(header)))
+            f.write(header)
+            for array in sections.values():
+                f.write(array.tobytes())
+                f.write(b'\0' * (-array.nbytes % _ALIGNMENT))
+        return path
+
+
+class GraphBin:
+    """
+    A memory-mapped, read-only graph.bin file.
+
+    Node columns are NumPy arrays over the mapped file. Node dicts in the graph.json
+    format are only materialised when a node is looked up through `nodes`.
+    """
+
+    def __init__(self, path):
+        """
+        path            - path to a graph.bin file.
+        """
+        with open(path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._sections = {}
+        try:
+            self._load(path)
+        except Exception:
+            self.close()
+            raise
+
+    def _load(self, path):
+        if len(self._buffer) < _PREAMBLE.size:
+            raise ValueError(f'{path} is not a graph.bin file')
+        magic, version, header_length = _PREAMBLE.unpack_from(self._buffer)
+        if magic != GRAPH_BIN_MAGIC:
+            raise ValueError(f'{path} is not a graph.bin file')
+        if version != GRAPH_BIN_VERSION:
+            raise ValueError(f'Unsupported graph.bin version {version}')
+        start = _PREAMBLE.size + header_length
+        header = json.loads(self._buffer[_PREAMBLE.size:start].decode('utf-8'))
+        self.name = header['name']
+        self._node_types = header['node_types']
+        self._content_types = header['content_types']
+        self._contribution_types = header['contribution_types']
+        self._sections = {
+            name: np.frombuffer(self._buffer, dtype=section['dtype'], count=section['count'],
+                                offset=start + section['offset'])
+            for name, section in header['sections'].items()
+        }
+        self.ids = [self.string(code) for code in self._sections['node_id'].tolist()]
+        self.index = {node: i for i, node in enumerate(self.ids)}
+        self.input = [self.ids[i] for i in self._sections['input'].tolist()]
+        self.conclusion = [self.ids[i] for i in self._sections['conclusion'].tolist()]
+        self._reverse = None
+
+    def close(self):
+        """
+        Unmap the file. Nodes that weren't materialised can't be looked up afterwards.
+        """
+        # The section arrays export the mapped buffer, which can't be closed while they exist
+        self._sections = {}
+        self._buffer.close()
+
+    @property
+    def closed(self):
+        return self._buffer.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def string(self, code):
+        offsets = self._sections['string_offsets']
+        return self._sections['string_data'][offsets[code]:offsets[code + 1]] \
+            .tobytes().decode('utf-8')
+
+    def children(self, i):
+        """
+        Get the indices and contribution codes of the children of the i-th node.
+        """
+        indptr = self._sections['child_indptr']
+        start, end = indptr[i], indptr[i + 1]
+        return self._sections['child_index'][start:end], \
+            self._sections['child_contribution'][start:end]
+
+    def parents(self, i):
+        """
+        Get the indices of the nodes that have the i-th node as a child.
+        """
+        if self.closed:
+            raise ValueError('The graph.bin file is closed')
+        if self._reverse is None:
+            # Reverse CSR, built once with a single sort over the child index
+            child_index = self._sections['child_index']
+            counts = np.diff(self._sections['child_indptr']).astype(np.int64)
+            sources = np.repeat(np.arange(len(self.ids)), counts)
+            order = np.argsort(child_index, kind='stable')
+            indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(child_index, minlength=len(self.ids)), out=indptr[1:])
+            self._reverse = (indptr, sources[order])
+        indptr, sources = self._reverse
+        return sources[indptr[i]:indptr[i + 1]]
+
+    def node(self, i):
+        """
+        Materialise the i-th node as it appears in graph.json.
+        """
+        if self.closed:
+            raise ValueError('The graph.bin file is closed')
+        sections = self._sections
+        node = {}
+        strength = sections['strength'][i]
+        if not np.isnan(strength):
+            node['strength'] = float(strength)
+        node['node_type'] = self._node_types[sections['node_type'][i]]
+        content_type = sections['content_type'][i]
+        if content_type >= 0:
+            node['content_type'] = self._content_types[content_type]
+        kind = sections['payload_kind'][i]
+        if kind == _PAYLOAD_STRING:
+            node['payload'] = self.string(sections['payload'][i])
+        elif kind == _PAYLOAD_PAIR:
+            node['payload'] = {
+                'filter': {'payload': self.string(sections['payload'][i])},
+                'feature': {'payload': self.string(sections['payload_feature'][i])}
+            }
+        targets, contributions = self.children(i)
+        node['children'] = {
+            self.ids[target]: {'contribution_type': self._contribution_types[contribution]}
+            for target, contribution in zip(targets.tolist(), contributions.tolist())
+        }
+        certainty = sections['certainty'][i]
+        if not np.isnan(certainty):
+            node['certainty'] = float(certainty)
+        return node
+
+    def nodes(self):
+        """
+        Get a read-only mapping from node ID to node dict, materialised on access.
+        """
+        return GraphBinNodes(self)
+
+    def predecessors(self):
+        """
+        Get a read-only mapping from node ID to the set of IDs of its predecessors.
+        """
+        return GraphBinPredecessors(self)
+
+
+class GraphBinNodes(Mapping):
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._cache = {}
+
+    def __getitem__(self, node):
+        cached = self._cache.get(node)
+        if cached is None:
+            cached = self._cache[node] = self._graph.node(self._graph.index[node])
+        return cached
+
+    def __iter__(self):
+        return iter(self._graph.ids)
+
+    def __len__(self):
+        return len(self._graph)
+
+    def __contains__(self, node):
+        return node in self._graph.index
+
+
+class GraphBinPredecessors(Mapping):
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, node):
+        ids = self._graph.ids
+        return {ids[i] for i in self._graph.parents(self._graph.index[node]).tolist()}
+
+    def __iter__(self):
+        return iter(self._graph.ids)
+
+    def __len__(self):
+        return len(self._graph)
+
+    def __contains__(self, node):
+        return node in self._graph.index
@@ -0,0 +1,141 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+PAYLOAD_STORE_DIRNAME = '.payloads'
+MANIFEST_FILENAME = 'payloads.json'
+# Seconds a stored payload is kept after it was last stored, even if no manifest refers to it
+DEFAULT_GRACE_PERIOD = 600
+# Seconds after which a temporary file in the store is left over from a crashed writer
+_STALE_TEMP_AGE = 3600
+
+
+class PayloadStore:
+
+    def __init__(self, root_dir, grace_period=DEFAULT_GRACE_PERIOD):
+        """
+        A content-addressed store for the image payloads of every explanation under a
+        resource root. Payloads are keyed by a hash of their encoded bytes, so an image
+        shared by many explanations (e.g. the activation maximisation of a filter) is
+        stored once, under <root_dir>/.payloads.
+
+        Each explanation written through the store lists the payloads it uses in a
+        payloads.json manifest. Stored payloads no manifest refers to are removed by
+        release (when an explanation is deleted) or collect_garbage. Payloads stored less
+        than grace_period seconds ago are never removed, as the manifest of the explanation
+        storing them may not be written yet, so both are safe to run while explanations are
+        being written.
+
+        root_dir        - the directory where all visualisations are saved.
+        grace_period    - seconds a payload is kept after it was last stored, whether or not
+                          a manifest refers to it.
+        """
+        self.root_dir = root_dir
+        self.grace_period = grace_period
+        self.store_dir = os.path.join(root_dir, PAYLOAD_STORE_DIRNAME)
+
+    def put(self, data, extension):
+        """
+        Store encoded payload bytes, unless identical bytes are already stored.
+        Returns the path of the payload relative to the root directory.
+
+        data            - the encoded payload.
+        extension       - file extension of the payload.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(PAYLOAD_STORE_DIRNAME, digest[:2], f'{digest}.{extension}')
+        full_path = os.path.join(self.root_dir, path)
+        try:
+            # Payloads stored again are as new, so garbage collection keeps them until the
+            # manifest of this explanation refers to them
+            os.utime(full_path)
+        except FileNotFoundError:
+            directory = os.path.dirname(full_path)
+            os.makedirs(directory, exist_ok=True)
+            # Write under a temporary name first so readers never see partial files
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, full_path)
+        return path
+
+    def write_manifest(self, explanation_dir, paths):
+        """
+        Record which stored payloads an explanation refers to.
+
+        explanation_dir - the directory of the explanation.
+        paths           - payload paths relative to the root directory, as returned by put.
+        """
+        # Written under a temporary name first, as garbage collection may read it concurrently
+        fd, temp_path = tempfile.mkstemp(dir=explanation_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sorted(set(paths)), f)
+        os.replace(temp_path, os.path.join(explanation_dir, MANIFEST_FILENAME))
+
+    def references(self, exclude=None):
+        """
+        Get the set of stored payloads referred to by any explanation's manifest.
+
+        exclude         - optional explanation directory whose manifest is ignored.
+        """
+        referenced = set()
+        pattern = os.path.join(glob.escape(self.root_dir), '*', '*', MANIFEST_FILENAME)
+        for manifest in glob.glob(pattern):
+            if exclude is not None and os.path.samefile(os.path.dirname(manifest), exclude):
+                continue
+            referenced.update(self._read_manifest(manifest))
+        return referenced
+
+    def release(self, explanation_dir):
+        """
+        Remove the stored payloads of an explanation that no other explanation refers to.
+        Call this before deleting the explanation directory. Returns the number of
+        payloads removed.
+
+        explanation_dir - the directory of the explanation.
+        """
+        manifest = os.path.join(explanation_dir, MANIFEST_FILENAME)
+        if not os.path.isfile(manifest):
+            return 0
+        candidates = set(self._read_manifest(manifest))
+        return self._remove(candidates.difference(self.references(exclude=explanation_dir)))
+
+    def collect_garbage(self):
+        """
+        Remove every stored payload that no explanation refers to, e.g. after explanations
+        were deleted without release. Returns the number of payloads removed.
+        """
+        now = time.time()
+        stored = set()
+        for path in glob.glob(os.path.join(glob.escape(self.store_dir), '*', '*')):
+            if path.endswith('.tmp'):
+                # Payloads being written by put, unless their writer crashed long ago
+                try:
+                    if os.stat(path).st_mtime > now - max(self.grace_period, _STALE_TEMP_AGE):
+                        continue
+                except FileNotFoundError:
+                    continue
+            stored.add(os.path.relpath(path, self.root_dir))
+        return self._remove(stored.difference(self.references()))
+
+    def _read_manifest(self, manifest):
+        with open(manifest, 'r') as f:
+            return [os.path.normpath(path) for path in json.load(f)]
+
+    def _remove(self, paths):
+        removed = 0
+        cutoff = time.time() - self.grace_period
+        for path in paths:
+            full_path = os.path.join(self.root_dir, path)
+            try:
+                if os.stat(full_path).st_mtime > cutoff:
+                    continue
+                os.remove(full_path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
@@ -0,0 +1,178 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from .writer import Writer
+
+
+CHECKPOINT_FILENAME = '.pipeline.json'
+
+# State of a pipeline worker process, set up once by _init_worker
+_worker = None
+
+
+class ExplanationPipeline:
+
+    def __init__(self, model, extractor, root_dir, model_name, workers=None, shard_size=256,
+                 batch_size=32, name_format='explanation_{index}', dedupe_payloads=False,
+                 write_options=None):
+        """
+        Explain a dataset with a pool of processes and write the explanations for the portal.
+        The inputs are split into shards of consecutive inputs. Each worker loads the model
+        once, then extracts (with GAFExtractor.extract_batch) and writes the explanations
+        of the shards it is given.
+
+        Explanations are named after the index of their input, so names don't depend on
+        which worker wrote them. Completed shards are recorded in a checkpoint file in the
+        model directory, so an interrupted run resumes where it stopped.
+
+        model           - a path to a saved Keras model, or a picklable function returning
+                          the model. Called once in each worker.
+        extractor       - a picklable GAFExtractor.
+        root_dir        - the directory where all visualisations are saved.
+        model_name      - the name of the model, used as the model directory name.
+        workers         - number of worker processes (defaults to the number of CPUs, 0 to
+                          run in the calling process).
+        shard_size      - number of inputs per shard, the unit of work and of checkpointing.
+        batch_size      - number of inputs a worker extracts explanations for at once.
+        name_format     - format of explanation names, given the index of the input.
+        dedupe_payloads - if True, workers save image payloads to the shared PayloadStore.
+        write_options   - keyword arguments for Writer.write_gaf, e.g. formats.
+        """
+        if shard_size < 1:
+            raise ValueError('shard_size must be positive')
+        self.model = model
+        self.extractor = extractor
+        self.root_dir = root_dir
+        self.model_name = model_name
+        self.workers = os.cpu_count() if workers is None else workers
+        self.shard_size = shard_size
+        self.batch_size = batch_size
+        self.name_format = name_format
+        self.dedupe_payloads = dedupe_payloads
+        self.write_options = dict(write_options or {})
+        self.checkpoint_path = os.path.join(root_dir, model_name, CHECKPOINT_FILENAME)
+
+    def run(self, xs, progress=None, resume=True):
+        """
+        Explain every input of a dataset. Returns the paths of the written explanations in
+        the order of xs (None for the inputs of shards completed by a previous run).
+
+        xs              - a sequence of inputs, each as accepted by GAFExtractor.extract.
+        progress        - optional function called as progress(done, total) with the number
+                          of inputs explained so far, after each shard.
+        resume          - if True, skip the shards a previous run with the same settings
+                          completed. Otherwise start over, replacing the explanations
+                          previous runs wrote.
+        """
+        total = len(xs)
+        checkpoint = self._load_checkpoint(total) if resume else None
+        if checkpoint is None:
+            checkpoint = {'name_format': self.name_format, 'shard_size': self.shard_size,
+                          'total': total, 'done': []}
+            if not resume:
+                # Replace the checkpoint of the previous run before its explanations are
+                # deleted, so resuming an interrupted start over doesn't skip them
+                self._save_checkpoint(checkpoint)
+        done = set(checkpoint['done'])
+        shards = [(start, xs[start:start + self.shard_size], resume)
+                  for start in range(0, total, self.shard_size) if start not in done]
+        paths = [None] * total
+        explained = sum(min(self.shard_size, total - start) for start in done)
+        if progress is not None:
+            progress(explained, total)
+
+        for start, shard_paths in self._map(shards):
+            paths[start:start + len(shard_paths)] = shard_paths
+            done.add(start)
+            checkpoint['done'] = sorted(done)
+            self._save_checkpoint(checkpoint)
+            explained += len(shard_paths)
+            if progress is not None:
+                progress(explained, total)
+        return paths
+
+    def _map(self, shards):
+        """
+        Generate (start, paths) for every shard as it completes.
+        """
+        init_args = (self.model, self.extractor, self.root_dir, self.model_name,
+                     self.batch_size, self.name_format, self.dedupe_payloads,
+                     self.write_options)
+        if self.workers == 0:
+            _init_worker(*init_args)
+            yield from map(_run_shard, shards)
+            return
+        # Spawned workers don't inherit the parent's TensorFlow state, which isn't fork-safe
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(self.workers, initializer=_init_worker, initargs=init_args) as pool:
+            yield from pool.imap_unordered(_run_shard, shards)
+
+    def _load_checkpoint(self, total):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        settings = {'name_format': self.name_format, 'shard_size': self.shard_size,
+                    'total': total}
+        if any(checkpoint.get(key) != value for key, value in settings.items()):
+            raise ValueError(f'The checkpoint at {self.checkpoint_path} is of a run with other '
+                             f'settings, run with resume=False to start over')
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint):
+        directory = os.path.dirname(self.checkpoint_path)
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name first, so an interruption never corrupts it
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+
+def _init_worker(model, extractor, root_dir, model_name, batch_size, name_format,
+                 dedupe_payloads, write_options):
+    global _worker
+    if isinstance(model, str):
+        import keras
+        model = keras.models.load_model(model)
+    else:
+        model = model()
+    _worker = {
+        'model': model,
+        'extractor': extractor,
+        'writer': Writer(root_dir, model_name, dedupe_payloads=dedupe_payloads),
+        'model_dir': os.path.join(root_dir, model_name),
+        'batch_size': batch_size,
+        'name_format': name_format,
+        'write_options': write_options,
+    }
+
+
+def _run_shard(shard):
+    start, xs, resume = shard
+    names = [_worker['name_format'].format(index=start + i) for i in range(len(xs))]
+    formats = tuple(_worker['write_options'].get('formats', ('json',)))
+    paths = [None] * len(xs)
+    pending = []
+    for i, name in enumerate(names):
+        gaf_dir = os.path.join(_worker['model_dir'], name)
+        graph_paths = [os.path.join(gaf_dir, f'graph.{fmt}') for fmt in formats]
+        if resume and all(os.path.isfile(path) for path in graph_paths):
+            # Written before the run was interrupted
+            paths[i] = graph_paths[0]
+            continue
+        if os.path.isdir(gaf_dir):
+            # Left incomplete by an interrupted run, or written by a run started over
+            if _worker['writer'].payload_store is not None:
+                _worker['writer'].payload_store.release(gaf_dir)
+            shutil.rmtree(gaf_dir)
+        pending.append(i)
+    gafs = _worker['extractor'].extract_batch(
+        _worker['model'], [xs[i] for i in pending], batch_size=_worker['batch_size'])
+    for i, gaf in zip(pending, gafs):
+        paths[i] = _worker['writer'].write_gaf(gaf, names[i], **_worker['write_options'])
+    return start, paths
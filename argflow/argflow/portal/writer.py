@@ -1,49 +1,114 @@
 import os
 import time
 
+from argflow.gaf import PayloadType
+from .graphbin import GraphBinBuilder
+from .payload_store import PayloadStore
+
+
+GRAPH_FORMATS = ('json', 'bin')
+
 
 class Writer:
-    def __init__(self, root_dir, model_name):
+    def __init__(self, root_dir, model_name, dedupe_payloads=False):
         """
         A class for saving GAFs for visualisation in the portal.
 
         root_dir            - the directory where all visualisations are saved. Don't forget to
                               point the portal to this directory too!
         model_name          - the name of the model. This will be used as the model directory name.
+        dedupe_payloads     - if True, save image payloads to the content-addressed PayloadStore
+                              of root_dir, so identical images are stored once across
+                              explanations.
         """
 
         self.root_dir = root_dir
+        self.payload_store = PayloadStore(root_dir) if dedupe_payloads else None
         self._model_dir = os.path.join(self.root_dir, model_name)
-        if not os.path.exists(self._model_dir):
-            # Model dir does not exist
-            os.makedirs(self._model_dir)
-            os.mkdir(os.path.join(self._model_dir, 'model'))
+        # Several writers (e.g. pipeline workers) may create the model dir at once
+        os.makedirs(os.path.join(self._model_dir, 'model'), exist_ok=True)
 
-    def write_gaf(self, gaf, name=None):
+    def write_gaf(self, gaf, name=None, compact=False, stream=False, formats=('json',),
+                  workers=None, encoder=None):
         """
         Write a GAF for visualisation in the portal.
 
         gaf                 - the GAF to be saved.
         name                - the name of the saved GAF.
+        compact             - if True, write graph.json without indentation or key sorting.
+        stream              - if True, write nodes to graph.json one at a time instead of
+                              building the whole document in memory first.
+        formats             - which files to write: 'json' for graph.json and/or 'bin' for the
+                              columnar, memory-mappable graph.bin. The path of the first one
+                              is returned.
+        workers             - number of threads encoding image payloads (0 to encode them in
+                              the calling thread).
+        encoder             - a PayloadEncoder with the format and settings for image payloads.
         """
+        formats = tuple(formats)
+        if not formats or set(formats).difference(GRAPH_FORMATS):
+            raise ValueError(f'formats must be a non-empty subset of {GRAPH_FORMATS}')
         if name is None:
             name = 'explanation_' + str(time.strftime('%Y-%m-%d_%H:%M:%S'))
         # Create dir for GAF
         gaf_dir = os.path.join(self._model_dir, name)
-        if os.path.exists(gaf_dir):
+        try:
+            # Creating the dir claims the name, even against other processes
+            os.mkdir(gaf_dir)
+        except FileExistsError:
             raise UserWarning(
                 f'A GAF is already saved under the name "{name}"!')
-        else:
-            os.mkdir(gaf_dir)
         # Create payloads dir
         payloads_dir = os.path.join(gaf_dir, 'payloads')
-        if not os.path.exists(payloads_dir):
+        if self.payload_store is None and not os.path.exists(payloads_dir):
             os.mkdir(payloads_dir)
         # Save GAF
         payloads_dir_relative_to_root = os.path.relpath(payloads_dir, self.root_dir)
-        output = gaf.serialise(root_dir=self.root_dir, payloads_dir=payloads_dir_relative_to_root)
-        output_path = os.path.join(gaf_dir, 'graph.json')
-        with open(output_path, 'w+') as f:
-            f.write(output)
-            f.close()
-        return output_path
+        paths = {'json': os.path.join(gaf_dir, 'graph.json'),
+                 'bin': os.path.join(gaf_dir, 'graph.bin')}
+        callbacks = []
+        builder = None
+        if 'bin' in formats:
+            builder = GraphBinBuilder('GAF', gaf.inputs(), gaf.conclusions())
+            callbacks.append(builder.add_node)
+        stored = []
+        if self.payload_store is not None:
+            callbacks.append(lambda node, node_obj: stored.extend(_image_paths(node_obj)))
+
+        def on_node(node, node_obj):
+            for callback in callbacks:
+                callback(node, node_obj)
+
+        # Graph files are written under temporary names and renamed once complete, so
+        # the portal (which only lists explanations with a graph) never reads partial ones
+        temp_paths = {fmt: path + '.tmp' for fmt, path in paths.items()}
+        options = dict(root_dir=self.root_dir, payloads_dir=payloads_dir_relative_to_root,
+                       workers=workers, encoder=encoder, store=self.payload_store)
+        if 'json' not in formats:
+            for node, node_obj in gaf.serialise_nodes(**options):
+                on_node(node, node_obj)
+        elif stream:
+            with open(temp_paths['json'], 'w+') as f:
+                gaf.serialise_to(f, compact=compact, on_node=on_node, **options)
+        else:
+            output = gaf.serialise(compact=compact, on_node=on_node, **options)
+            with open(temp_paths['json'], 'w+') as f:
+                f.write(output)
+                f.close()
+        if builder is not None:
+            builder.write(temp_paths['bin'])
+        if self.payload_store is not None:
+            self.payload_store.write_manifest(gaf_dir, stored)
+        for fmt in formats:
+            os.replace(temp_paths[fmt], paths[fmt])
+        return paths[formats[0]]
+
+
+def _image_paths(node_obj):
+    # Paths of the image payloads of a serialised node
+    payload = node_obj.get('payload')
+    if node_obj.get('content_type') == PayloadType.IMAGE:
+        yield payload
+    elif node_obj.get('content_type') == PayloadType.IMAGE_PAIR:
+        yield payload['filter']['payload']
+        yield payload['feature']['payload']
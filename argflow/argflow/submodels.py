@@ -0,0 +1,271 @@
+import weakref
+
+import keras
+import tensorflow as tf
+
+
+_submodels = weakref.WeakKeyDictionary()
+
+
+class SubModel:
+    """
+    A part of a Keras model wrapped in a tf.function, so repeated calls reuse the
+    traced graph instead of running the model eagerly.
+    """
+
+    def __init__(self, model):
+        """
+        model           - the Keras model to wrap.
+        """
+        self.model = model
+        self._dtype = model.inputs[0].dtype
+        self._function = tf.function(lambda x: model(x, training=False),
+                                     reduce_retracing=True)
+
+    def __call__(self, x):
+        # Cast first so NumPy inputs of another dtype don't trigger retracing
+        return self._function(tf.convert_to_tensor(x, dtype=self._dtype))
+
+
+def _cached(model, key, build):
+    try:
+        submodels = _submodels.setdefault(model, {})
+    except TypeError:
+        # Model can't be weakly referenced, so nothing is cached
+        return build()
+    if key not in submodels:
+        submodels[key] = build()
+    return submodels[key]
+
+
+def truncated_model(model, layer_name):
+    """
+    Get a SubModel mapping the inputs of a model to the output of one of its layers.
+    Built once per model and layer.
+
+    model           - a Keras model.
+    layer_name      - the name of the layer.
+    """
+    def build():
+        return SubModel(keras.Model(model.inputs, model.get_layer(layer_name).output))
+
+    return _cached(model, ('truncated', layer_name), build)
+
+
+def head_model(model, layer_name):
+    """
+    Get a SubModel mapping the output of a layer to the outputs of a model, by applying
+    the layers that follow it in model.layers in order (as in a Sequential model).
+    Built once per model and layer.
+
+    model           - a Keras model.
+    layer_name      - the name of the layer.
+    """
+    def build():
+        layer = model.get_layer(layer_name)
+        head_input = keras.Input(shape=layer.output.shape[1:])
+        y = head_input
+        for head_layer in model.layers[model.layers.index(layer) + 1:]:
+            y = head_layer(y)
+        return SubModel(keras.Model(head_input, y))
+
+    return _cached(model, ('head', layer_name), build)
+
+
+def _outputs_model(model, layer_names):
+    """
+    Build a model mapping the inputs of a model to the outputs of some of its layers,
+    followed by its own output.
+    """
+    if isinstance(model, keras.Sequential):
+        # The layers are applied anew, as gradients don't reach the outputs of the
+        # layers of a Sequential model from a functional model built on top of it
+        inputs = keras.Input(shape=model.inputs[0].shape[1:])
+        y = inputs
+        activations = {}
+        for layer in model.layers:
+            y = activations[layer.name] = layer(y)
+        outputs = [activations[model.get_layer(name).name] for name in layer_names] + [y]
+    else:
+        inputs = model.inputs
+        outputs = [model.get_layer(name).output for name in layer_names] + model.outputs[:1]
+    return keras.Model(inputs, outputs)
+
+
+def _logits_model(model, layer_name):
+    """
+    Get a function mapping the inputs of a model to the logits of a layer: the input of a
+    softmax layer (e.g. Softmax or Activation('softmax')), the pre-activation of a Dense
+    layer with a softmax activation, or the outputs of any other layer.
+    """
+    layer = model.get_layer(layer_name)
+    if not _applies_softmax(layer):
+        return keras.Model(model.inputs, layer.output)
+    hidden = keras.Model(model.inputs, layer.input)
+    if not isinstance(layer, keras.layers.Dense):
+        return hidden
+
+    def logits(x, training=False):
+        y = tf.matmul(hidden(x, training=training), layer.kernel)
+        return y + layer.bias if layer.use_bias else y
+
+    return logits
+
+
+def _applies_softmax(layer):
+    if isinstance(layer, keras.layers.Softmax):
+        return True
+    activation = getattr(layer, 'activation', None)
+    return getattr(activation, '__name__', None) == 'softmax'
+
+
+def class_gradients(model, layer_names):
+    """
+    Get a function mapping a batch of inputs to the model's predictions and, for each
+    layer, the gradient of each sample's top predicted class with respect to the layer's
+    output, averaged over all but the batch and channel axes: a (samples, channels) tensor.
+    Every layer's gradients come from one forward and one backward pass over the model.
+    Built and traced once per model and layers.
+
+    model           - a Keras model.
+    layer_names     - the names of the layers.
+    """
+    layer_names = tuple(layer_names)
+
+    def build():
+        outputs_model = _outputs_model(model, layer_names)
+        dtype = model.inputs[0].dtype
+
+        @tf.function(reduce_retracing=True)
+        def gradients(x):
+            with tf.GradientTape() as tape:
+                *activations, preds = outputs_model(x, training=False)
+                top_class = tf.gather(preds, tf.argmax(preds, axis=-1), batch_dims=1)
+            # Samples don't interact, so each only gets the gradient of its own top class
+            grads = tape.gradient(top_class, activations)
+            pooled = [tf.reduce_mean(grad, axis=tuple(range(1, len(grad.shape) - 1)))
+                      for grad in grads]
+            return preds, pooled
+
+        return lambda x: gradients(tf.convert_to_tensor(x, dtype=dtype))
+
+    return _cached(model, ('class_gradients', layer_names), build)
+
+
+def input_jacobian(model, layer_name, logits=False):
+    """
+    Get a function mapping a batch of inputs to the outputs of a layer and, for each
+    sample, the Jacobian of those outputs with respect to the sample's input: a
+    (samples, outputs, inputs) tensor. Traced once per model and layer, with a fixed input
+    signature so batches of any size reuse the same graph.
+
+    model           - a Keras model with a single, flat input (e.g. a dense network).
+    layer_name      - the name of the layer.
+    logits          - if True and the layer applies a softmax, use its logits (the
+                      softmax's input) instead of its outputs.
+    """
+    def build():
+        if logits:
+            outputs_model = _logits_model(model, layer_name)
+        else:
+            outputs_model = keras.Model(model.inputs, model.get_layer(layer_name).output)
+        spec = tf.TensorSpec((None,) + tuple(model.inputs[0].shape[1:]),
+                             dtype=model.inputs[0].dtype)
+
+        @tf.function(input_signature=[spec])
+        def jacobian(x):
+            with tf.GradientTape() as tape:
+                tape.watch(x)
+                outputs = outputs_model(x, training=False)
+            return outputs, tape.batch_jacobian(outputs, x)
+
+        return lambda x: jacobian(tf.convert_to_tensor(x, dtype=spec.dtype))
+
+    return _cached(model, ('input_jacobian', layer_name, logits), build)
+
+
+def integrated_gradients(model, layer_name, target='top', logits=False):
+    """
+    Get a function mapping a batch of inputs, a baseline and the points (alphas, from 0
+    to 1) of the path between them to the outputs of a layer for the inputs and the
+    integrated gradients of each sample's target output with respect to its input, by the
+    trapezoidal rule. Every point of every sample is run through the model as one batch,
+    in one forward and one backward pass. Traced once per model, layer and target, with a
+    fixed input signature.
+
+    model           - a Keras model with a single, flat input (e.g. a dense network).
+    layer_name      - the name of the layer.
+    target          - 'top' for each sample's top output at the input, or 'sum' for the
+                      sum of all outputs.
+    logits          - if True and the layer applies a softmax, use its logits (the
+                      softmax's input) instead of its outputs.
+    """
+    def build():
+        if logits:
+            outputs_model = _logits_model(model, layer_name)
+        else:
+            outputs_model = keras.Model(model.inputs, model.get_layer(layer_name).output)
+        shape = tuple(model.inputs[0].shape[1:])
+        dtype = model.inputs[0].dtype
+
+        @tf.function(input_signature=[tf.TensorSpec((None,) + shape, dtype=dtype),
+                                      tf.TensorSpec(shape, dtype=dtype),
+                                      tf.TensorSpec((None,), dtype=dtype)])
+        def gradients(x, baseline, alphas):
+            steps = tf.shape(alphas)[0]
+            # (samples, points, features), the last point of each sample being the input
+            delta = x - baseline
+            path = baseline + alphas[None, :, None] * delta[:, None, :]
+            path = tf.reshape(path, (-1,) + shape)
+            with tf.GradientTape() as tape:
+                tape.watch(path)
+                outputs = outputs_model(path, training=False)
+                outputs = tf.reshape(outputs, (-1, steps, outputs.shape[-1]))
+                if target == 'top':
+                    top = tf.argmax(outputs[:, -1], axis=-1)
+                    explained = tf.gather(outputs, top, axis=2, batch_dims=1)
+                else:
+                    explained = tf.reduce_sum(outputs, axis=-1)
+            # Points don't interact, so each only gets the gradient of its own output
+            grads = tape.gradient(explained, path)
+            grads = tf.reshape(grads, (-1, steps) + shape)
+            weights = alphas[1:] - alphas[:-1]
+            average = tf.einsum('s,ns...->n...', weights, (grads[:, 1:] + grads[:, :-1]) / 2)
+            return outputs[:, -1], delta * average
+
+        return lambda x, baseline, alphas: gradients(tf.convert_to_tensor(x, dtype=dtype),
+                                                     tf.convert_to_tensor(baseline, dtype=dtype),
+                                                     tf.convert_to_tensor(alphas, dtype=dtype))
+
+    return _cached(model, ('integrated_gradients', layer_name, target, logits), build)
+
+
+def layer_gradients(model, layer_names):
+    """
+    Get a function mapping a batch of inputs to the model's predictions, the activations
+    of the input and of each layer, and the gradients of each sample's top predicted class
+    with respect to those activations, from one forward and one backward pass over the
+    model. Activations and gradients are lists whose first element is for the input,
+    followed by one element per layer. Built and traced once per model and layers.
+
+    model           - a Keras model.
+    layer_names     - the names of the layers.
+    """
+    layer_names = tuple(layer_names)
+
+    def build():
+        outputs_model = _outputs_model(model, layer_names)
+        dtype = model.inputs[0].dtype
+
+        @tf.function(reduce_retracing=True)
+        def gradients(x):
+            with tf.GradientTape() as tape:
+                tape.watch(x)
+                *activations, preds = outputs_model(x, training=False)
+                top_class = tf.gather(preds, tf.argmax(preds, axis=-1), batch_dims=1)
+            activations = [x] + activations
+            return preds, activations, tape.gradient(top_class, activations)
+
+        return lambda x: gradients(tf.convert_to_tensor(x, dtype=dtype))
+
+    return _cached(model, ('layer_gradients', layer_names), build)
@@ -0,0 +1,74 @@
+import random
+import timeit
+
+from argflow.gaf import GAF, GAFBackend, NodeType, Payload, PayloadType
+from argflow.gaf.frameworks import BipolarFramework
+
+
+REPEATS = 20
+
+
+def random_relation():
+    return BipolarFramework.SUPPORT if random.random() < 0.8 else BipolarFramework.ATTACK
+
+
+def single_layer_gaf(backend):
+    # Same shape as stress_test_single.py
+    gaf = GAF(backend=backend)
+    gaf.add_input(0, payload=Payload('Input', PayloadType.STRING))
+    gaf.add_conclusion(-1, 0.8, 'True', payload=Payload('Conclusion', PayloadType.STRING))
+    for i in range(1, 4000):
+        gaf.add_argument(i, strength=random.random(), payload=Payload(
+            str(i), PayloadType.STRING))
+        relation = random_relation()
+        gaf.add_relation(0, i, relation)
+        gaf.add_relation(i, -1, relation)
+    return gaf
+
+
+def multi_layer_gaf(backend):
+    # Same shape as stress_test_multi.py
+    layers = [range(1, 100), range(101, 200), range(201, 300)]
+    gaf = GAF(backend=backend)
+    gaf.add_input(0, payload=Payload('Input', PayloadType.STRING))
+    gaf.add_conclusion(-1, 0.8, 'True', payload=Payload('Conclusion', PayloadType.STRING))
+    previous = [0]
+    for layer in layers:
+        for i in layer:
+            gaf.add_argument(i, strength=random.random(), payload=Payload(
+                str(i), PayloadType.STRING))
+            relation = random_relation()
+            for j in previous:
+                gaf.add_relation(j, i, relation)
+        previous = layer
+    for i in previous:
+        gaf.add_relation(i, -1, random_relation())
+    return gaf
+
+
+def filtered_lookup(gaf, node_type):
+    # How arguments(), inputs() and conclusions() used to work: a scan over every node
+    return dict(filter(lambda x: x[1]['type'] == node_type, gaf._G.nodes(data=True)))
+
+
+def indexed_lookup(gaf, node_type):
+    accessors = {NodeType.INPUT: gaf.inputs,
+                 NodeType.ARGUMENT: gaf.arguments,
+                 NodeType.CONCLUSION: gaf.conclusions}
+    return dict(accessors[node_type]())
+
+
+if __name__ == '__main__':
+    print(f'{"graph":<8}{"backend":<10}{"lookup":<12}'
+          f'{"filtered (ms)":>15}{"indexed (ms)":>15}{"speed-up":>10}')
+    for name, build in (('single', single_layer_gaf), ('multi', multi_layer_gaf)):
+        for backend in GAFBackend:
+            gaf = build(backend)
+            for node_type in NodeType:
+                filtered = timeit.timeit(lambda: filtered_lookup(gaf, node_type),
+                                         number=REPEATS) / REPEATS
+                indexed = timeit.timeit(lambda: indexed_lookup(gaf, node_type),
+                                        number=REPEATS) / REPEATS
+                print(f'{name:<8}{backend.value:<10}{node_type.name.lower():<12}'
+                      f'{filtered * 1e3:>15.3f}{indexed * 1e3:>15.3f}'
+                      f'{filtered / indexed:>9.1f}x')
@@ -8,51 +8,36 @@ from keras import Sequential
 from keras.layers import Dense, Softmax
 from keras.optimizers import RMSprop
 
-from argflow.influence import InfluenceGraph
-from argflow.gaf import GAFExtractor, CharacterisationMapper, StrengthMapper, InfluenceMapper, Payload, PayloadType
+from argflow.gaf import GAFExtractor, CharacterisationMapper, StrengthMapper, Payload, PayloadType
+from argflow.gaf.default_mappers import DefaultDenseInfluenceMapper
 from argflow.gaf.frameworks import BipolarFramework
 from argflow.chi import Chi
 from argflow.portal import Writer
 
 
-class IM(InfluenceMapper):
-    def apply(self, model, x):
-        influences = InfluenceGraph()
-        x_tensor = tf.convert_to_tensor([x], dtype=tf.float32)
-
-        # Calculate d output / d x_tensor
-        model_headless = Sequential(model.layers[:-1])
-        with tf.GradientTape() as g:
-            g.watch(x_tensor)
-            output = tf.squeeze(model_headless(x_tensor))
-        gradients = tf.squeeze(g.gradient(output, x_tensor))
-
-        pred_label = tf.math.argmax(output).numpy()
-        confidence = max(keras.backend.softmax(output.numpy()))
-        influences.add_node('Prediction')
-
-        feature_names = {0: 'Longitude', 1: 'Latitude', 2: 'Housing Median Age', 3: 'Total Rooms',
-                         4: 'Total Bedrooms', 5: 'Population', 6: 'Households', 7: 'Median Income',
-                         8: '<1H OCEAN', 9: 'NEAR BAY', 10: 'INLAND', 11: 'NEAR OCEAN', 12: 'ISLAND'}
-        influences.add_node('Input', grad=0)
-        for i, feature in enumerate(x[0]):
-            influences.add_node(
-                f'Feature {i}', grad=gradients[i].numpy(), value=feature, fname=feature_names[i], idx=i)
-            influences.add_influence(f'Feature {i}', 'Prediction')
-            influences.add_influence('Input', f'Feature {i}')
-
-        return influences, str(pred_label), confidence
+# Names of the input columns, after preprocessing
+FEATURE_NAMES = ['Longitude', 'Latitude', 'Housing Median Age', 'Total Rooms', 'Total Bedrooms',
+                 'Population', 'Households', 'Median Income', '<1H OCEAN', 'NEAR BAY', 'INLAND',
+                 'NEAR OCEAN', 'ISLAND']
 
 
 class SM(StrengthMapper):
     def apply(self, node):
         return np.abs(node['grad']) if 'grad' in node else None
 
+    def apply_many(self, nodes):
+        # Strengths of every feature at once
+        return np.abs(nodes['grad']) if 'grad' in nodes else super().apply_many(nodes)
+
 
 class CM(CharacterisationMapper):
     def apply(self, node):
         return BipolarFramework.ATTACK if node['grad'] < 0 else BipolarFramework.SUPPORT
 
+    def apply_many(self, nodes):
+        relations = np.array([BipolarFramework.SUPPORT, BipolarFramework.ATTACK], dtype=object)
+        return relations[(nodes['grad'] < 0).astype(np.intp)]
+
 
 class Id(Chi):
     def generate(self, x, node, model):
@@ -175,19 +160,19 @@ if __name__ == '__main__':
     # Train model
     model = train(x_train, y_train, epochs=10)
 
-    for i in range(0, 5):
-        # Feed model an input
-        x_test_ex = x_test.iloc[i:i+1, :].to_numpy()
-        y_test_ex = y_test.iloc[i:i+1, :]
-
-        # Extract explanation
-        extractor = GAFExtractor(IM(), SM(), CM(), Id())
-        gaf = extractor.extract(model, x_test_ex)
+    # Feed model some inputs, one row each
+    no_explanations = 5
+    x_test_exs = (x_test.iloc[i:i+1, :].to_numpy() for i in range(no_explanations))
 
+    # Extract explanations, a batch of rows at a time
+    # The gradients of the sum of the outputs before the softmax, for every row of a batch at once
+    im = DefaultDenseInfluenceMapper(feature_names=FEATURE_NAMES, target='sum')
+    extractor = GAFExtractor(im, SM(), CM(), Id())
+    summaries = Writer('../portal/examples', 'Cali')
+    for i, gaf in enumerate(extractor.extract_batch(model, x_test_exs, batch_size=64)):
         # Write explanation
-        summaries = Writer('../portal/examples', 'Cali')
         summaries.write_gaf(gaf, f'Prediction {i}')
 
         # Show the correct answer
         print('The correct answer was...')
-        print(y_test_ex)
\ No newline at end of file
+        print(y_test.iloc[i:i+1, :])
\ No newline at end of file
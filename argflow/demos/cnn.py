@@ -18,7 +18,7 @@ from argflow.portal import Writer
 class GradCAMWithActMax(Chi):
     def generate(self, x, node, model):
         gc = GradCAM()
-        am = ActMax()
+        am = ActMax(cache=True)
         img_gc = gc.generate(x, node, model).content
         img_am = am.generate(x, node, model).content
         return Payload((img_gc, img_am), PayloadType.IMAGE_PAIR)
@@ -1,6 +1,6 @@
 import random
 
-from argflow.gaf import GAF, Payload, PayloadType
+from argflow.gaf import GAF, GAFBackend, Payload, PayloadType
 from argflow.gaf.frameworks import BipolarFramework
 from argflow.gaf.mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper
 from argflow.portal import Writer
@@ -11,7 +11,7 @@ FIRST = range(1, 4000)
 
 if __name__ == '__main__':
 
-    gaf = GAF()
+    gaf = GAF(backend=GAFBackend.COMPACT)
     # Add start and finish
     gaf.add_input(0, payload=Payload('Input', PayloadType.STRING))
     gaf.add_conclusion(-1, 0.8, 'True', payload=Payload('Conclusion', PayloadType.STRING))
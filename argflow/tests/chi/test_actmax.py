@@ -1,3 +1,4 @@
+import tempfile
 import numpy as np
 import tensorflow as tf
 import unittest
@@ -11,6 +12,7 @@ from argflow.gaf import GAFExtractor, PayloadType, Payload
 from argflow.gaf.frameworks import BipolarFramework
 from argflow.gaf.default_mappers import DefaultConvolutionalInfluenceMapper, DefaultConvolutionalStrengthMapper, \
     DefaultConvolutionalCharacterisationMapper
+from argflow.cache import DiskCache
 from argflow.chi.cnn import ActMax
 from argflow.chi import Chi
 
@@ -31,3 +33,42 @@ class TestActmax(unittest.TestCase):
         img = am.generate(x, node, model).content
 
         self.assertEqual(img.size, (28, 28))
+
+    def test_cache(self):
+        temp = tempfile.TemporaryDirectory()
+        model = Sequential()
+        model.add(Conv2D(4, kernel_size=3, activation='relu', input_shape=(16, 16, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(10, activation='softmax'))
+        am = ActMax(cache=DiskCache(temp.name))
+        self.assertEqual(am.precompute(model, 'conv1', [0, 1]), 2)
+        # Cached filters are skipped, whichever ActMax instance asks
+        self.assertEqual(ActMax(cache=DiskCache(temp.name)).precompute(model, 'conv1', [1]), 0)
+        img = am.generate(np.zeros((1, 16, 16, 3)), {'layer': 'conv1', 'filter_idx': 1}, model).content
+        self.assertEqual(img.size, (16, 16))
+        # Nothing is cached unless asked for
+        self.assertIsNone(ActMax().cache)
+        with self.assertRaises(ValueError):
+            ActMax().precompute(model, 'conv1')
+        temp.cleanup()
+
+    def test_generate_many(self):
+        model = Sequential()
+        model.add(Conv2D(4, kernel_size=3, activation='relu', input_shape=(16, 16, 3), name='conv1'))
+        model.add(Conv2D(4, kernel_size=3, activation='relu', name='conv2'))
+        model.add(Flatten())
+        model.add(Dense(10, activation='softmax'))
+        batches = []
+
+        class CountingActMax(ActMax):
+            def _make_actmaxes(self, img_array, model, layer_name, filter_indices):
+                batches.append((layer_name, list(filter_indices)))
+                return super()._make_actmaxes(img_array, model, layer_name, filter_indices)
+
+        nodes = [{'layer': 'conv1', 'filter_idx': 0}, {'layer': 'conv2', 'filter_idx': 2},
+                 {'layer': 'conv1', 'filter_idx': 1}, {'layer': 'conv1', 'filter_idx': 0}]
+        payloads = CountingActMax(cache=False).generate_many(np.zeros((1, 16, 16, 3)), nodes, model)
+        # One optimisation per layer, each filter optimised once
+        self.assertEqual(batches, [('conv1', [0, 1]), ('conv2', [2])])
+        self.assertEqual([payload.content.size for payload in payloads], [(16, 16)] * 4)
+        self.assertIs(payloads[0].content, payloads[3].content)
@@ -14,6 +14,7 @@ from argflow.gaf.frameworks import BipolarFramework
 from argflow.gaf.default_mappers import DefaultConvolutionalInfluenceMapper, DefaultConvolutionalStrengthMapper, \
     DefaultConvolutionalCharacterisationMapper
 from argflow.chi.cnn import GradCAM
+from argflow.chi.cnn._gradcam import _resize_bilinear, colormap_lut
 from argflow.chi import Chi
 
 
@@ -34,3 +35,57 @@ class TestGradCAM(unittest.TestCase):
         img = gc.generate(x, node, model).content
 
         self.assertEqual(img.size, (28, 28))
+
+    def test_gradcam_heatmaps(self):
+        model = Sequential()
+        model.add(Conv2D(8, kernel_size=3, activation='relu',
+                         input_shape=(12, 12, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(10, activation='softmax'))
+        x = np.random.rand(1, 12, 12, 3) * 255
+        gc = GradCAM()
+        heatmaps = gc._make_gradcam_heatmaps(x, model, 'conv1', [1, 5, 2])
+        self.assertEqual(heatmaps.shape, (3, 10, 10))
+        # The layer ran once; single filters are served from the same activations
+        self.assertEqual(len(gc._activations), 1)
+        for heatmap, filter_idx in zip(heatmaps, [1, 5, 2]):
+            np.testing.assert_allclose(
+                gc._make_gradcam_heatmap(x, model, 'conv1', filter_idx), heatmap)
+        self.assertEqual(len(gc._activations), 1)
+        # Activations of a previous input are dropped
+        digest = gc._input_digest
+        gc._make_gradcam_heatmap(x + 1, model, 'conv1', 0)
+        self.assertNotEqual(gc._input_digest, digest)
+        self.assertEqual(len(gc._activations), 1)
+
+    def test_render_heatmaps(self):
+        heatmaps = np.random.rand(3, 7, 5).astype(np.float32)
+        x = np.random.rand(1, 20, 16, 3) * 255
+        images = GradCAM(colormap='viridis', alpha=0.4)._render_heatmaps(x, heatmaps, (16, 20))
+        self.assertEqual([image.size for image in images], [(16, 20)] * 3)
+        self.assertEqual(images[0].mode, 'RGB')
+        # Resizing agrees with PIL's bilinear filter away from the borders
+        resized = _resize_bilinear(heatmaps, 20, 16)
+        expected = np.asarray(Image.fromarray(heatmaps[0]).resize((16, 20), Image.BILINEAR))
+        np.testing.assert_allclose(resized[0, 2:-2, 2:-2], expected[2:-2, 2:-2], atol=1e-4)
+        # Colormap tables are built once
+        self.assertIs(colormap_lut('jet'), colormap_lut('jet'))
+        self.assertEqual(colormap_lut('jet').shape, (256, 3))
+
+    def test_generate_batch(self):
+        model = Sequential()
+        model.add(Conv2D(8, kernel_size=3, activation='relu',
+                         input_shape=(12, 12, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(10, activation='softmax'))
+        xs = [np.random.rand(1, 12, 12, 3) * 255 for _ in range(3)]
+        nodes = [[{'layer': 'conv1', 'filter_idx': i}, {'layer': 'conv1', 'filter_idx': 7}]
+                 for i in range(3)]
+        batched = GradCAM().generate_batch(xs, nodes, model)
+        self.assertEqual(len(batched), 3)
+        for x, x_nodes, payloads in zip(xs, nodes, batched):
+            expected = GradCAM().generate_many(x, x_nodes, model)
+            for payload, expected_payload in zip(payloads, expected):
+                np.testing.assert_allclose(np.asarray(payload.content, dtype=float),
+                                           np.asarray(expected_payload.content, dtype=float),
+                                           atol=1)
@@ -1,14 +1,33 @@
 import unittest
 
 import numpy as np
+import tensorflow as tf
 
 from keras.models import Sequential
-from keras.layers import Dense, Conv2D, Flatten
+from keras.layers import Dense, Conv2D, Flatten, MaxPooling2D, Softmax
 
+from argflow.chi import Chi
+from argflow.gaf import GAFExtractor, NodeColumns, Payload, PayloadType
+from argflow.chi.cnn import GradCAM
+from argflow.influence import InfluenceBackend
 from argflow.gaf.frameworks import BipolarFramework
 from argflow.gaf.default_mappers import (DefaultConvolutionalCharacterisationMapper,
                                          DefaultConvolutionalInfluenceMapper,
-                                         DefaultConvolutionalStrengthMapper)
+                                         DefaultConvolutionalStrengthMapper,
+                                         DefaultDenseInfluenceMapper,
+                                         HierarchicalConvolutionalInfluenceMapper,
+                                         IntegratedGradientsInfluenceMapper,
+                                         NeuronInfluenceMapper)
+
+
+class _NeuronChi(Chi):
+    def generate(self, x, node, model):
+        return Payload(node['fname'], PayloadType.STRING)
+
+
+class _FilterChi(Chi):
+    def generate(self, x, node, model):
+        return Payload(f"Filter {node['filter_idx']}", PayloadType.STRING)
 
 
 class TestDefaultConvolutionalMappers(unittest.TestCase):
@@ -62,3 +81,270 @@ class TestDefaultConvolutionalMappers(unittest.TestCase):
         self.assertEqual(len(confidence), 1)
         self.assertEqual(len(influences.nodes()), 12)
         self.assertEqual(len(influences.influences()), 20)
+
+    def test_top_filters(self):
+        model = Sequential()
+        model.add(Conv2D(16, kernel_size=3, input_shape=(8, 8, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(4, activation='softmax'))
+        x = np.random.rand(1, 8, 8, 3)
+        im = DefaultConvolutionalInfluenceMapper(no_filters=5)
+        preds, pooled_grads = im._forward_backward(model, x, model.get_layer('conv1'))
+        np.testing.assert_allclose(preds, model.predict(x, verbose=0), rtol=1e-5, atol=1e-6)
+        # Same filters, in the same order, as a full sort by magnitude
+        expected = np.abs(pooled_grads[0]).argsort()[-5:]
+        relevant = im.get_relevant(model, x, model.get_layer('conv1'), None)
+        self.assertEqual([idx for _, idx, _ in relevant], list(expected))
+        _, predicted_class, confidence = im.apply(model, x)
+        self.assertEqual(predicted_class[0], preds.argmax())
+        self.assertAlmostEqual(confidence[0], preds.max())
+
+    def test_influence_batch(self):
+        model = Sequential()
+        model.add(Conv2D(16, kernel_size=3, input_shape=(8, 8, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(4, activation='softmax'))
+        xs = [np.random.rand(1, 8, 8, 3) for _ in range(3)]
+        im = DefaultConvolutionalInfluenceMapper(no_filters=4)
+        batched = im.apply_batch(model, xs)
+        self.assertEqual(len(batched), 3)
+        for x, (influences, predicted_class, confidence) in zip(xs, batched):
+            expected, expected_class, expected_confidence = im.apply(model, x)
+            self.assertEqual(list(influences.nodes()), list(expected.nodes()))
+            self.assertEqual(predicted_class, expected_class)
+            self.assertAlmostEqual(confidence[0], expected_confidence[0], places=5)
+            for node, data in expected.nodes().items():
+                if 'grad' in data:
+                    self.assertAlmostEqual(influences.nodes()[node]['grad'], data['grad'],
+                                           places=5)
+
+    def test_apply_many(self):
+        nodes = [{'grad': -3.0, 'layer': 'conv1'}, {'grad': 2.0}, {'grad': 0.0}]
+        columns = NodeColumns(nodes)
+        self.assertEqual(list(columns), ['grad'])
+        sm = DefaultConvolutionalStrengthMapper()
+        np.testing.assert_array_equal(sm.apply_many(columns), [sm.apply(node) for node in nodes])
+        self.assertEqual([type(s) for s in sm.apply_many(columns)], [float] * 3)
+        cm = DefaultConvolutionalCharacterisationMapper()
+        self.assertEqual(list(cm.apply_many(columns)), [cm.apply(node) for node in nodes])
+        # Custom functions are applied node by node
+        custom = DefaultConvolutionalStrengthMapper(lambda node: len(node))
+        self.assertEqual(list(custom.apply_many(columns)), [2, 1, 1])
+        # Nodes without gradients get no strength
+        self.assertEqual(list(sm.apply_many(NodeColumns([{'grad': 1.0}, {}]))), [1.0, None])
+
+    def test_extract_scalars(self):
+        model = Sequential()
+        model.add(Conv2D(4, kernel_size=3, input_shape=(8, 8, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(3, activation='softmax'))
+        extractor = GAFExtractor(DefaultConvolutionalInfluenceMapper(),
+                                 DefaultConvolutionalStrengthMapper(),
+                                 DefaultConvolutionalCharacterisationMapper(), _FilterChi())
+        gaf = extractor.extract(model, np.random.rand(1, 8, 8, 3))
+        # The mapper's single-sample arrays are stored as plain values
+        conclusion = gaf.conclusions()['Prediction']
+        self.assertIs(type(conclusion['confidence']), float)
+        self.assertIs(type(conclusion['predicted_class']), int)
+        for argument in gaf.arguments().values():
+            self.assertIs(type(argument['strength']), float)
+        self.assertIn('"certainty"', gaf.serialise())
+
+    def test_columnar_influence(self):
+        model = Sequential()
+        model.add(Conv2D(16, kernel_size=3, input_shape=(8, 8, 3), name='conv1'))
+        model.add(Flatten())
+        model.add(Dense(4, activation='softmax'))
+        x = np.random.rand(1, 8, 8, 3)
+        expected, _, _ = DefaultConvolutionalInfluenceMapper(no_filters=4).apply(model, x)
+        im = DefaultConvolutionalInfluenceMapper(no_filters=4, backend=InfluenceBackend.COLUMNAR)
+        influences, _, _ = im.apply(model, x)
+        self.assertEqual(influences.backend, InfluenceBackend.COLUMNAR)
+        self.assertEqual(list(influences.nodes()), list(expected.nodes()))
+        for node, data in expected.nodes().items():
+            self.assertEqual(influences.nodes()[node].keys(), data.keys())
+            if 'grad' in data:
+                self.assertAlmostEqual(influences.nodes()[node]['grad'], data['grad'], places=5)
+        self.assertEqual(sorted((u, v) for u, v, _ in influences.influences()),
+                         sorted((u, v) for u, v, _ in expected.influences()))
+        # The extractor reads the strengths and characterisations by column
+        extractor = GAFExtractor(im, DefaultConvolutionalStrengthMapper(),
+                                 DefaultConvolutionalCharacterisationMapper(),
+                                 GradCAM())
+        gaf = extractor.extract(model, x)
+        self.assertEqual(len(gaf.arguments()), 4)
+
+    def test_hierarchical_influence(self):
+        model = Sequential()
+        model.add(Conv2D(8, kernel_size=3, input_shape=(16, 16, 3), name='conv1'))
+        model.add(Conv2D(8, kernel_size=3, name='conv2'))
+        model.add(MaxPooling2D(name='pool1'))
+        model.add(Conv2D(12, kernel_size=3, name='conv3'))
+        model.add(MaxPooling2D(name='pool2'))
+        model.add(Conv2D(16, kernel_size=2, name='conv4'))
+        model.add(Flatten())
+        model.add(Dense(4, activation='softmax'))
+        xs = [np.random.rand(1, 16, 16, 3) for _ in range(2)]
+        im = HierarchicalConvolutionalInfluenceMapper(no_filters=3)
+        # The last conv layer of each block
+        self.assertEqual(im._layer_names(model), ['conv2', 'conv3', 'conv4'])
+        self.assertEqual(HierarchicalConvolutionalInfluenceMapper(no_blocks=2)._layer_names(model),
+                         ['conv3', 'conv4'])
+        batched = im.apply_batch(model, xs)
+        influences, predicted_class, confidence = batched[0]
+        self.assertEqual(len(influences.nodes()), 2 + 3 * 3)
+        self.assertEqual(len(influences.influences()), 3 + 3 * 3 * 2 + 3)
+        starting, intermediate, terminal = influences.get_typed_nodes()
+        self.assertEqual((list(starting), list(terminal)), (['Input'], ['Prediction']))
+        self.assertEqual({influences.nodes()[node]['layer'] for node in intermediate},
+                         {'conv2', 'conv3', 'conv4'})
+        np.testing.assert_array_equal(predicted_class, model.predict(xs[0], verbose=0).argmax(-1))
+        # The last layer's filters and gradients match the shallow mapper
+        expected, _, _ = DefaultConvolutionalInfluenceMapper(no_filters=3).apply(model, xs[0])
+        for node, data in expected.nodes().items():
+            if 'filter_idx' in data:
+                deep = influences.nodes()[f'conv4 {node}']
+                self.assertAlmostEqual(deep['grad'], data['grad'], places=5)
+        self.assertEqual(list(im.apply(model, xs[1])[0].nodes()), list(batched[1][0].nodes()))
+        gaf = GAFExtractor(im, DefaultConvolutionalStrengthMapper(),
+                           DefaultConvolutionalCharacterisationMapper(),
+                           GradCAM()).extract(model, xs[0])
+        self.assertEqual(len(gaf.arguments()), 9)
+
+    def test_dense_influence(self):
+        model = Sequential()
+        model.add(Dense(8, activation='relu', input_shape=(3,)))
+        model.add(Dense(4))
+        model.add(Softmax())
+        xs = [np.random.rand(1, 3) for _ in range(3)]
+        im = DefaultDenseInfluenceMapper(feature_names={0: 'a', 1: 'b', 2: 'c'})
+        batched = im.apply_batch(model, xs)
+        influences, predicted_class, confidence = batched[0]
+        preds = model.predict(xs[0], verbose=0)[0]
+        self.assertEqual(predicted_class, preds.argmax())
+        self.assertAlmostEqual(confidence, preds.max(), places=5)
+        self.assertEqual(len(influences.nodes()), 5)
+        self.assertEqual(len(influences.influences()), 6)
+        nodes = influences.nodes()
+        self.assertEqual([nodes[f'Feature {i}']['fname'] for i in range(3)], ['a', 'b', 'c'])
+        self.assertAlmostEqual(nodes['Feature 1']['value'], xs[0][0, 1], places=5)
+        # Gradients of the top logit, the output of the layer before the softmax
+        x_tensor = tf.convert_to_tensor(xs[0], dtype=tf.float32)
+        with tf.GradientTape() as tape:
+            tape.watch(x_tensor)
+            logit = model.layers[1](model.layers[0](x_tensor))[0, predicted_class]
+        expected = tape.gradient(logit, x_tensor)[0].numpy()
+        np.testing.assert_allclose([nodes[f'Feature {i}']['grad'] for i in range(3)], expected,
+                                   rtol=1e-5, atol=1e-7)
+        # Flat inputs are single samples too
+        single, _, _ = im.apply(model, list(xs[1][0]))
+        self.assertEqual(list(single.nodes()), list(batched[1][0].nodes()))
+        summed = DefaultDenseInfluenceMapper(target='sum').apply(model, xs[0])[0].nodes()
+        self.assertEqual(summed['Feature 0']['fname'], 'Feature 0')
+        with self.assertRaises(ValueError):
+            DefaultDenseInfluenceMapper(target='mean')
+
+    def test_dense_influence_softmax_activation(self):
+        # The output layer applies the softmax itself
+        model = Sequential()
+        model.add(Dense(8, activation='relu', input_shape=(3,)))
+        model.add(Dense(4, activation='softmax'))
+        x = np.random.rand(1, 3)
+        influences, predicted_class, confidence = DefaultDenseInfluenceMapper().apply(model, x)
+        preds = model.predict(x, verbose=0)[0]
+        self.assertEqual(predicted_class, preds.argmax())
+        self.assertAlmostEqual(confidence, preds.max(), places=5)
+        self.assertIs(type(confidence), float)
+        # Gradients of the top logit, the output layer's pre-activation
+        dense = model.layers[1]
+        x_tensor = tf.convert_to_tensor(x, dtype=tf.float32)
+        with tf.GradientTape() as tape:
+            tape.watch(x_tensor)
+            logit = (tf.matmul(model.layers[0](x_tensor), dense.kernel) + dense.bias)[0, predicted_class]
+        expected = tape.gradient(logit, x_tensor)[0].numpy()
+        nodes = influences.nodes()
+        np.testing.assert_allclose([nodes[f'Feature {i}']['grad'] for i in range(3)], expected,
+                                   rtol=1e-5, atol=1e-7)
+
+    def test_integrated_gradients(self):
+        model = Sequential()
+        model.add(Dense(8, activation='tanh', input_shape=(3,)))
+        model.add(Dense(4))
+        model.add(Softmax())
+        logits = Sequential(model.layers[:-1])
+        xs = [np.random.rand(1, 3) for _ in range(3)]
+        baseline = np.array([0.5, -0.5, 0.])
+        im = IntegratedGradientsInfluenceMapper(steps=100, baseline=baseline)
+        batched = im.apply_batch(model, xs)
+        for x, (influences, predicted_class, confidence) in zip(xs, batched):
+            preds = model.predict(x, verbose=0)[0]
+            self.assertEqual(predicted_class, preds.argmax())
+            self.assertAlmostEqual(confidence, preds.max(), places=5)
+            attributions = [influences.nodes()[f'Feature {i}']['grad'] for i in range(3)]
+            # The attributions add up to the change of the explained output along the path
+            change = (logits(x).numpy()[0] - logits(baseline[None]).numpy()[0])[predicted_class]
+            self.assertAlmostEqual(sum(attributions), change, places=4)
+            self.assertAlmostEqual(influences.nodes()['Feature 2']['value'], x[0, 2], places=5)
+        single, _, _ = im.apply(model, xs[1])
+        np.testing.assert_allclose(
+            [single.nodes()[f'Feature {i}']['grad'] for i in range(3)],
+            [batched[1][0].nodes()[f'Feature {i}']['grad'] for i in range(3)], rtol=1e-4, atol=1e-6)
+        # For a linear model, the integrated gradients are the gradients times the input
+        linear = Sequential([Dense(2, input_shape=(3,)), Softmax()])
+        influences, predicted_class, _ = IntegratedGradientsInfluenceMapper(steps=2).apply(
+            linear, xs[0])
+        weights = linear.layers[0].get_weights()[0][:, predicted_class]
+        np.testing.assert_allclose([influences.nodes()[f'Feature {i}']['grad'] for i in range(3)],
+                                   weights * xs[0][0], rtol=1e-5, atol=1e-6)
+        with self.assertRaises(ValueError):
+            IntegratedGradientsInfluenceMapper(steps=0)
+
+    def test_neuron_influence(self):
+        model = Sequential()
+        model.add(Dense(32, activation='relu', input_shape=(13,), name='hidden1'))
+        model.add(Dense(32, activation='relu', name='hidden2'))
+        model.add(Dense(5, name='logits'))
+        model.add(Softmax())
+        xs = [np.random.rand(1, 13) for _ in range(2)]
+        # Unpruned, every neuron of a layer influences every neuron of the next
+        influences, predicted_class, confidence = NeuronInfluenceMapper(None, None).apply(model, xs[0])
+        preds = model.predict(xs[0], verbose=0)[0]
+        self.assertEqual(predicted_class, preds.argmax())
+        self.assertAlmostEqual(confidence, preds.max(), places=5)
+        self.assertEqual(len(influences.nodes()), 2 + 13 + 32 + 32)
+        self.assertEqual(len(influences.influences()), 13 + 13 * 32 + 32 * 32 + 32)
+        nodes = influences.nodes()
+        hidden1 = model.get_layer('hidden1')(xs[0]).numpy()[0]
+        kernel = model.get_layer('hidden2').get_weights()[0]
+        edges = {(u, v): data for u, v, data in influences.influences()}
+        self.assertAlmostEqual(edges['hidden1 Neuron 3', 'hidden2 Neuron 7']['contribution'],
+                               hidden1[3] * kernel[3, 7], places=5)
+        self.assertAlmostEqual(nodes['hidden1 Neuron 3']['value'], hidden1[3], places=5)
+        self.assertEqual(nodes['Feature 4']['layer'], 'input')
+
+        # Pruned before the graph is built
+        im = NeuronInfluenceMapper(max_neurons=8, max_edges=2,
+                                   feature_names=[f'f{i}' for i in range(13)])
+        batched = im.apply_batch(model, xs)
+        influences, _, _ = batched[0]
+        starting, intermediate, terminal = influences.get_typed_nodes()
+        self.assertEqual((list(starting), list(terminal)), (['Input'], ['Prediction']))
+        self.assertEqual(len(intermediate), 3 * 8)
+        for layer in ('input', 'hidden1', 'hidden2'):
+            grads = [data['grad'] for data in influences.nodes().values()
+                     if data.get('layer') == layer]
+            self.assertEqual(len(grads), 8)
+        for node in intermediate:
+            out_degree = len(influences.influences_from(node))
+            self.assertGreaterEqual(out_degree, 1)
+            if not node.startswith('hidden2'):
+                # At most max_edges, plus the largest incoming influences of other neurons
+                self.assertLessEqual(out_degree, 8)
+        self.assertLess(len(influences.influences()), 8 + 2 * 8 * 8 + 8)
+        self.assertTrue(all(influences.nodes()[node]['fname'].startswith('f')
+                            for node in intermediate if node.startswith('Feature')))
+        self.assertEqual(list(im.apply(model, xs[1])[0].nodes()), list(batched[1][0].nodes()))
+        gaf = GAFExtractor(im, DefaultConvolutionalStrengthMapper(),
+                           DefaultConvolutionalCharacterisationMapper(),
+                           _NeuronChi()).extract(model, xs[0])
+        self.assertEqual(len(gaf.arguments()), 24)
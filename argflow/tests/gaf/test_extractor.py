@@ -5,7 +5,7 @@ import unittest
 from argflow.influence import InfluenceGraph
 from argflow.gaf.mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper
 from argflow.chi import Chi
-from argflow.gaf import GAF, Payload, PayloadType, NodeType, GAFExtractor
+from argflow.gaf import GAF, GAFBackend, Payload, PayloadType, NodeType, GAFExtractor
 from argflow.gaf.frameworks import BipolarFramework, SupportFramework, TripolarFramework
 
 
@@ -40,3 +40,63 @@ class TestGAF(unittest.TestCase):
     def test_simple(self):
         extractor = GAFExtractor(DemoIM(), DemoSM(), DemoCM(), DemoChi())
         extractor.extract('some model', 'some input')
+
+    def test_progress(self):
+        stages = []
+        extractor = GAFExtractor(DemoIM(), DemoSM(), DemoCM(), DemoChi())
+        extractor.extract('some model', 'some input', progress=stages.append)
+        self.assertEqual(stages, ['influence_mapping', 'chi_generation', 'gaf_construction'])
+
+    def test_structure(self):
+        for backend in GAFBackend:
+            extractor = GAFExtractor(DemoIM(), DemoSM(), DemoCM(), DemoChi(),
+                                     backend=backend)
+            gaf = extractor.extract('some model', 'some input')
+            self.assertEqual(gaf.backend, backend)
+            self.assertEqual(list(gaf.inputs()), ['has leaves'])
+            self.assertEqual(
+                dict(gaf.arguments()),
+                {'orange plant': {'strength': 2,
+                                  'payload': Payload('Feature', PayloadType.STRING),
+                                  'type': NodeType.ARGUMENT}}
+            )
+            self.assertEqual(gaf.conclusions()['carrot']['predicted_class'], 'carrot')
+            self.assertEqual(
+                gaf.relations_from('has leaves'),
+                [('has leaves', 'orange plant', {'relation': BipolarFramework.SUPPORT})]
+            )
+
+    def test_extract_batch(self):
+        class CountingIM(DemoIM):
+            batches = []
+
+            def apply_batch(self, model, xs):
+                self.batches.append(len(xs))
+                return super().apply_batch(model, xs)
+
+        im = CountingIM()
+        extractor = GAFExtractor(im, DemoSM(), DemoCM(), DemoChi())
+        gafs = extractor.extract_batch('some model', (f'input {i}' for i in range(5)),
+                                       batch_size=2)
+        # GAFs are generated lazily
+        self.assertEqual(im.batches, [])
+        gafs = list(gafs)
+        self.assertEqual(im.batches, [2, 2, 1])
+        expected = extractor.extract('some model', 'some input')
+        for gaf in gafs:
+            self.assertEqual(dict(gaf.arguments()), dict(expected.arguments()))
+            self.assertEqual(list(gaf.inputs()), list(expected.inputs()))
+        with self.assertRaises(ValueError):
+            list(extractor.extract_batch('some model', [], batch_size=0))
+
+    def test_apply_many(self):
+        class ColumnarSM(DemoSM):
+            def apply(self, node):
+                raise AssertionError('strengths should be computed by column')
+
+            def apply_many(self, nodes):
+                return nodes['value'] * 10
+
+        gaf = GAFExtractor(DemoIM(), ColumnarSM(), DemoCM(), DemoChi()).extract(
+            'some model', 'some input')
+        self.assertEqual(gaf.arguments()['orange plant']['strength'], 20)
@@ -1,3 +1,4 @@
+import io
 import os
 import glob
 import json
@@ -5,8 +6,9 @@ import tempfile
 import unittest
 
 from PIL import Image
-from argflow.gaf import GAF, Payload, PayloadType, NodeType
+from argflow.gaf import GAF, GAFBackend, Payload, PayloadEncoder, PayloadType, NodeType
 from argflow.gaf.frameworks import BipolarFramework, SupportFramework, TripolarFramework
+from argflow.influence import InfluenceGraph
 
 _resource_dir = os.path.join(os.path.dirname(
     os.path.realpath(__file__)), '..', 'resources')
@@ -99,6 +101,23 @@ class TestGAF(unittest.TestCase):
             }
         )
 
+    def test_typed_views(self):
+        gaf = GAF()
+        arguments = gaf.arguments()
+        gaf.add_input(0)
+        gaf.add_argument(1, strength=2)
+        gaf.add_argument(2)
+        self.assertEqual(list(arguments), [1, 2])
+        self.assertEqual(list(gaf.inputs()), [0])
+        with self.assertRaises(TypeError):
+            arguments[3] = {}
+        # Re-adding a node with another type moves it between indexes
+        gaf.add_conclusion(2, 0.5, 1)
+        self.assertEqual(list(arguments), [1])
+        self.assertEqual(list(gaf.conclusions()), [2])
+        gaf.remove_node(1)
+        self.assertEqual(len(arguments), 0)
+
     def test_create_image_payload(self):
         temp = tempfile.TemporaryDirectory()
         gaf = GAF()
@@ -123,6 +142,36 @@ class TestGAF(unittest.TestCase):
         self.assertEqual(len(generated_payloads), 2)
         temp.cleanup()
 
+    def test_parallel_payload_encoding(self):
+        img = Image.open(os.path.join(
+            _resource_dir, 'test.png')).convert('RGB')
+        gaf = GAF()
+        gaf.add_input(0, payload=Payload(img, PayloadType.IMAGE))
+        for i in range(1, 9):
+            gaf.add_argument(i, strength=i, payload=Payload(
+                (img, img), PayloadType.IMAGE_PAIR))
+            gaf.add_relation(0, i, BipolarFramework.SUPPORT)
+        outputs = []
+        for workers in (0, 4):
+            temp = tempfile.TemporaryDirectory()
+            output = json.loads(gaf.serialise(root_dir=temp.name, workers=workers))
+            files = {}
+            for path in glob.glob(os.path.join(temp.name, '*.jpg')):
+                with open(path, 'rb') as f:
+                    files[os.path.basename(path)] = f.read()
+            outputs.append((output, files))
+            temp.cleanup()
+        # Same paths and bytes whether or not encoding runs on a thread pool
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(len(outputs[0][1]), 17)
+        self.assertEqual(outputs[0][0]['nodes']['0']['payload'], '0.jpg')
+        temp = tempfile.TemporaryDirectory()
+        output = json.loads(gaf.serialise(
+            root_dir=temp.name, encoder=PayloadEncoder('PNG', 'png', compress_level=1)))
+        self.assertEqual(output['nodes']['1']['payload']['feature']['payload'], '1_snd.png')
+        self.assertEqual(len(glob.glob(os.path.join(temp.name, '*.png'))), 17)
+        temp.cleanup()
+
     def test_create_invalid_payload(self):
         gaf = GAF()
         with self.assertRaises(TypeError):
@@ -167,3 +216,216 @@ class TestGAF(unittest.TestCase):
                 decoder.decode(f.read())
             )
             f.close()
+
+
+class TestCompactGAF(unittest.TestCase):
+
+    def test_add_argument(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1,
+                         strength=2,
+                         payload=Payload('test', PayloadType.STRING))
+        gaf.add_argument(2)
+        self.assertEqual(
+            gaf.arguments(),
+            {
+                1: {'strength': 2, 'payload': Payload('test', PayloadType.STRING), 'type': NodeType.ARGUMENT},
+                2: {'strength': None, 'payload': None,  'type': NodeType.ARGUMENT}
+            }
+        )
+
+    def test_overwrite_relation(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1, strength=2)
+        gaf.add_argument(2)
+        gaf.add_argument(3)
+        gaf.add_relation(1, 2, BipolarFramework.SUPPORT)
+        gaf.add_relation(1, 3, BipolarFramework.SUPPORT)
+        gaf.add_relation(1, 2, BipolarFramework.ATTACK)
+        self.assertEqual(
+            gaf.relations_from(1),
+            [(1, 2, {'relation': BipolarFramework.ATTACK}),
+             (1, 3, {'relation': BipolarFramework.SUPPORT})]
+        )
+
+    def test_remove_node(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1, strength=2)
+        gaf.add_argument(2)
+        gaf.add_relation(1, 2, BipolarFramework.SUPPORT)
+        gaf.remove_node(2)
+        self.assertEqual(
+            gaf.arguments(),
+            {
+                1: {'strength': 2, 'payload': None, 'type': NodeType.ARGUMENT}
+            }
+        )
+        self.assertEqual(gaf.relations_from(1), [])
+
+    def test_remove_relation_framework_reset(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1, strength=2)
+        gaf.add_argument(2)
+        gaf.add_argument(3)
+        gaf.add_relation(1, 2, TripolarFramework.SUPPORT)
+        gaf.remove_relation(1, 2)
+        gaf.add_relation(1, 3, BipolarFramework.ATTACK)
+        self.assertEqual(
+            gaf.relations_from(1),
+            [(1, 3, {'relation': BipolarFramework.ATTACK})]
+        )
+
+    def test_serialise(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1, strength=1, payload=Payload(
+            '1', PayloadType.STRING))
+        gaf.add_argument(2, strength=2, payload=Payload(
+            '2', PayloadType.STRING))
+        gaf.add_conclusion(3, 0.5, 1)
+        gaf.add_relation(1, 2, BipolarFramework.ATTACK)
+        gaf.add_relation(2, 3, BipolarFramework.SUPPORT)
+        decoder = json.decoder.JSONDecoder()
+        with open(os.path.join(_resource_dir, 'basic_gaf.json'), 'r') as f:
+            self.assertEqual(
+                decoder.decode(gaf.serialise()),
+                decoder.decode(f.read())
+            )
+            f.close()
+
+    def test_convert_backend(self):
+        gaf = GAF()
+        gaf.add_input('picture of carrot', payload=Payload(
+            'picture', PayloadType.STRING))
+        gaf.add_argument('orange', strength=1, payload=Payload(
+            'orange body', PayloadType.STRING))
+        gaf.add_conclusion('carrot', 0.5, 1)
+        gaf.add_relation('picture of carrot', 'orange',
+                         BipolarFramework.ATTACK)
+        gaf.add_relation('orange', 'carrot', BipolarFramework.SUPPORT)
+        compact = gaf.to_backend(GAFBackend.COMPACT)
+        self.assertEqual(compact.backend, GAFBackend.COMPACT)
+        self.assertEqual(compact.serialise(), gaf.serialise())
+        restored = compact.to_backend(GAFBackend.NETWORKX)
+        self.assertEqual(restored.conclusions(), gaf.conclusions())
+        self.assertEqual(restored.relations_from('orange'),
+                         gaf.relations_from('orange'))
+        with self.assertRaises(TypeError):
+            restored.add_relation('orange', 'carrot', TripolarFramework.SUPPORT)
+
+    def test_framework_reset_across_enums(self):
+        gaf = GAF(backend=GAFBackend.COMPACT)
+        gaf.add_argument(1, strength=2)
+        gaf.add_argument(2)
+        gaf.add_relation(1, 2, TripolarFramework.ATTACK)
+        gaf.remove_relation(1, 2)
+        gaf.add_relation(1, 2, BipolarFramework.ATTACK)
+        self.assertIs(gaf.relations_from(1)[0][2]['relation'], BipolarFramework.ATTACK)
+
+
+class TestBulkGAF(unittest.TestCase):
+
+    def _carrot_arrays(self):
+        return dict(
+            node_ids=['picture of carrot', 'orange', 'green', 'carrot'],
+            types=[NodeType.INPUT, NodeType.ARGUMENT,
+                   NodeType.ARGUMENT, NodeType.CONCLUSION],
+            strengths=[None, 1, 2, None],
+            edge_src=['picture of carrot', 'picture of carrot', 'green', 'orange'],
+            edge_dst=['orange', 'green', 'carrot', 'carrot'],
+            relations=[BipolarFramework.ATTACK, BipolarFramework.SUPPORT,
+                       BipolarFramework.ATTACK, BipolarFramework.SUPPORT],
+            payloads=[Payload('picture', PayloadType.STRING),
+                      Payload('orange body', PayloadType.STRING),
+                      Payload('green leaves', PayloadType.STRING),
+                      None],
+            confidence=0.5,
+            predicted_class=1
+        )
+
+    def test_from_arrays(self):
+        decoder = json.decoder.JSONDecoder()
+        for backend in GAFBackend:
+            gaf = GAF.from_arrays(backend=backend, **self._carrot_arrays())
+            self.assertEqual(gaf.backend, backend)
+            with open(os.path.join(_resource_dir, 'carrot_gaf.json'), 'r') as f:
+                self.assertEqual(
+                    decoder.decode(gaf.serialise()),
+                    decoder.decode(f.read())
+                )
+            self.assertEqual(
+                gaf.relations_from('green'),
+                [('green', 'carrot', {'relation': BipolarFramework.ATTACK})]
+            )
+
+    def test_from_arrays_single_relation(self):
+        gaf = GAF.from_arrays([1, 2], [NodeType.ARGUMENT, NodeType.ARGUMENT],
+                              edge_src=[1], edge_dst=[2],
+                              relations=SupportFramework.SUPPORT)
+        self.assertEqual(
+            gaf.relations_from(1),
+            [(1, 2, {'relation': SupportFramework.SUPPORT})]
+        )
+        with self.assertRaises(TypeError):
+            gaf.add_relation(2, 1, BipolarFramework.SUPPORT)
+
+    def test_from_arrays_illegal(self):
+        arrays = self._carrot_arrays()
+        with self.assertRaises(TypeError):
+            GAF.from_arrays(**dict(arrays, payloads=[None, None, 69, None]))
+        with self.assertRaises(TypeError):
+            GAF.from_arrays(**dict(arrays, relations=[
+                BipolarFramework.ATTACK, BipolarFramework.SUPPORT,
+                TripolarFramework.ATTACK, BipolarFramework.SUPPORT]))
+        with self.assertRaises(ValueError):
+            GAF.from_arrays(**dict(arrays, edge_dst=['orange', 'green', 'carrot', 'potato']))
+        with self.assertRaises(ValueError):
+            GAF.from_arrays(**dict(arrays, strengths=[1, 2]))
+
+    def test_from_arrays_duplicates(self):
+        for backend in GAFBackend:
+            with self.assertRaisesRegex(ValueError, 'unique'):
+                GAF.from_arrays(['orange', 'green', 'orange'], [NodeType.ARGUMENT] * 3,
+                                strengths=[1, 2, 3], backend=backend)
+
+    def test_from_influence_graph_missing_relation(self):
+        influences = InfluenceGraph()
+        influences.add_node('input')
+        influences.add_node('output')
+        influences.add_influence('input', 'output')
+        with self.assertRaisesRegex(ValueError, "'input'"):
+            GAF.from_influence_graph(influences, relations={})
+
+
+class TestCompactSerialisation(unittest.TestCase):
+
+    def _basic_gaf(self):
+        gaf = GAF()
+        gaf.add_argument(1, strength=1, payload=Payload(
+            '1', PayloadType.STRING))
+        gaf.add_argument(2, strength=2, payload=Payload(
+            '2', PayloadType.STRING))
+        gaf.add_conclusion(3, 0.5, 1)
+        gaf.add_relation(1, 2, BipolarFramework.ATTACK)
+        gaf.add_relation(2, 3, BipolarFramework.SUPPORT)
+        return gaf
+
+    def _expected(self):
+        with open(os.path.join(_resource_dir, 'basic_gaf.json'), 'r') as f:
+            return json.loads(f.read())
+
+    def test_serialise_compact(self):
+        output = self._basic_gaf().serialise(compact=True)
+        self.assertNotIn('\n', output)
+        self.assertEqual(json.loads(output), self._expected())
+
+    def test_serialise_to(self):
+        for compact in (False, True):
+            f = io.StringIO()
+            self._basic_gaf().serialise_to(f, compact=compact)
+            self.assertEqual(json.loads(f.getvalue()), self._expected())
+
+    def test_serialise_to_empty(self):
+        f = io.StringIO()
+        GAF().serialise_to(f, name='empty')
+        self.assertEqual(json.loads(f.getvalue()),
+                         {'name': 'empty', 'input': [], 'conclusion': [], 'nodes': {}})
@@ -0,0 +1,130 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from keras.models import Sequential
+from keras.layers import Dense
+
+from argflow.cache import DiskCache
+from argflow.influence import InfluenceGraph
+from argflow.gaf import GAFExtractor, InfluenceCache
+from argflow.gaf.mappers import InfluenceMapper
+
+from .test_extractor import DemoSM, DemoCM, DemoChi
+
+# Prints the digest of a mapper holding a set of strings, whose order depends on the
+# process's hash seed
+MAPPER_DIGEST = """
+from argflow.gaf.influence_cache import _mapper_digest
+from argflow.gaf.mappers import InfluenceMapper
+
+
+class SetIM(InfluenceMapper):
+    def __init__(self):
+        self.layers = {'conv1', 'conv2', 'conv3', 'dense1', 'dense2'}
+        self.options = {'steps': 50, 'baseline': None}
+
+    def apply(self, model, x):
+        pass
+
+
+print(_mapper_digest(SetIM()))
+"""
+
+
+class CountingIM(InfluenceMapper):
+
+    def __init__(self, scale=1):
+        super().__init__()
+        self.scale = scale
+        self.inputs = 0
+
+    def __getstate__(self):
+        # The count isn't a setting, so it's left out of the mapper's hash
+        return {'scale': self.scale}
+
+    def apply(self, model, x):
+        self.inputs += 1
+        influences = InfluenceGraph()
+        influences.add_node('input')
+        influences.add_node('feature', value=float(np.sum(x)) * self.scale)
+        influences.add_node('output')
+        influences.add_influence('input', 'feature')
+        influences.add_influence('feature', 'output')
+        return influences, 'output', 0.5
+
+
+class TestInfluenceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model = Sequential([Dense(2, input_shape=(3,))])
+
+    def test_memory(self):
+        cache = InfluenceCache(max_entries=2)
+        mapper = CountingIM()
+        x = np.arange(3.)
+        influences, predicted_class, confidence = cache.apply(mapper, self.model, x)
+        self.assertIs(cache.apply(mapper, self.model, x.copy())[0], influences)
+        self.assertEqual((predicted_class, confidence), ('output', 0.5))
+        self.assertEqual(mapper.inputs, 1)
+        # Other mapper settings, inputs or models are other results
+        cache.apply(CountingIM(scale=2), self.model, x)
+        cache.apply(mapper, self.model, x.astype(np.float32))
+        self.assertEqual(mapper.inputs, 2)
+        other_model = Sequential([Dense(2, input_shape=(3,))])
+        self.assertNotEqual(cache.key(mapper, other_model, x), cache.key(mapper, self.model, x))
+        # Only the most recently used results are kept
+        self.assertEqual(len(cache), 2)
+        cache.apply(mapper, self.model, x)
+        self.assertEqual(mapper.inputs, 3)
+
+    def test_disk(self):
+        temp = tempfile.TemporaryDirectory()
+        mapper = CountingIM()
+        x = np.arange(3.)
+        cache = InfluenceCache(disk_cache=DiskCache(temp.name))
+        influences, _, _ = cache.apply(mapper, self.model, x)
+        # A new cache, e.g. in another process, reads the result from disk
+        cache = InfluenceCache(max_entries=0, disk_cache=DiskCache(temp.name))
+        cached, predicted_class, confidence = cache.apply(mapper, self.model, x)
+        self.assertEqual(mapper.inputs, 1)
+        self.assertEqual(dict(cached.nodes()), dict(influences.nodes()))
+        self.assertEqual(list(cached.influences()), list(influences.influences()))
+        self.assertEqual([list(nodes) for nodes in cached.get_typed_nodes()],
+                         [['input'], ['feature'], ['output']])
+        self.assertEqual((predicted_class, confidence), ('output', 0.5))
+        cache.clear()
+        cache.apply(mapper, self.model, x)
+        self.assertEqual(mapper.inputs, 2)
+        temp.cleanup()
+
+    def test_extract(self):
+        mapper = CountingIM()
+        extractor = GAFExtractor(mapper, DemoSM(), DemoCM(), DemoChi(),
+                                 influence_cache=InfluenceCache())
+        xs = [np.full(3, i, dtype=np.float32) for i in range(4)]
+        extractor.extract(self.model, xs[0])
+        gafs = list(extractor.extract_batch(self.model, xs, batch_size=2))
+        # Only the inputs that weren't explained before reach the mapper
+        self.assertEqual(mapper.inputs, 4)
+        self.assertEqual([gaf.arguments()['feature']['strength'] for gaf in gafs],
+                         [0., 3., 6., 9.])
+        extractor.extract(self.model, xs[3])
+        self.assertEqual(mapper.inputs, 4)
+
+    def test_mapper_digest(self):
+        # The same mapper has the same key in every process, so disk results are reused
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        digests = set()
+        for seed in ('1', '2', '3'):
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+            digests.add(subprocess.run([sys.executable, '-c', MAPPER_DIGEST], env=env,
+                                       check=True, stdout=subprocess.PIPE).stdout)
+        self.assertEqual(len(digests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
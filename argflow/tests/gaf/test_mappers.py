@@ -1,6 +1,7 @@
 import unittest
 
-from argflow.gaf.mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper, ExtractorMapper
+from argflow.gaf.mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper, ExtractorMapper, \
+    NodeColumns
 
 
 class TestAbstractMappers(unittest.TestCase):
@@ -39,3 +40,21 @@ class TestAbstractMappers(unittest.TestCase):
 
         d = Dummy()
         self.assertIsNone(d.apply())
+
+    def test_node_columns(self):
+        columns = NodeColumns([{'grad': 1, 'value': 'a'}, {'grad': -2}])
+        self.assertEqual(columns.size, 2)
+        self.assertEqual(list(columns), ['grad'])
+        self.assertEqual(columns['grad'].tolist(), [1, -2])
+        self.assertIs(columns['grad'], columns['grad'])
+        with self.assertRaises(KeyError):
+            columns['value']
+        self.assertEqual(columns.rows[0]['value'], 'a')
+        self.assertEqual(len(NodeColumns([])), 0)
+
+    def test_apply_many(self):
+        class Dummy(StrengthMapper):
+            def apply(self, node):
+                return node['grad'] * 2
+
+        self.assertEqual(Dummy().apply_many(NodeColumns([{'grad': 1}, {'grad': 3}])), [2, 6])
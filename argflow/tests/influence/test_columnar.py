@@ -0,0 +1,107 @@
+import unittest
+
+import numpy as np
+
+from argflow.influence import InfluenceBackend, InfluenceGraph
+
+
+def _build(backend):
+    ig = InfluenceGraph(backend=backend)
+    ig.add_node('Prediction')
+    ig.add_node('Input', grad=0)
+    grads = np.array([0.5, -1.5, 2.0], dtype=np.float32)
+    names = [f'Filter {i}' for i in range(3)]
+    ig.add_nodes_from_arrays(names, layer=['conv'] * 3, filter_idx=np.arange(3), grad=grads)
+    ig.add_influences_from_arrays(['Input'] * 3, names)
+    ig.add_influences_from_arrays(names, ['Prediction'] * 3, weight=[1, 2, 3])
+    return ig
+
+
+def _snapshot(ig):
+    starting, intermediate, terminal = ig.get_typed_nodes()
+    return (dict(ig.nodes()), sorted(ig.influences(), key=repr),
+            set(starting), set(intermediate), set(terminal))
+
+
+class TestColumnarGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.networkx = _build(InfluenceBackend.NETWORKX)
+        self.columnar = _build(InfluenceBackend.COLUMNAR)
+
+    def assertSameGraph(self):
+        self.assertEqual(_snapshot(self.columnar), _snapshot(self.networkx))
+
+    def test_build(self):
+        self.assertEqual(self.columnar.backend, InfluenceBackend.COLUMNAR)
+        self.assertSameGraph()
+        self.assertEqual(self.columnar.nodes()['Filter 1'],
+                         {'layer': 'conv', 'filter_idx': 1, 'grad': -1.5})
+        self.assertEqual(list(self.columnar.influences_from('Input')),
+                         [('Input', f'Filter {i}', {}) for i in range(3)])
+        self.assertEqual(list(self.columnar.nodes()),
+                         ['Prediction', 'Input', 'Filter 0', 'Filter 1', 'Filter 2'])
+
+    def test_updates(self):
+        for ig in (self.networkx, self.columnar):
+            # Attributes are merged, and may change type
+            ig.add_node('Filter 0', grad=3, note='x')
+            ig.add_node('Input', grad='none')
+            # Repeated influences update the existing ones
+            ig.add_influence('Filter 0', 'Prediction', weight=5.5)
+            ig.add_influences_from_arrays(['Filter 1', 'Filter 1'], ['Prediction', 'Input'],
+                                          weight=[7, 8])
+            ig.add_influence('Prediction', 'Extra', kind='new')
+            ig.remove_influence('Input', 'Filter 2')
+            ig.remove_node('Filter 0')
+        self.assertSameGraph()
+        self.assertEqual(self.columnar.nodes()['Input'], {'grad': 'none'})
+        self.assertEqual(self.columnar.nodes()['Extra'], {})
+        with self.assertRaises(KeyError):
+            self.columnar.remove_influence('Input', 'Filter 2')
+        for ig in (self.networkx, self.columnar):
+            ig.remove_node('Input')
+        self.assertSameGraph()
+
+    def test_bulk_validation(self):
+        for ig in (self.networkx, self.columnar):
+            with self.assertRaises(ValueError):
+                ig.add_nodes_from_arrays(['Input'], grad=[1])
+            with self.assertRaises(ValueError):
+                ig.add_nodes_from_arrays(['a', 'b'], grad=[1])
+            with self.assertRaises(ValueError):
+                ig.add_influences_from_arrays(['Input'], ['Missing'])
+
+    def test_node_columns(self):
+        names = [f'Filter {i}' for i in range(3)]
+        for ig in (self.networkx, self.columnar):
+            columns = ig.node_columns(names)
+            self.assertEqual(sorted(columns), ['filter_idx', 'grad', 'layer'])
+            np.testing.assert_array_equal(columns['grad'], [0.5, -1.5, 2.0])
+            self.assertEqual(columns['layer'].tolist(), ['conv'] * 3)
+            self.assertEqual(columns.rows[2]['filter_idx'], 2)
+            self.assertEqual(list(ig.node_columns(['Input', 'Filter 0'])), ['grad'])
+        # Numeric attributes are stored in typed columns, widened as needed
+        columns = self.columnar.node_columns(names)
+        self.assertEqual(columns['grad'].dtype, np.float64)
+        self.assertEqual(columns['filter_idx'].dtype.kind, 'i')
+
+    def test_mixed_values(self):
+        for ig in (self.networkx, self.columnar):
+            # Numbers among strings, and numbers of several kinds in one attribute
+            ig.add_node('a', layer=3, idx=1)
+            ig.add_node('b', idx=2.5)
+            ig.add_node('c', idx=True)
+            ig.add_nodes_from_arrays(['d', 'e'], idx=np.array([4, 5]), layer=[6, 'dense'])
+        self.assertSameGraph()
+        nodes = self.columnar.nodes()
+        self.assertEqual([(nodes[node]['idx'], type(nodes[node]['idx']))
+                          for node in 'abcd'],
+                         [(1, int), (2.5, float), (True, bool), (4, int)])
+        self.assertEqual(nodes['a']['layer'], 3)
+        self.assertEqual(nodes['Filter 0']['layer'], 'conv')
+        # Per-node arrays are kept as arrays
+        grads = np.arange(18.0).reshape(2, 3, 3)
+        self.columnar.add_nodes_from_arrays(['f', 'g'], grad=grads)
+        self.assertIsInstance(nodes['g']['grad'], np.ndarray)
+        np.testing.assert_array_equal(nodes['g']['grad'], grads[1])
@@ -27,7 +27,7 @@ class TestGraph(unittest.TestCase):
         ig.add_influence(1, 2, thing=1)
         ig.add_influence(2, 3, thing=2)
         self.assertEqual(
-            ig.influences(),
+            list(ig.influences()),
             [(1, 2, {'thing': 1}), (2, 3, {'thing': 2})]
         )
 
@@ -52,7 +52,7 @@ class TestGraph(unittest.TestCase):
         ig.add_influence(2, 3, thing=2)
         ig.remove_influence(2, 3)
         self.assertEqual(
-            ig.influences(),
+            list(ig.influences()),
             [(1, 2, {'thing': 1})]
         )
 
@@ -64,7 +64,7 @@ class TestGraph(unittest.TestCase):
         ig.add_influence(1, 2, thing=1)
         ig.add_influence(2, 3, thing=2)
         self.assertEqual(
-            ig.influences_from(1),
+            list(ig.influences_from(1)),
             [(1, 2, {'thing': 1})]
         )
 
@@ -76,6 +76,38 @@ class TestGraph(unittest.TestCase):
         ig.add_influence(1, 2, thing=1)
         ig.add_influence(2, 3, thing=2)
         start, mid, terminal = ig.get_typed_nodes()
-        self.assertEqual(start, [1])
-        self.assertEqual(mid, [2])
-        self.assertEqual(terminal, [3])
\ No newline at end of file
+        self.assertEqual(list(start), [1])
+        self.assertEqual(list(mid), [2])
+        self.assertEqual(list(terminal), [3])
+
+    def test_typed_nodes_maintained(self):
+        ig = InfluenceGraph()
+        start, mid, terminal = ig.get_typed_nodes()
+        ig.add_node(1)
+        # Isolated nodes are both starting and terminal
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1}, set(), {1}))
+        ig.add_influence(1, 2)
+        ig.add_influence(2, 3)
+        ig.add_influence(4, 3)
+        # The views are live
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1, 4}, {2}, {3}))
+        ig.add_node(2, activation=1)
+        self.assertEqual(set(mid), {2})
+        ig.remove_influence(2, 3)
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1, 4}, set(), {2, 3}))
+        ig.add_influence(2, 3)
+        ig.remove_node(2)
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1, 4}, set(), {1, 3}))
+        ig.add_influence(3, 3)
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1, 4}, {3}, {1}))
+        ig.remove_node(3)
+        self.assertEqual((set(start), set(mid), set(terminal)), ({1, 4}, set(), {1, 4}))
+
+    def test_views(self):
+        ig = InfluenceGraph()
+        ig.add_node(1, activation=12)
+        nodes = ig.nodes()
+        ig.add_node(2, activation=13)
+        self.assertEqual(nodes[2], {'activation': 13})
+        with self.assertRaises(TypeError):
+            nodes[3] = {}
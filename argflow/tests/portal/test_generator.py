@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from keras.models import Sequential
+from keras.layers import Dense
+
+from argflow.cache import DiskCache
+from argflow.portal import ExplanationGenerator
+from argflow.portal.generator import (
+    DEFAULT_MODEL_CACHE_SIZE,
+    set_influence_disk_cache,
+    set_model_cache_size,
+)
+
+
+class DemoGenerator(ExplanationGenerator):
+    def generate(self, resource_path, model_name, model_input, explanation_name, chi_value):
+        pass
+
+
+class TestExplanationGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(2):
+            path = os.path.join(self.temp.name, f'model{i}.keras')
+            Sequential([Dense(2, input_shape=(3,))]).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        set_model_cache_size(DEFAULT_MODEL_CACHE_SIZE)
+        set_influence_disk_cache(False)
+        self.temp.cleanup()
+
+    def test_load_model(self):
+        generator = DemoGenerator()
+        model = generator.load_model(self.paths[0])
+        self.assertIs(DemoGenerator().load_model(self.paths[0]), model)
+        self.assertIsNot(generator.load_model(self.paths[1]), model)
+        # A model changed on disk is loaded again
+        stat = os.stat(self.paths[0])
+        os.utime(self.paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        reloaded = generator.load_model(self.paths[0])
+        self.assertIsNot(reloaded, model)
+        self.assertIs(generator.load_model(self.paths[0]), reloaded)
+
+    def test_cache_size(self):
+        generator = DemoGenerator()
+        set_model_cache_size(1)
+        model = generator.load_model(self.paths[0])
+        generator.load_model(self.paths[1])
+        # Only the most recently used model is kept
+        self.assertIsNot(generator.load_model(self.paths[0]), model)
+        with self.assertRaises(ValueError):
+            set_model_cache_size(-1)
+
+    def test_influence_cache(self):
+        cache = DemoGenerator().influence_cache()
+        # Shared by the generators of the process, and only in memory by default
+        self.assertIs(DemoGenerator().influence_cache(), cache)
+        self.assertIsNone(cache.disk_cache)
+        disk_cache = DiskCache(self.temp.name)
+        set_influence_disk_cache(disk_cache)
+        self.assertIs(DemoGenerator().influence_cache().disk_cache, disk_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
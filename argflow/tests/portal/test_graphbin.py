@@ -0,0 +1,70 @@
+import os
+import json
+import unittest
+import tempfile
+
+from argflow.portal import Writer
+from argflow.portal.graphbin import GraphBin
+from argflow.gaf import GAF, PayloadType, Payload
+from argflow.gaf.frameworks import BipolarFramework
+
+
+class TestGraphBin(unittest.TestCase):
+
+    def _gaf(self):
+        gaf = GAF()
+        gaf.add_input(0, payload=Payload('input', PayloadType.STRING))
+        gaf.add_argument(1, strength=0.25, payload=Payload(
+            '1', PayloadType.STRING))
+        gaf.add_argument(2, strength=0.75, payload=Payload(
+            'ü', PayloadType.STRING))
+        gaf.add_conclusion(3, 0.5, 1)
+        gaf.add_relation(0, 1, BipolarFramework.SUPPORT)
+        gaf.add_relation(0, 2, BipolarFramework.SUPPORT)
+        gaf.add_relation(1, 2, BipolarFramework.ATTACK)
+        gaf.add_relation(1, 3, BipolarFramework.SUPPORT)
+        gaf.add_relation(2, 3, BipolarFramework.SUPPORT)
+        return gaf
+
+    def test_round_trip(self):
+        temp = tempfile.TemporaryDirectory()
+        writer = Writer(temp.name, 'muddle')
+        path = writer.write_gaf(self._gaf(), 'both', formats=('json', 'bin'))
+        with open(path, 'r') as f:
+            expected = json.loads(f.read())
+        graph = GraphBin(os.path.join(os.path.dirname(path), 'graph.bin'))
+        self.assertEqual(graph.name, expected['name'])
+        self.assertEqual(graph.input, expected['input'])
+        self.assertEqual(graph.conclusion, expected['conclusion'])
+        self.assertEqual(dict(graph.nodes()), expected['nodes'])
+        predecessors = graph.predecessors()
+        self.assertEqual(predecessors['0'], set())
+        self.assertEqual(predecessors['2'], {'0', '1'})
+        self.assertEqual(predecessors['3'], {'1', '2'})
+        del graph, predecessors
+        temp.cleanup()
+
+    def test_binary_only(self):
+        temp = tempfile.TemporaryDirectory()
+        writer = Writer(temp.name, 'muddle')
+        path = writer.write_gaf(self._gaf(), 'bin', formats=('bin',))
+        self.assertTrue(path.endswith('graph.bin'))
+        self.assertFalse(os.path.exists(
+            os.path.join(os.path.dirname(path), 'graph.json')))
+        with GraphBin(path) as graph:
+            self.assertEqual(len(graph), 4)
+        self.assertTrue(graph.closed)
+        with self.assertRaises(ValueError):
+            graph.nodes()['0']
+        with self.assertRaises(ValueError):
+            writer.write_gaf(self._gaf(), 'none', formats=('yaml',))
+        temp.cleanup()
+
+    def test_invalid_file(self):
+        temp = tempfile.TemporaryDirectory()
+        path = os.path.join(temp.name, 'graph.bin')
+        with open(path, 'wb') as f:
+            f.write(b'{"name": "GAF", "nodes": {}}')
+        with self.assertRaises(ValueError):
+            GraphBin(path)
+        temp.cleanup()
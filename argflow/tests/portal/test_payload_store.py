@@ -0,0 +1,118 @@
+import os
+import glob
+import json
+import shutil
+import threading
+import unittest
+import tempfile
+
+from PIL import Image
+from argflow.portal import PayloadStore, Writer
+from argflow.gaf import GAF, PayloadType, Payload
+from argflow.gaf.frameworks import BipolarFramework
+
+
+class TestPayloadStore(unittest.TestCase):
+
+    def _gaf(self, shared, own):
+        gaf = GAF()
+        gaf.add_input(0, payload=Payload(shared, PayloadType.IMAGE))
+        gaf.add_argument(1, strength=1, payload=Payload(
+            (shared, own), PayloadType.IMAGE_PAIR))
+        gaf.add_conclusion(2, 0.5, 1)
+        gaf.add_relation(0, 1, BipolarFramework.SUPPORT)
+        gaf.add_relation(1, 2, BipolarFramework.SUPPORT)
+        return gaf
+
+    def _stored(self, root):
+        return glob.glob(os.path.join(root, '.payloads', '*', '*'))
+
+    def test_dedupe(self):
+        temp = tempfile.TemporaryDirectory()
+        shared = Image.new('RGB', (8, 8), (255, 0, 0))
+        writer = Writer(temp.name, 'muddle', dedupe_payloads=True)
+        first = writer.write_gaf(self._gaf(shared, Image.new('RGB', (8, 8), (0, 255, 0))), 'a')
+        second = writer.write_gaf(self._gaf(shared, Image.new('RGB', (8, 8), (0, 0, 255))), 'b',
+                                  workers=0)
+        # One shared image and one own image per explanation
+        self.assertEqual(len(self._stored(temp.name)), 3)
+        with open(first, 'r') as f:
+            nodes = json.loads(f.read())['nodes']
+        self.assertEqual(nodes['0']['payload'], nodes['1']['payload']['filter']['payload'])
+        self.assertTrue(os.path.isfile(os.path.join(temp.name, nodes['0']['payload'])))
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(first), 'payloads')))
+        # Releasing one explanation keeps the images the other still uses
+        store = PayloadStore(temp.name, grace_period=0)
+        self.assertEqual(store.release(os.path.dirname(first)), 1)
+        shutil.rmtree(os.path.dirname(first))
+        self.assertEqual(len(self._stored(temp.name)), 2)
+        # Explanations deleted without release are cleaned up by garbage collection
+        shutil.rmtree(os.path.dirname(second))
+        self.assertEqual(store.collect_garbage(), 2)
+        self.assertEqual(self._stored(temp.name), [])
+        temp.cleanup()
+
+    def test_put(self):
+        temp = tempfile.TemporaryDirectory()
+        store = PayloadStore(temp.name)
+        path = store.put(b'payload', 'jpg')
+        self.assertEqual(store.put(b'payload', 'jpg'), path)
+        self.assertNotEqual(store.put(b'other', 'jpg'), path)
+        with open(os.path.join(temp.name, path), 'rb') as f:
+            self.assertEqual(f.read(), b'payload')
+        temp.cleanup()
+
+    def test_grace_period(self):
+        temp = tempfile.TemporaryDirectory()
+        store = PayloadStore(temp.name)
+        path = store.put(b'payload', 'jpg')
+        # Not referred to by a manifest yet, but just stored
+        self.assertEqual(store.collect_garbage(), 0)
+        full_path = os.path.join(temp.name, path)
+        os.utime(full_path, (0, 0))
+        # Storing it again makes it as new
+        store.put(b'payload', 'jpg')
+        self.assertEqual(store.collect_garbage(), 0)
+        os.utime(full_path, (0, 0))
+        self.assertEqual(store.collect_garbage(), 1)
+        temp.cleanup()
+
+    def test_concurrent_collection(self):
+        temp = tempfile.TemporaryDirectory()
+        store = PayloadStore(temp.name)
+        # Old payloads no manifest refers to, some of which are stored again below
+        old = [store.put(f'old {i}'.encode(), 'jpg') for i in range(20)]
+        for path in old:
+            os.utime(os.path.join(temp.name, path), (0, 0))
+        done = threading.Event()
+        errors = []
+
+        def collect():
+            while not done.is_set():
+                try:
+                    store.collect_garbage()
+                except Exception as e:
+                    errors.append(e)
+
+        collector = threading.Thread(target=collect)
+        collector.start()
+        manifests = []
+        try:
+            for i in range(200):
+                explanation_dir = os.path.join(temp.name, 'muddle', f'explanation_{i}')
+                os.makedirs(explanation_dir)
+                paths = [store.put(f'new {i}'.encode(), 'jpg'),
+                         store.put(f'old {i % 10}'.encode(), 'jpg')]
+                store.write_manifest(explanation_dir, paths)
+                manifests.append(paths)
+        finally:
+            done.set()
+            collector.join()
+        self.assertEqual(errors, [])
+        for paths in manifests:
+            for path in paths:
+                self.assertTrue(os.path.isfile(os.path.join(temp.name, path)))
+        store.collect_garbage()
+        # Only the old payloads that were never stored again are removed
+        self.assertEqual(len(self._stored(temp.name)), 210)
+        temp.cleanup()
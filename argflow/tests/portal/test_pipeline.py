@@ -0,0 +1,122 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import warnings
+
+from argflow.chi import Chi
+from argflow.gaf import GAFExtractor, Payload, PayloadType
+from argflow.gaf.frameworks import BipolarFramework
+from argflow.gaf.mappers import InfluenceMapper, CharacterisationMapper, StrengthMapper
+from argflow.influence import InfluenceGraph
+from argflow.portal import ExplanationPipeline
+from argflow.portal.pipeline import CHECKPOINT_FILENAME
+
+
+class DemoIM(InfluenceMapper):
+    def apply(self, model, x):
+        influences = InfluenceGraph()
+        influences.add_node('feature', value=x)
+        influences.add_node('hidden', value=x * 2)
+        influences.add_node('prediction')
+        influences.add_influence('feature', 'hidden')
+        influences.add_influence('hidden', 'prediction')
+        return influences, model, 0.5
+
+
+class DemoSM(StrengthMapper):
+    def apply(self, node):
+        return node.get('value')
+
+
+class DemoCM(CharacterisationMapper):
+    def apply(self, node):
+        return BipolarFramework.SUPPORT
+
+
+class DemoChi(Chi):
+    def generate(self, x, node, model):
+        return Payload(f'Input {x}', PayloadType.STRING)
+
+
+def load_model():
+    return 'demo model'
+
+
+class TestExplanationPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.extractor = GAFExtractor(DemoIM(), DemoSM(), DemoCM(), DemoChi())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _pipeline(self, **kwargs):
+        return ExplanationPipeline(load_model, self.extractor, self.root, 'Demo',
+                                   shard_size=3, batch_size=2, **kwargs)
+
+    def _strength(self, path):
+        with open(path, 'r') as f:
+            graph = json.load(f)
+        return [node['strength'] for node in graph['nodes'].values() if 'strength' in node]
+
+    def test_run(self):
+        progress = []
+        paths = self._pipeline(workers=0).run(list(range(7)), progress=lambda *p: progress.append(p))
+        self.assertEqual(progress, [(0, 7), (3, 7), (6, 7), (7, 7)])
+        self.assertEqual(paths, [os.path.join(self.root, 'Demo', f'explanation_{i}', 'graph.json')
+                                 for i in range(7)])
+        for i, path in enumerate(paths):
+            self.assertIn(i * 2, self._strength(path))
+
+    def test_processes(self):
+        paths = self._pipeline(workers=2).run(list(range(7)))
+        for i, path in enumerate(paths):
+            self.assertIn(i * 2, self._strength(path))
+
+    def test_resume(self):
+        model_dir = os.path.join(self.root, 'Demo')
+        pipeline = self._pipeline(workers=0)
+        pipeline.run(list(range(7)))
+        with open(os.path.join(model_dir, CHECKPOINT_FILENAME), 'r') as f:
+            self.assertEqual(json.load(f)['done'], [0, 3, 6])
+        # Simulate a run interrupted in its second shard: one explanation was written,
+        # one was left incomplete
+        with open(os.path.join(model_dir, CHECKPOINT_FILENAME), 'w') as f:
+            json.dump({'name_format': 'explanation_{index}', 'shard_size': 3,
+                       'total': 7, 'done': [0]}, f)
+        shutil.rmtree(os.path.join(model_dir, 'explanation_4'))
+        os.remove(os.path.join(model_dir, 'explanation_5', 'graph.json'))
+        shutil.rmtree(os.path.join(model_dir, 'explanation_6'))
+        progress = []
+        paths = pipeline.run(list(range(7)), progress=lambda *p: progress.append(p))
+        self.assertEqual(progress[0], (3, 7))
+        self.assertEqual(paths[:3], [None] * 3)
+        for i in range(3, 7):
+            self.assertIn(i * 2, self._strength(paths[i]))
+        # A checkpoint of other settings isn't resumed
+        with self.assertRaises(ValueError):
+            self._pipeline(workers=0, name_format='row_{index}').run(list(range(7)))
+
+    def test_start_over(self):
+        pipeline = self._pipeline(workers=0, dedupe_payloads=True)
+        for xs in (list(range(7)), list(range(10, 17))):
+            # Explanations of the previous run are replaced, not clashed with
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                paths = pipeline.run(xs, resume=False)
+            for x, path in zip(xs, paths):
+                self.assertIn(x * 2, self._strength(path))
+
+    def test_interrupted_start_over(self):
+        pipeline = self._pipeline(workers=0)
+        xs = list(range(7))
+        pipeline.run(xs)
+        # Starting over fails in the first shard, after its explanations were deleted
+        with self.assertRaises(TypeError):
+            pipeline.run([0, None] + xs[2:], resume=False)
+        paths = pipeline.run(xs)
+        for x, path in zip(xs, paths):
+            self.assertIn(x * 2, self._strength(path))
@@ -1,4 +1,5 @@
 import os
+import json
 import unittest
 import tempfile
 
@@ -44,3 +45,20 @@ class TestWriter(unittest.TestCase):
             writer.write_gaf(gaf, 'peter')
         # Wipe the temp directory
         temp.cleanup()
+
+    def test_write_modes(self):
+        temp = tempfile.TemporaryDirectory()
+        gaf = GAF()
+        gaf.add_argument(1, strength=1, payload=Payload(
+            '1', PayloadType.STRING))
+        gaf.add_conclusion(2, 0.5, 1)
+        gaf.add_relation(1, 2, BipolarFramework.SUPPORT)
+        writer = Writer(temp.name, 'muddle')
+        expected = json.loads(gaf.serialise())
+        for name, compact, stream in (('compact', True, False),
+                                      ('stream', False, True),
+                                      ('both', True, True)):
+            path = writer.write_gaf(gaf, name, compact=compact, stream=stream)
+            with open(path, 'r') as f:
+                self.assertEqual(json.loads(f.read()), expected)
+        temp.cleanup()
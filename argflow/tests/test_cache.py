@@ -0,0 +1,61 @@
+import os
+import time
+import tempfile
+import unittest
+
+from keras.models import Sequential
+from keras.layers import Dense
+
+from argflow.cache import DiskCache, invalidate_fingerprint, model_fingerprint
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def test_get_put(self):
+        temp = tempfile.TemporaryDirectory()
+        cache = DiskCache(os.path.join(temp.name, 'cache'))
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', b'123')
+        self.assertIn('a', cache)
+        self.assertEqual(cache.get('a'), b'123')
+        # Entries persist across cache objects
+        self.assertEqual(DiskCache(os.path.join(temp.name, 'cache')).get('a'), b'123')
+        cache.clear()
+        self.assertNotIn('a', cache)
+        temp.cleanup()
+
+    def test_lru_eviction(self):
+        temp = tempfile.TemporaryDirectory()
+        cache = DiskCache(temp.name, max_size=25)
+        for key in 'abc':
+            cache.put(key, b'0123456789')
+            time.sleep(0.01)
+        # Adding c went over the bound, so the least recently used entry went
+        self.assertNotIn('a', cache)
+        time.sleep(0.01)
+        cache.get('b')
+        cache.put('d', b'0123456789')
+        self.assertIn('b', cache)
+        self.assertNotIn('c', cache)
+        self.assertLessEqual(cache.size(), 25)
+        temp.cleanup()
+
+
+class TestModelFingerprint(unittest.TestCase):
+
+    def test_fingerprint(self):
+        model = Sequential([Dense(4, input_shape=(3,), name='dense')])
+        fingerprint = model_fingerprint(model)
+        self.assertEqual(model_fingerprint(model), fingerprint)
+        # Same architecture and weights, e.g. the model loaded again in another process
+        same = Sequential.from_config(model.get_config())
+        same.set_weights(model.get_weights())
+        self.assertEqual(model_fingerprint(same), fingerprint)
+        other = Sequential.from_config(model.get_config())
+        other.set_weights([w + 1 for w in model.get_weights()])
+        self.assertNotEqual(model_fingerprint(other), fingerprint)
+        # Weights changed in place, e.g. by training, need the fingerprint invalidated
+        model.set_weights([w + 1 for w in model.get_weights()])
+        self.assertEqual(model_fingerprint(model), fingerprint)
+        invalidate_fingerprint(model)
+        self.assertEqual(model_fingerprint(model), model_fingerprint(other))
@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+
+from keras.models import Sequential
+from keras.layers import Dense, Conv2D, Flatten
+
+from argflow.submodels import class_gradients, head_model, input_jacobian, truncated_model
+
+
+class TestSubModels(unittest.TestCase):
+
+    def _model(self):
+        model = Sequential()
+        model.add(Conv2D(4, kernel_size=3, activation='relu', input_shape=(8, 8, 3), name='conv1'))
+        model.add(Flatten(name='flatten'))
+        model.add(Dense(10, activation='softmax', name='dense'))
+        return model
+
+    def test_cached(self):
+        model = self._model()
+        self.assertIs(truncated_model(model, 'conv1'), truncated_model(model, 'conv1'))
+        self.assertIs(head_model(model, 'conv1'), head_model(model, 'conv1'))
+        self.assertIsNot(truncated_model(model, 'conv1'), truncated_model(model, 'flatten'))
+        self.assertIsNot(truncated_model(model, 'conv1'), truncated_model(self._model(), 'conv1'))
+
+    def test_outputs(self):
+        model = self._model()
+        x = np.random.rand(2, 8, 8, 3)
+        activations = truncated_model(model, 'conv1')(x)
+        self.assertEqual(activations.shape, (2, 6, 6, 4))
+        np.testing.assert_allclose(head_model(model, 'conv1')(activations).numpy(),
+                                   model(x).numpy(), rtol=1e-5)
+
+    def test_class_gradients(self):
+        model = Sequential()
+        model.add(Conv2D(4, kernel_size=3, activation='relu', input_shape=(8, 8, 3), name='conv1'))
+        model.add(Conv2D(5, kernel_size=3, activation='relu', name='conv2'))
+        model.add(Flatten(name='flatten'))
+        model.add(Dense(10, activation='softmax', name='dense'))
+        x = np.random.rand(2, 8, 8, 3)
+        gradients = class_gradients(model, ['conv1', 'conv2'])
+        self.assertIs(class_gradients(model, ['conv1', 'conv2']), gradients)
+        preds, (conv1, conv2) = gradients(x)
+        np.testing.assert_allclose(preds.numpy(), model(x).numpy(), rtol=1e-5)
+        self.assertEqual(conv1.shape, (2, 4))
+        self.assertEqual(conv2.shape, (2, 5))
+        # Same as splitting the model at the layer
+        activations = truncated_model(model, 'conv2')(x)
+        with tf.GradientTape() as tape:
+            tape.watch(activations)
+            head = head_model(model, 'conv2')(activations)
+            top_class = tf.reduce_max(head, axis=-1)
+        expected = tf.reduce_mean(tape.gradient(top_class, activations), axis=(1, 2))
+        np.testing.assert_allclose(conv2.numpy(), expected.numpy(), rtol=1e-4, atol=1e-7)
+
+    def test_input_jacobian(self):
+        model = Sequential()
+        model.add(Dense(6, activation='relu', input_shape=(4,), name='hidden'))
+        model.add(Dense(3, name='logits'))
+        x = np.random.rand(5, 4)
+        jacobian = input_jacobian(model, 'logits')
+        self.assertIs(input_jacobian(model, 'logits'), jacobian)
+        outputs, jacobians = jacobian(x)
+        self.assertEqual(jacobians.shape, (5, 3, 4))
+        np.testing.assert_allclose(outputs.numpy(), model(x).numpy(), rtol=1e-5)
+        x_tensor = tf.convert_to_tensor(x[:1], dtype=tf.float32)
+        with tf.GradientTape() as tape:
+            tape.watch(x_tensor)
+            output = model(x_tensor)[0, 1]
+        np.testing.assert_allclose(jacobians[0, 1].numpy(), tape.gradient(output, x_tensor)[0].numpy(),
+                                   rtol=1e-5, atol=1e-7)
+        # Other batch sizes reuse the traced function
+        self.assertEqual(jacobian(x[:2])[1].shape, (2, 3, 4))
@@ -27,6 +27,18 @@ def main():
 
     parser.add_argument("--hub-url", help="url of the model hub")
 
+    parser.add_argument(
+        "--collect-garbage",
+        action="store_true",
+        help="remove stored payloads no explanation refers to, then exit",
+    )
+
+    parser.add_argument(
+        "--cache-influences",
+        action="store_true",
+        help="also cache the influence graphs of generated explanations on disk",
+    )
+
     parser.add_argument(
         "--generator",
         nargs="+",
@@ -45,7 +57,20 @@ def main():
         print(f"Not a directory: {args.dir}", file=sys.stderr)
         sys.exit(1)
 
-    app = ArgflowUI(resource_path=resource_path, hub_url=hub_url)
+    if args.collect_garbage:
+        from argflow.portal import PayloadStore
+
+        if not resource_path:
+            print("No resource directory given", file=sys.stderr)
+            sys.exit(1)
+
+        removed = PayloadStore(resource_path).collect_garbage()
+        print(f"Removed {removed} unreferenced payloads")
+        return
+
+    app = ArgflowUI(
+        resource_path=resource_path, hub_url=hub_url, cache_influences=args.cache_influences
+    )
 
     if args.generator:
         for generator in args.generator:
@@ -6,5 +6,6 @@ from . import models  # noqa
 from . import chis  # noqa
 from . import hub  # noqa
 from . import generators  # noqa
+from . import jobs  # noqa
 
 from .router import router  # noqa
@@ -1,4 +1,5 @@
 GRAPH_FILENAME = "graph.json"
+BINARY_GRAPH_FILENAME = "graph.bin"
 MODEL_DIRNAME = "model"
 
 # Indexed only on models and explanations for now, would need to change this if the
@@ -1,15 +1,15 @@
-import json
 import os
 import shutil
-import asyncio
 
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
 
-from argflow_ui.argumentation_graph import ArgumentationGraph
-from argflow_ui.api.utils import folder_size
+from argflow.portal import PayloadStore
+
+from argflow_ui.api.utils import folder_size, has_graph, load_graph
 from argflow_ui.api.router import router
-from argflow_ui.api.data import GRAPH_FILENAME, cached_explanations
+from argflow_ui.api.data import cached_explanations
+from argflow_ui.jobs import QueueFull
 
 
 @router.get("/models/{model_name}/explanations")
@@ -23,9 +23,8 @@ def get_explanations(req: Request):
 
     for name in os.listdir(model_path):
         explanation_path = os.path.join(model_path, name)
-        graph_path = os.path.join(explanation_path, GRAPH_FILENAME)
 
-        if os.path.isdir(explanation_path) and os.path.isfile(graph_path):
+        if os.path.isdir(explanation_path) and has_graph(explanation_path):
             results.append(
                 {
                     "name": name,
@@ -38,18 +37,6 @@ def get_explanations(req: Request):
     return JSONResponse(sorted(results, key=lambda x: x["name"]))
 
 
-def run_generator(generator, resource_path, model_name, model_input, explanation_name, chi_value):
-    import importlib.util
-
-    module_path, class_name = generator
-    spec = importlib.util.spec_from_file_location("generator", module_path)
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
-    generator = getattr(mod, class_name)()
-
-    generator.generate(resource_path, model_name, model_input, explanation_name, chi_value)
-
-
 @router.post("/models/{model_name}/explanations/{explanation_name}")
 async def create_explanation(req: Request):
     model_name: str = req.path_params["model_name"]
@@ -62,34 +49,28 @@ async def create_explanation(req: Request):
 
     output_path = os.path.join(req.app.resource_path, model_name, explanation_name)
 
-    if os.path.exists(output_path):
+    if os.path.exists(output_path) or req.app.jobs.find(model_name, explanation_name):
         return Response(status_code=400)
 
-    generator = req.app.generators[generator_name]
-    resource_path = req.app.resource_path
-
-    async def task():
-        for ws in req.app.ws_clients:
-            await ws.send_json({"type": "exgen-start"})
+    if generator_name not in req.app.generators:
+        return Response(status_code=404)
 
-        # Run the explanation generator in a subprocess
-        await asyncio.get_event_loop().run_in_executor(
-            req.app.executor,
-            run_generator,
-            generator,
-            resource_path,
+    try:
+        # Queue the explanation for the worker process holding the model
+        job = await req.app.jobs.submit(
+            generator_name,
+            req.app.generators[generator_name],
+            req.app.resource_path,
             model_name,
             input_text,
             explanation_name,
             chi_value,
+            client=body.get("client"),
         )
+    except QueueFull:
+        return Response(status_code=429, headers={"Retry-After": "5"})
 
-        for ws in req.app.ws_clients:
-            await ws.send_json({"type": "exgen-success", "name": explanation_name})
-
-    asyncio.create_task(task())
-
-    return Response(status_code=200)
+    return JSONResponse(job.to_json(), status_code=202)
 
 
 @router.get("/models/{model_name}/explanations/{explanation_name}")
@@ -101,22 +82,15 @@ def get_explanation(req: Request):
         model_name not in cached_explanations
         or explanation_name not in cached_explanations[model_name]
     ):
-        graph_path = os.path.join(
-            req.app.resource_path, model_name, explanation_name, GRAPH_FILENAME
-        )
-
-        try:
-            with open(graph_path, "r") as f:
-                content = f.read()
-                explanation = json.loads(content)
-        except OSError:
-            return Response(status_code=404)
+        explanation_path = os.path.join(req.app.resource_path, model_name, explanation_name)
 
         try:
             if model_name not in cached_explanations:
                 cached_explanations[model_name] = {}
 
-            arg_graph = ArgumentationGraph(explanation)
+            arg_graph = load_graph(explanation_path)
+        except OSError:
+            return Response(status_code=404)
         except ValueError as e:
             return Response(status_code=400)
 
@@ -152,12 +126,15 @@ def delete_explanation(req: Request):
     if not explanation_path.startswith(os.path.realpath(req.app.resource_path)):
         return Response(status_code=400)
 
-    if os.path.isdir(explanation_path):
-        shutil.rmtree(explanation_path)
-    else:
+    if not os.path.isdir(explanation_path):
         return Response(status_code=404)
 
+    # Unmap the explanation's graph.bin before deleting it
     if model_name in cached_explanations and explanation_name in cached_explanations[model_name]:
-        del cached_explanations[model_name][explanation_name]
+        cached_explanations[model_name].pop(explanation_name).close()
+
+    # Drop stored payloads no other explanation refers to
+    PayloadStore(req.app.resource_path).release(explanation_path)
+    shutil.rmtree(explanation_path)
 
     return Response(status_code=204)
@@ -0,0 +1,43 @@
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from argflow_ui.api.router import router
+
+
+@router.get("/jobs")
+def get_jobs(req: Request):
+    queue = req.app.jobs
+
+    return JSONResponse(
+        {
+            "depth": queue.depth,
+            "max_queued": queue.max_queued,
+            "running": len(queue.running),
+            "workers": queue.pool.workers,
+            "jobs": [job.to_json() for job in queue.jobs()],
+        }
+    )
+
+
+@router.get("/jobs/{job_id}")
+def get_job(req: Request):
+    job = req.app.jobs.get(req.path_params["job_id"])
+
+    if job is None:
+        return Response(status_code=404)
+
+    return JSONResponse(job.to_json())
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(req: Request):
+    job_id: str = req.path_params["job_id"]
+
+    if req.app.jobs.get(job_id) is None:
+        return Response(status_code=404)
+
+    if not await req.app.jobs.cancel(job_id):
+        # Already finished
+        return Response(status_code=409)
+
+    return JSONResponse(req.app.jobs.get(job_id).to_json(), status_code=202)
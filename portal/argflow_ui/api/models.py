@@ -7,6 +7,8 @@ import zipfile
 from starlette.requests import Request
 from starlette.responses import JSONResponse, Response
 
+from argflow.portal import PayloadStore
+
 from argflow_ui.api.utils import folder_size
 from argflow_ui.api.data import cached_explanations, MODEL_DIRNAME
 from argflow_ui.api.router import router
@@ -86,12 +88,14 @@ def delete_model(req: Request):
     if not model_path.startswith(os.path.realpath(req.app.resource_path)):
         return Response(status_code=400)
 
-    if os.path.isdir(model_path):
-        shutil.rmtree(model_path)
-    else:
+    if not os.path.isdir(model_path):
         return Response(status_code=404)
 
-    if model_name in cached_explanations:
-        del cached_explanations[model_name]
+    # Unmap the model's graph.bin files before deleting them
+    for graph in cached_explanations.pop(model_name, {}).values():
+        graph.close()
+
+    shutil.rmtree(model_path)
+    PayloadStore(req.app.resource_path).collect_garbage()
 
     return Response(status_code=204)
@@ -1,5 +1,9 @@
+import json
 import os
 
+from argflow_ui.argumentation_graph import ArgumentationGraph
+from argflow_ui.api.data import BINARY_GRAPH_FILENAME, GRAPH_FILENAME
+
 
 def folder_size(path):
     total = 0
@@ -9,3 +13,25 @@ def folder_size(path):
         elif entry.is_dir():
             total += folder_size(entry.path)
     return total
+
+
+def has_graph(explanation_path):
+    return any(
+        os.path.isfile(os.path.join(explanation_path, filename))
+        for filename in (BINARY_GRAPH_FILENAME, GRAPH_FILENAME)
+    )
+
+
+def load_graph(explanation_path):
+    """
+    Loads the argumentation graph of an explanation, preferring graph.bin over graph.json.
+
+    Raises OSError if neither file can be read and ValueError if the graph is invalid.
+    """
+    binary_path = os.path.join(explanation_path, BINARY_GRAPH_FILENAME)
+    if os.path.isfile(binary_path):
+        return ArgumentationGraph.from_binary(binary_path)
+
+    with open(os.path.join(explanation_path, GRAPH_FILENAME), "r") as f:
+        explanation = json.loads(f.read())
+    return ArgumentationGraph(explanation)
@@ -1,5 +1,5 @@
-import json
 import os.path
+import uuid
 import uvicorn
 
 from concurrent.futures import ProcessPoolExecutor
@@ -14,12 +14,13 @@ from starlette.websockets import WebSocket
 from argflow.portal import ExplanationGenerator
 
 from argflow_ui.api import router as api
-from argflow_ui.api.explanations import GRAPH_FILENAME
-from argflow_ui.argumentation_graph import ArgumentationGraph
+from argflow_ui.api.utils import load_graph
+from argflow_ui.jobs import JobQueue
 from argflow_ui.openapi import OpenAPI
 from argflow_ui.router import Router
 from argflow_ui.visualisers import Visualiser
 from argflow_ui.watcher import FileWatcher
+from argflow_ui.workers import GeneratorPool
 
 
 class MainWSEndpoint(WebSocketEndpoint):
@@ -27,7 +28,10 @@ class MainWSEndpoint(WebSocketEndpoint):
 
     async def on_connect(self, websocket: WebSocket) -> None:
         await websocket.accept()
+        # Sent back when creating explanations, so only this client gets their progress
+        websocket.client_id = uuid.uuid4().hex
         websocket.app.ws_clients.append(websocket)
+        await websocket.send_json({"type": "hello", "client": websocket.client_id})
 
     async def on_disconnect(self, websocket: WebSocket, close_code: int) -> None:
         websocket.app.ws_clients.remove(websocket)
@@ -48,22 +52,18 @@ class VSessionWSEndpoint(WebSocketEndpoint):
         explanation_name = websocket.query_params["explanation"]
 
         visualiser = app.visualisers[visualiser_id]
-        path = os.path.join(app.resource_path, model_name, explanation_name, GRAPH_FILENAME)
+        path = os.path.join(app.resource_path, model_name, explanation_name)
 
         try:
-            with open(path, "r") as f:
-                content = f.read()
-                explanation = json.loads(content)
+            graph = load_graph(path)
         except OSError:
             return Response(status_code=404)
-
-        try:
-            graph = ArgumentationGraph(explanation)
         except ValueError:
             return Response(status_code=400)
 
         await websocket.accept()
 
+        self.graph = graph
         self.session = visualiser.create_session(graph)
 
         await self.session.on_connect(websocket)
@@ -74,10 +74,11 @@ class VSessionWSEndpoint(WebSocketEndpoint):
     async def on_disconnect(self, websocket: WebSocket, close_code: int) -> None:
         self.session.visualiser.destroy_session()
         await self.session.on_disconnect(websocket, close_code)
+        self.graph.close()
 
 
 class ArgflowUI(Starlette):
-    def __init__(self, resource_path=None, client_path=None, hub_url=None):
+    def __init__(self, resource_path=None, client_path=None, hub_url=None, cache_influences=False):
         self.resource_path = resource_path if resource_path is not None else os.path.abspath(".")
         self.package_path = os.path.abspath(os.path.dirname(__file__))
         self.client_path = (
@@ -97,6 +98,17 @@ class ArgflowUI(Starlette):
 
         self.watcher = FileWatcher(self.resource_path, on_event=on_file_watcher_event)
         self.executor = ProcessPoolExecutor()
+        self.generator_pool = GeneratorPool(cache_influences=cache_influences)
+
+        async def on_job_event(job, event):
+            sockets = self.ws_clients
+            if event["type"] == "job-progress":
+                requester = [ws for ws in sockets if getattr(ws, "client_id", None) == job.client]
+                sockets = requester or sockets
+            for socket in list(sockets):
+                await socket.send_json(event)
+
+        self.jobs = JobQueue(self.generator_pool, notify=on_job_event)
 
         default_generator = os.path.join(os.path.dirname(__file__), "generator/default.py")
         self.add_explanation_generator(
@@ -145,6 +157,7 @@ class ArgflowUI(Starlette):
             debug=True,
             routes=router.routes(),
             on_startup=[lambda: self.watcher.start()],
+            on_shutdown=[lambda: self.generator_pool.shutdown(wait=False)],
         )
 
     def register_visualiser(self, visualiser: Visualiser):
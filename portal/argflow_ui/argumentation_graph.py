@@ -34,6 +34,7 @@ class ArgumentationGraph:
         self.input = explanation["input"]
         self.conclusion = explanation["conclusion"]
         self.nodes = explanation["nodes"]
+        self._binary = None
 
         # Build an auxiliary table of predecessors of each node
         self.predecessors = {node_id: set() for node_id in self.nodes.keys()}
@@ -42,6 +43,46 @@ class ArgumentationGraph:
                 child_id = child_id
                 self.predecessors[child_id].add(node_id)
 
+    @classmethod
+    def from_binary(cls, path):
+        """
+        Loads an argumentation graph from a graph.bin file.
+
+        The file is memory-mapped: node dicts are only built when a node is accessed and
+        predecessors come from the file's adjacency arrays.
+
+        :param path: The path of the graph.bin file
+        """
+        from argflow.portal.graphbin import GraphBin
+
+        graph = GraphBin(path)
+        try:
+            arg_graph = cls.__new__(cls)
+            arg_graph.name = graph.name
+            arg_graph.input = graph.input
+            arg_graph.conclusion = graph.conclusion
+            arg_graph.nodes = graph.nodes()
+            arg_graph.predecessors = graph.predecessors()
+        except Exception:
+            graph.close()
+            raise
+        arg_graph._binary = graph
+        return arg_graph
+
+    def close(self):
+        """
+        Unmaps the graph.bin file of a graph loaded with from_binary. Does nothing for other
+        graphs.
+        """
+        if self._binary is not None:
+            self._binary.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def query_factors(
         self,
         target,
@@ -89,5 +130,5 @@ class ArgumentationGraph:
             "name": self.name,
             "input": self.input,
             "conclusion": self.conclusion,
-            "nodes": self.nodes,
+            "nodes": dict(self.nodes),
         }
\ No newline at end of file
@@ -0,0 +1,243 @@
+import asyncio
+import itertools
+import time
+import uuid
+
+from collections import OrderedDict
+from enum import Enum
+
+from argflow_ui.workers import JobCancelled
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted to a JobQueue that holds as many queued jobs as it can.
+    """
+
+
+class Job:
+    def __init__(self, seq, generator_name, generator, resource_path, model_name, model_input,
+                 explanation_name, chi_value, client=None):
+        self.id = uuid.uuid4().hex
+        # Number identifying the job to the generator workers
+        self.seq = seq
+        self.generator_name = generator_name
+        self.generator = generator
+        self.resource_path = resource_path
+        self.model_name = model_name
+        self.model_input = model_input
+        self.explanation_name = explanation_name
+        self.chi_value = chi_value
+        # Id of the websocket client that requested the job, which gets its progress
+        self.client = client
+        self.status = JobStatus.QUEUED
+        self.stage = None
+        self.error = None
+        self.cancel_requested = False
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "model": self.model_name,
+            "explanation": self.explanation_name,
+            "generator": self.generator_name,
+            "chi": self.chi_value,
+            "status": self.status.value,
+            "stage": self.stage,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "url": f"/jobs/{self.id}",
+        }
+
+
+class JobQueue:
+    """
+    Queues explanation generation jobs and runs them on a GeneratorPool, one job per
+    worker at a time, so bursts of requests wait in a bounded queue instead of piling up
+    on the workers. Jobs of a model run on the worker holding it, in the order they were
+    submitted; jobs of other models can overtake them while that worker is busy.
+    """
+
+    def __init__(self, pool, max_queued=32, history=100, notify=None):
+        """
+        pool            - the GeneratorPool running the jobs. Its on_progress is set to
+                          report the stages of jobs.
+        max_queued      - the number of jobs that can wait to run. Further submissions
+                          raise QueueFull.
+        history         - the number of finished jobs remembered.
+        notify          - optional coroutine function called as notify(job, event) on
+                          every change to a job, event being a dict to send to clients.
+        """
+        self.pool = pool
+        self.pool.on_progress = self._on_progress
+        self.max_queued = max_queued
+        self.history = history
+        self.notify = notify
+        self._jobs = OrderedDict()
+        self._queued = []
+        # Indices of the workers running a job
+        self._busy = set()
+        self._seq = itertools.count(1)
+        self._loop = None
+
+    @property
+    def depth(self):
+        """
+        The number of jobs waiting to run.
+        """
+        return len(self._queued)
+
+    @property
+    def running(self):
+        return [job for job in self._jobs.values() if job.status == JobStatus.RUNNING]
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def find(self, model_name, explanation_name):
+        """
+        Get the unfinished job generating an explanation, or None.
+        """
+        for job in self._jobs.values():
+            if (job.model_name, job.explanation_name) == (model_name, explanation_name) \
+                    and job.status not in FINISHED:
+                return job
+        return None
+
+    async def submit(self, generator_name, generator, resource_path, model_name, model_input,
+                     explanation_name, chi_value, client=None):
+        """
+        Queue a job generating an explanation. Returns the Job.
+        """
+        if len(self._queued) >= self.max_queued:
+            raise QueueFull()
+        self._loop = asyncio.get_event_loop()
+        job = Job(next(self._seq), generator_name, generator, resource_path, model_name,
+                  model_input, explanation_name, chi_value, client=client)
+        self._jobs[job.id] = job
+        self._queued.append(job)
+        self._forget_finished()
+        await self._notify(job, {"type": "job-progress"})
+        await self._dispatch()
+        return job
+
+    async def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are dropped at once; running jobs stop at the next stage
+        their generator reports. Returns False if the job had already finished.
+        """
+        job = self._jobs[job_id]
+        if job.status in FINISHED:
+            return False
+        if job.status == JobStatus.QUEUED:
+            self._queued.remove(job)
+            await self._finish(job, JobStatus.CANCELLED)
+        else:
+            job.cancel_requested = True
+            self.pool.cancel(job.seq, job.resource_path, job.model_name)
+            await self._notify(job, {"type": "job-progress"})
+        return True
+
+    async def _dispatch(self):
+        # Jobs are started before any notification is awaited, so concurrent dispatches
+        # never see a job as both queued and running
+        started = []
+        failed = []
+        for job in list(self._queued):
+            index = self.pool.worker_for(job.resource_path, job.model_name)
+            if index in self._busy:
+                continue
+            self._busy.add(index)
+            self._queued.remove(job)
+            job.status = JobStatus.RUNNING
+            job.started = time.time()
+            try:
+                future = self.pool.submit(job.generator, job.resource_path, job.model_name,
+                                          job.model_input, job.explanation_name,
+                                          job.chi_value, job=job.seq)
+            except Exception as e:
+                # e.g. the worker died or the job couldn't be sent to it, so free its slot
+                # rather than leaving the job running forever
+                self._busy.discard(index)
+                job.error = f"{type(e).__name__}: {e}"
+                failed.append(job)
+            else:
+                asyncio.ensure_future(self._run(job, index, asyncio.wrap_future(future)))
+            started.append(job)
+        for job in started:
+            await self._notify(job, {"type": "exgen-start", "name": job.explanation_name})
+            if job in failed:
+                await self._finish(job, JobStatus.FAILED)
+            else:
+                await self._notify(job, {"type": "job-progress"})
+
+    async def _run(self, job, index, future):
+        try:
+            await future
+        except JobCancelled:
+            status = JobStatus.CANCELLED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            status = JobStatus.FAILED
+        else:
+            status = JobStatus.SUCCEEDED
+        self._busy.discard(index)
+        await self._finish(job, status)
+        await self._dispatch()
+
+    async def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        event = {
+            JobStatus.SUCCEEDED: "exgen-success",
+            JobStatus.FAILED: "exgen-error",
+            JobStatus.CANCELLED: "exgen-cancelled",
+        }[status]
+        await self._notify(job, {"type": event, "name": job.explanation_name,
+                                 "error": job.error})
+        await self._notify(job, {"type": "job-progress"})
+        self._forget_finished()
+
+    def _on_progress(self, seq, stage):
+        # Called from the pool's progress thread
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self._set_stage(seq, stage)))
+
+    async def _set_stage(self, seq, stage):
+        for job in self._jobs.values():
+            if job.seq == seq and job.status == JobStatus.RUNNING:
+                job.stage = stage
+                await self._notify(job, {"type": "job-progress"})
+                return
+
+    async def _notify(self, job, event):
+        if self.notify is not None:
+            event = dict(event, job=job.to_json()) if event["type"] == "job-progress" \
+                else dict(event, job=job.id)
+            await self.notify(job, event)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
@@ -118,7 +118,7 @@ class GraphArgumentationGraphView(ArgumentationGraphView):
         Serializes the argumentation graph view
         """
         serialized_gaf = self.graph.serialize()
-        serialized_gaf["nodes"] = self.view_nodes
+        serialized_gaf["nodes"] = dict(self.view_nodes)
         serialized_gaf["total_nodes"] = (
             len(self.graph.nodes) - len(self.graph.input) - len(self.graph.conclusion)
         )
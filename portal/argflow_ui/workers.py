@@ -0,0 +1,185 @@
+import importlib.util
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# State of a generator worker process, set up by _init_worker
+_generators = {}
+_progress = None
+_cancelled = None
+
+
+class JobCancelled(Exception):
+    """
+    Raised in a worker when the job it runs was cancelled.
+    """
+
+
+class GeneratorPool:
+    """
+    A pool of long-lived processes running explanation generators. Workers keep the
+    generators they imported and the models they loaded (see
+    ExplanationGenerator.load_model), and explanations of a model always go to the same
+    worker, so only the first explanation of a model pays for importing TensorFlow and
+    loading the model.
+    """
+
+    def __init__(self, workers=None, max_models=4, on_progress=None, cache_influences=False):
+        """
+        workers          - number of worker processes, started as needed (defaults to
+                           the number of CPUs, at most 4).
+        max_models       - number of loaded models each worker keeps.
+        on_progress      - optional function called as on_progress(job, stage) when the
+                           generator of a job reports a stage. Called from a background
+                           thread.
+        cache_influences - whether workers also keep the results of
+                           ExplanationGenerator.influence_cache on disk, in the user's
+                           cache directory, rather than only in memory.
+        """
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        if self.workers < 1:
+            raise ValueError("workers must be positive")
+        self.max_models = max_models
+        self.cache_influences = cache_influences
+        self.on_progress = on_progress
+        self._context = multiprocessing.get_context("spawn")
+        self._executors = [None] * self.workers
+        # The job each worker should stop, read by its generator's progress reports
+        self._cancelled = [None] * self.workers
+        self._pending = [0] * self.workers
+        # (resource path, model name) -> index of the worker holding the model
+        self._assignments = {}
+        self._progress = None
+        self._progress_thread = None
+
+    def submit(self, generator, resource_path, model_name, model_input, explanation_name,
+               chi_value, job=0):
+        """
+        Run a generator on the worker for its model. Returns a concurrent.futures.Future,
+        which raises JobCancelled if the job was cancelled while running.
+
+        generator       - a (module path, class name) tuple naming an ExplanationGenerator.
+        job             - a positive number identifying the job in progress reports and
+                          cancellations, or 0.
+        """
+        index = self.worker_for(resource_path, model_name)
+        args = (generator, resource_path, model_name, model_input, explanation_name, chi_value,
+                job)
+        try:
+            future = self._executor(index).submit(_run_generator, *args)
+        except BrokenProcessPool:
+            # The worker died (e.g. ran out of memory), so start a new one
+            self._executors[index] = None
+            future = self._executor(index).submit(_run_generator, *args)
+        self._pending[index] += 1
+        future.add_done_callback(lambda future: self._done(index, future))
+        return future
+
+    def cancel(self, job, resource_path, model_name):
+        """
+        Ask the worker running a job to stop it at the next stage its generator reports.
+        """
+        index = self.worker_for(resource_path, model_name)
+        if self._cancelled[index] is not None:
+            self._cancelled[index].value = job
+
+    def worker_for(self, resource_path, model_name):
+        """
+        Get the index of the worker running the explanations of a model.
+        """
+        key = (resource_path, model_name)
+        if key not in self._assignments:
+            # New models go to the worker holding the fewest models, then the least busy
+            models = [0] * self.workers
+            for index in self._assignments.values():
+                models[index] += 1
+            self._assignments[key] = min(range(self.workers),
+                                         key=lambda i: (models[i], self._pending[i]))
+        return self._assignments[key]
+
+    def shutdown(self, wait=True):
+        for executor in self._executors:
+            if executor is not None:
+                executor.shutdown(wait=wait)
+        self._executors = [None] * self.workers
+        if self._progress_thread is not None:
+            self._progress.put(None)
+            self._progress_thread = None
+
+    def _executor(self, index):
+        if self._executors[index] is None:
+            if self._progress_thread is None:
+                if self._progress is None:
+                    self._progress = self._context.Queue()
+                self._progress_thread = threading.Thread(target=self._report_progress,
+                                                         daemon=True)
+                self._progress_thread.start()
+            self._cancelled[index] = self._context.Value("q", 0)
+            # Spawned workers don't inherit the server's state, and TensorFlow isn't fork-safe
+            self._executors[index] = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self.max_models, self.cache_influences, self._progress,
+                          self._cancelled[index]),
+            )
+        return self._executors[index]
+
+    def _done(self, index, future):
+        self._pending[index] -= 1
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._executors[index] = None
+
+    def _report_progress(self):
+        while True:
+            report = self._progress.get()
+            if report is None:
+                return
+            if self.on_progress is not None:
+                self.on_progress(*report)
+
+
+def _init_worker(max_models, cache_influences, progress, cancelled):
+    global _progress, _cancelled
+    from argflow.portal.generator import set_influence_disk_cache, set_model_cache_size
+
+    set_model_cache_size(max_models)
+    set_influence_disk_cache(cache_influences)
+    _progress = progress
+    _cancelled = cancelled
+
+
+def _run_generator(generator, resource_path, model_name, model_input, explanation_name, chi_value,
+                   job=0):
+    from argflow.portal.generator import set_progress_reporter
+
+    def report(stage):
+        if job and _cancelled.value == job:
+            raise JobCancelled(f"Job {job} was cancelled")
+        _progress.put((job, stage))
+
+    set_progress_reporter(report)
+    try:
+        generator = _load_generator(*generator)
+        return generator.generate(resource_path, model_name, model_input, explanation_name,
+                                  chi_value)
+    finally:
+        set_progress_reporter(None)
+
+
+def _load_generator(module_path, class_name):
+    """
+    Get an instance of a generator class, importing its module again only if it changed.
+    """
+    mtime = os.stat(module_path).st_mtime_ns
+    key = (module_path, class_name)
+    if key not in _generators or _generators[key][0] != mtime:
+        spec = importlib.util.spec_from_file_location("generator", module_path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        _generators[key] = (mtime, getattr(mod, class_name)())
+    return _generators[key][1]
@@ -1,10 +1,17 @@
 export default class WSConnection {
   private listeners: Record<string, ((evt: object) => void)[]> = {};
 
+  // Identifies this connection when creating explanations, so the server streams the
+  // progress of their jobs here
+  public clientId: string | null = null;
+
   constructor(private readonly ws: WebSocket) {
     ws.onmessage = (e) => {
       const msg = JSON.parse(e.data);
-      const listeners = this.listeners[msg.type];
+      if (msg.type === "hello") {
+        this.clientId = msg.client;
+      }
+      const listeners = this.listeners[msg.type] || [];
       for (let listener of listeners) {
         listener(msg);
       }
@@ -17,6 +17,7 @@ export default function Model({ ws }) {
   const history = useHistory();
 
   const [isGenerating, setGenerating] = useState(false);
+  const [stage, setStage] = useState(null);
   const [showCreateDialog, setShowCreateDialog] = useState(false);
   const [explanations, setExplanations] = useState([]);
 
@@ -37,15 +38,33 @@ export default function Model({ ws }) {
 
       function onExGenSuccess(e) {
         setGenerating(false);
+        setStage(null);
         history.push(`/models/${modelName}/explanations/${e.name}`);
       }
 
+      function onExGenEnd(e) {
+        setGenerating(false);
+        setStage(null);
+      }
+
+      function onJobProgress(e) {
+        if (e.job.model === modelName && e.job.status === "running") {
+          setStage(e.job.stage);
+        }
+      }
+
       ws.addEventListener("exgen-start", onExGenStart);
       ws.addEventListener("exgen-success", onExGenSuccess);
+      ws.addEventListener("exgen-error", onExGenEnd);
+      ws.addEventListener("exgen-cancelled", onExGenEnd);
+      ws.addEventListener("job-progress", onJobProgress);
 
       return () => {
         ws.removeEventListener("exgen-start", onExGenStart);
         ws.removeEventListener("exgen-success", onExGenSuccess);
+        ws.removeEventListener("exgen-error", onExGenEnd);
+        ws.removeEventListener("exgen-cancelled", onExGenEnd);
+        ws.removeEventListener("job-progress", onJobProgress);
       };
     }
   }, [ws, modelName, history]);
@@ -57,6 +76,7 @@ export default function Model({ ws }) {
         input,
         chi,
         generator,
+        client: ws ? ws.clientId : null,
       }),
     });
   }
@@ -87,6 +107,7 @@ export default function Model({ ws }) {
               <br />
               <Typography variant="subtitle2">
                 Generating explanation...
+                {stage && ` (${stage.replace("_", " ")})`}
               </Typography>
             </>
           ) : (
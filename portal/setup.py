@@ -23,6 +23,7 @@ setuptools.setup(
     package_data={"argflow_ui": package_files("argflow_ui/client") + ["visualisers/js/*.js"]},
     install_requires=[
         "aiofiles>=0.5",
+        "argflow",
         "gunicorn>=20.0",
         "pyaml>=20.4",
         "requests>=2.24",
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from argflow.portal.graphbin import GraphBinBuilder
+
+from argflow_ui.api.utils import load_graph
+from argflow_ui.argumentation_graph import ArgumentationGraph, ContributionType, NodeType
+
+from .test_explanations import EXPLANATIONS
+
+
+def write_binary(explanation, path):
+    builder = GraphBinBuilder(explanation["name"], explanation["input"], explanation["conclusion"])
+    for node_id, node in explanation["nodes"].items():
+        builder.add_node(node_id, node)
+    return builder.write(path)
+
+
+class TestBinaryGraph:
+    def test_matches_json(self, tmp_path):
+        # graph.bin only keeps the contribution type of each child
+        explanation = json.loads(json.dumps(EXPLANATIONS[1]))
+        expected = ArgumentationGraph(explanation)
+        graph = ArgumentationGraph.from_binary(write_binary(explanation, tmp_path / "graph.bin"))
+
+        assert graph.serialize() == expected.serialize()
+        assert dict(graph.predecessors) == expected.predecessors
+        assert graph.query_factors("2") == expected.query_factors("2")
+        assert graph.query_targets("0", ContributionType.ATTACK) == expected.query_targets(
+            "0", ContributionType.ATTACK
+        )
+
+    def test_load_prefers_binary(self, tmp_path):
+        explanation = json.loads(json.dumps(EXPLANATIONS[1]))
+        (tmp_path / "graph.json").write_text(json.dumps(EXPLANATIONS[0]))
+        assert load_graph(tmp_path).name == "Test1"
+
+        write_binary(explanation, tmp_path / "graph.bin")
+        assert load_graph(tmp_path).name == "Test2"
+
+    def test_close(self, tmp_path):
+        explanation = json.loads(json.dumps(EXPLANATIONS[1]))
+        path = write_binary(explanation, tmp_path / "graph.bin")
+        with ArgumentationGraph.from_binary(path) as graph:
+            assert graph.nodes["2"]["node_type"] == NodeType.CONCLUSION
+        with pytest.raises(ValueError):
+            graph.predecessors["2"]
+        # Graphs loaded from graph.json have nothing to close
+        ArgumentationGraph(explanation).close()
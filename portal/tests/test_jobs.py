@@ -0,0 +1,237 @@
+import asyncio
+import textwrap
+import time
+
+from concurrent.futures import Future
+
+import pytest
+
+from starlette.testclient import TestClient
+
+from argflow_ui import ArgflowUI
+from argflow_ui.jobs import JobQueue, JobStatus, QueueFull
+from argflow_ui.workers import GeneratorPool, JobCancelled
+
+GENERATOR = """
+import os
+import time
+
+from argflow.portal import ExplanationGenerator
+
+
+class SlowGenerator(ExplanationGenerator):
+    def generate(self, resource_path, model_name, model_input, explanation_name, chi_value):
+        self.progress("model_loading")
+        while not os.path.exists(model_input):
+            time.sleep(0.05)
+        self.progress("serialisation")
+        return explanation_name
+"""
+
+
+class FakePool:
+    """
+    Runs nothing, leaving the futures of jobs to the tests.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.on_progress = None
+        self.futures = {}
+        self.cancelled = []
+
+    def worker_for(self, resource_path, model_name):
+        return hash(model_name) % self.workers
+
+    def submit(self, generator, resource_path, model_name, model_input, explanation_name,
+               chi_value, job=0):
+        self.futures[explanation_name] = Future()
+        return self.futures[explanation_name]
+
+    def cancel(self, job, resource_path, model_name):
+        self.cancelled.append(job)
+
+
+class BrokenPool(FakePool):
+    """
+    Fails to submit the first job, as when its worker died.
+    """
+
+    def __init__(self, workers=1):
+        super().__init__(workers)
+        self.broken = True
+
+    def submit(self, *args, **kwargs):
+        if self.broken:
+            self.broken = False
+            raise BrokenPipeError("worker died")
+        return super().submit(*args, **kwargs)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def queue(events):
+    async def notify(job, event):
+        events.append((event["type"], job.explanation_name))
+
+    return JobQueue(FakePool(), max_queued=2, notify=notify)
+
+
+class TestJobQueue:
+    def test_dispatch(self, queue, events):
+        async def scenario():
+            a = await queue.submit("default", None, "resources", "m", "[1]", "a", "chi")
+            b = await queue.submit("default", None, "resources", "m", "[1]", "b", "chi")
+            # One job per worker, the other one waits
+            assert (a.status, b.status) == (JobStatus.RUNNING, JobStatus.QUEUED)
+            assert queue.depth == 1
+            assert queue.find("m", "b") is b
+
+            queue.pool.futures["a"].set_result(None)
+            await settle()
+            assert (a.status, b.status) == (JobStatus.SUCCEEDED, JobStatus.RUNNING)
+            assert queue.find("m", "a") is None
+
+            queue.pool.futures["b"].set_exception(ValueError("bad input"))
+            await settle()
+            assert b.status == JobStatus.FAILED
+            assert b.error == "ValueError: bad input"
+
+        run(scenario())
+        assert ("exgen-success", "a") in events
+        assert ("exgen-error", "b") in events
+
+    def test_queue_full(self, queue):
+        async def scenario():
+            for name in ["a", "b", "c"]:
+                await queue.submit("default", None, "resources", "m", "[1]", name, "chi")
+            with pytest.raises(QueueFull):
+                await queue.submit("default", None, "resources", "m", "[1]", "d", "chi")
+
+        run(scenario())
+
+    def test_cancel(self, queue, events):
+        async def scenario():
+            a = await queue.submit("default", None, "resources", "m", "[1]", "a", "chi")
+            b = await queue.submit("default", None, "resources", "m", "[1]", "b", "chi")
+
+            # Queued jobs are dropped at once
+            assert await queue.cancel(b.id)
+            assert b.status == JobStatus.CANCELLED
+            assert queue.depth == 0
+
+            # Running jobs are asked to stop
+            assert await queue.cancel(a.id)
+            assert a.cancel_requested
+            assert queue.pool.cancelled == [a.seq]
+            queue.pool.futures["a"].set_exception(JobCancelled())
+            await settle()
+            assert a.status == JobStatus.CANCELLED
+            assert not await queue.cancel(a.id)
+
+        run(scenario())
+        assert ("exgen-cancelled", "b") in events
+        assert ("exgen-cancelled", "a") in events
+
+    def test_progress(self, queue, events):
+        async def scenario():
+            a = await queue.submit("default", None, "resources", "m", "[1]", "a", "chi")
+            queue.pool.on_progress(a.seq, "influence_mapping")
+            await settle()
+            assert a.stage == "influence_mapping"
+
+        run(scenario())
+
+    def test_submit_fails(self, events):
+        async def notify(job, event):
+            events.append((event["type"], job.explanation_name))
+
+        queue = JobQueue(BrokenPool(), max_queued=2, notify=notify)
+
+        async def scenario():
+            a = await queue.submit("default", None, "resources", "m", "[1]", "a", "chi")
+            assert a.status == JobStatus.FAILED
+            assert a.error == "BrokenPipeError: worker died"
+            # The worker is free for the next job
+            assert queue.running == []
+            b = await queue.submit("default", None, "resources", "m", "[1]", "b", "chi")
+            assert b.status == JobStatus.RUNNING
+
+        run(scenario())
+        assert ("exgen-start", "a") in events
+        assert ("exgen-error", "a") in events
+
+
+class TestJobsAPI:
+    def test_endpoints(self, tmp_path):
+        app = ArgflowUI(resource_path=str(tmp_path))
+        app.jobs = JobQueue(FakePool(), max_queued=1)
+        client = TestClient(app)
+
+        def create(name):
+            body = {"input": "[1]", "chi": "chi", "generator": "default"}
+            return client.post(f"/api/models/m/explanations/{name}", json=body)
+
+        res = create("a")
+        assert res.status_code == 202
+        job = res.json()
+        assert (job["status"], job["explanation"]) == ("running", "a")
+        # Already being generated
+        assert create("a").status_code == 400
+        assert create("b").status_code == 202
+        res = create("c")
+        assert res.status_code == 429
+        assert "retry-after" in res.headers
+
+        queue = client.get("/api/jobs").json()
+        assert (queue["depth"], queue["running"], queue["max_queued"]) == (1, 1, 1)
+        assert client.get(f"/api{job['url']}").json()["id"] == job["id"]
+        assert client.get("/api/jobs/unknown").status_code == 404
+
+        res = client.delete(f"/api{job['url']}")
+        assert res.status_code == 202
+        assert res.json()["cancel_requested"]
+        assert client.delete("/api/jobs/unknown").status_code == 404
+
+
+class TestWorkerCancellation:
+    def test_cancel_running(self, tmp_path):
+        module_path = tmp_path / "generator.py"
+        module_path.write_text(textwrap.dedent(GENERATOR))
+        generator = (str(module_path), "SlowGenerator")
+        flag = tmp_path / "go"
+        stages = []
+        pool = GeneratorPool(workers=1, on_progress=lambda job, stage: stages.append((job, stage)))
+
+        try:
+            assert pool.submit(generator, "resources", "m", str(tmp_path / "."), "e", "chi",
+                               job=1).result(60) == "e"
+
+            future = pool.submit(generator, "resources", "m", str(flag), "e", "chi", job=2)
+            pool.cancel(2, "resources", "m")
+            flag.touch()
+            with pytest.raises(JobCancelled):
+                future.result(60)
+            # Progress reaches the server through a queue, behind the results
+            deadline = time.time() + 10
+            while (1, "serialisation") not in stages and time.time() < deadline:
+                time.sleep(0.05)
+        finally:
+            pool.shutdown()
+
+        assert (1, "model_loading") in stages
+        assert (1, "serialisation") in stages
+        assert (2, "serialisation") not in stages
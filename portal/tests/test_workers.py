@@ -0,0 +1,80 @@
+import os
+import textwrap
+
+import pytest
+
+from argflow_ui.workers import GeneratorPool
+
+GENERATOR = """
+import os
+
+from argflow.portal import ExplanationGenerator
+
+
+class PidGenerator(ExplanationGenerator):
+    def generate(self, resource_path, model_name, model_input, explanation_name, chi_value):
+        return os.getpid(), id(self), model_name, {version}
+
+
+class CacheGenerator(ExplanationGenerator):
+    def generate(self, resource_path, model_name, model_input, explanation_name, chi_value):
+        return self.influence_cache().disk_cache is not None
+"""
+
+
+@pytest.fixture
+def generator(tmp_path):
+    path = tmp_path / "generator.py"
+    path.write_text(textwrap.dedent(GENERATOR.format(version=1)))
+    return str(path), "PidGenerator"
+
+
+@pytest.fixture
+def pool():
+    pool = GeneratorPool(workers=2)
+    yield pool
+    pool.shutdown()
+
+
+class TestGeneratorPool:
+    def test_routing(self, generator, pool):
+        def run(model_name):
+            return pool.submit(generator, "resources", model_name, "[1]", "e", "chi").result(60)
+
+        pid, instance, model_name, _ = run("a")
+        assert model_name == "a"
+        # The same worker and generator instance serve every explanation of a model
+        assert run("a")[:2] == (pid, instance)
+        # Another model goes to the idle worker, which holds no model yet
+        assert run("b")[0] != pid
+        assert run("a")[0] == pid
+
+    def test_reload(self, generator, pool):
+        def run():
+            return pool.submit(generator, "resources", "a", "[1]", "e", "chi").result(60)
+
+        assert run()[3] == 1
+        # A changed generator module is imported again
+        module_path, _ = generator
+        with open(module_path, "w") as f:
+            f.write(textwrap.dedent(GENERATOR.format(version=2)))
+        stat = os.stat(module_path)
+        os.utime(module_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert run()[3] == 2
+
+    def test_errors(self, pool):
+        future = pool.submit(("/does/not/exist.py", "Missing"), "resources", "a", "", "e", "chi")
+        with pytest.raises(FileNotFoundError):
+            future.result(60)
+
+    def test_influence_cache(self, generator):
+        module_path, _ = generator
+        for cache_influences in (False, True):
+            pool = GeneratorPool(workers=1, cache_influences=cache_influences)
+            try:
+                future = pool.submit((module_path, "CacheGenerator"), "resources", "a", "[1]",
+                                     "e", "chi")
+                # Results are only kept on disk when the portal enables it
+                assert future.result(60) == cache_influences
+            finally:
+                pool.shutdown()